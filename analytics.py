@@ -0,0 +1,182 @@
+import logging
+import warnings
+
+logger = logging.getLogger('report_logger')
+
+# Windows of the moving averages of the daily net increase, in days
+MOVING_AVERAGE_WINDOWS = (7, 30)
+# Trailing days of moving averages and months of deltas put in the report
+TREND_DAYS = 365
+TREND_MONTHS = 24
+PERCENTILES = (50, 90, 99)
+WEEKDAY_LABELS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+_numpy = None
+
+
+def load_numpy():
+    """
+    Import NumPy on first use. Returns None if it is not installed: the
+    analytics are optional and the report is generated without them.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        _numpy = numpy
+    return _numpy
+
+
+def is_available():
+    """Return True if NumPy is installed, so usage statistics can be computed."""
+    return load_numpy() is not None
+
+
+def load_history(data):
+    """
+    Return (days, net_increase, total_page_count) arrays of the daily data
+    read by generate_html_report.read_csv_data: days are int64 offsets from
+    1970-01-01, the counts int64.
+    """
+    np = load_numpy()
+    days = np.array([item['date'] for item in data], dtype='datetime64[D]').astype(np.int64)
+    net_increase = np.fromiter((item['net_increase'] for item in data), dtype=np.int64, count=len(data))
+    total_page_count = np.fromiter((item['total_page_count'] for item in data), dtype=np.int64, count=len(data))
+    return days, net_increase, total_page_count
+
+
+def build_usage_matrix(histories):
+    """
+    Lay the histories of a fleet ({printer: data}) out on one calendar.
+    Returns (first_day, matrix): row i holds the daily net increase of the
+    i-th printer as float64, a day without a row counting as 0 pages, and
+    NaN before its first and after its last day.
+    """
+    np = load_numpy()
+    arrays = [load_history(data) for data in histories.values()]
+    spans = [(days.min(), days.max()) for days, _, _ in arrays if len(days)]
+    if not spans:
+        return 0, np.full((len(arrays), 0), np.nan)
+    first_day = min(start for start, _ in spans)
+    last_day = max(end for _, end in spans)
+    matrix = np.full((len(arrays), int(last_day - first_day) + 1), np.nan)
+    for row, (days, net_increase, _) in zip(matrix, arrays):
+        if len(days):
+            row[days.min() - first_day:days.max() - first_day + 1] = 0
+            np.add.at(row, days - first_day, net_increase)
+    return int(first_day), matrix
+
+
+def moving_averages(matrix, window):
+    """
+    Mean daily net increase over the window days ending on each day, per
+    printer, counting only the days within its history (NaN elsewhere).
+    """
+    np = load_numpy()
+    observed = ~np.isnan(matrix)
+    zero = np.zeros((matrix.shape[0], 1))
+    sums = np.hstack([zero, np.cumsum(np.where(observed, matrix, 0), axis=1)])
+    counts = np.hstack([zero, np.cumsum(observed, axis=1)])
+    window_sums = sums[:, 1:] - sums[:, np.maximum(np.arange(1, sums.shape[1]) - window, 0)]
+    window_counts = counts[:, 1:] - counts[:, np.maximum(np.arange(1, counts.shape[1]) - window, 0)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(observed, window_sums / window_counts, np.nan)
+
+
+def weekday_profile(matrix, first_day):
+    """Mean daily net increase per weekday (Monday first), per printer: a (printers, 7) array."""
+    np = load_numpy()
+    # 1970-01-01 was a Thursday
+    weekdays = (np.arange(matrix.shape[1]) + first_day + 3) % 7
+    profile = np.full((matrix.shape[0], 7), np.nan)
+    with warnings.catch_warnings():
+        # nanmean of a row without any day gives NaN, and warns
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for weekday in range(7):
+            columns = matrix[:, weekdays == weekday]
+            if columns.shape[1]:
+                profile[:, weekday] = np.nanmean(columns, axis=1)
+    return profile
+
+
+def monthly_totals(matrix, first_day):
+    """
+    Return (months, totals): the YYYY-MM labels of the calendar and the pages
+    printed per printer in each, NaN for months outside its history.
+    """
+    np = load_numpy()
+    if not matrix.shape[1]:
+        return [], np.full((matrix.shape[0], 0), np.nan)
+    months = (np.arange(matrix.shape[1]) + first_day).astype('datetime64[D]').astype('datetime64[M]')
+    starts = np.flatnonzero(np.concatenate([[True], months[1:] != months[:-1]]))
+    observed = ~np.isnan(matrix)
+    totals = np.add.reduceat(np.where(observed, matrix, 0), starts, axis=1)
+    observed_days = np.add.reduceat(observed, starts, axis=1)
+    totals[observed_days == 0] = np.nan
+    return [str(month) for month in months[starts]], totals
+
+
+def _to_list(values, digits=1):
+    """Round an array for the report, NaN becoming None (null in JSON)."""
+    return [None if value != value else round(float(value), digits) for value in values]
+
+
+def fleet_usage_stats(histories):
+    """
+    Compute the usage statistics of every printer of a fleet at once.
+    histories maps each printer to its daily data (see read_csv_data); the
+    result maps it to a dict of
+      moving_averages: labels (last TREND_DAYS days) and one series per window
+      weekday_profile: labels and the mean daily net increase per weekday
+      percentiles:     p50, p90 and p99 of the daily net increase
+      month_over_month: labels (last TREND_MONTHS months), net_increase,
+                       delta and delta_percent against the previous month
+    Raises RuntimeError if NumPy is not installed.
+    """
+    np = load_numpy()
+    if np is None:
+        raise RuntimeError("Usage statistics need NumPy (pip install numpy)")
+    printers = list(histories)
+    first_day, matrix = build_usage_matrix(histories)
+
+    trend_start = max(0, matrix.shape[1] - TREND_DAYS)
+    trend_labels = [str(day) for day in
+                    (np.arange(trend_start, matrix.shape[1]) + first_day).astype('datetime64[D]')]
+    averages = {window: moving_averages(matrix, window)[:, trend_start:] for window in MOVING_AVERAGE_WINDOWS}
+    profile = weekday_profile(matrix, first_day)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if matrix.shape[1]:
+            percentiles = np.nanpercentile(matrix, PERCENTILES, axis=1)
+        else:
+            percentiles = np.full((len(PERCENTILES), len(printers)), np.nan)
+    months, totals = monthly_totals(matrix, first_day)
+    # One month more than shown, so the first one shown has a delta
+    months, totals = months[-TREND_MONTHS - 1:], totals[:, -TREND_MONTHS - 1:]
+    deltas = np.diff(totals, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta_percent = np.where(totals[:, :-1] > 0, deltas / totals[:, :-1] * 100, np.nan)
+
+    stats = {}
+    for i, printer in enumerate(printers):
+        stats[printer] = {
+            'moving_averages': dict(
+                {'labels': trend_labels},
+                **{f'days_{window}': _to_list(averages[window][i]) for window in MOVING_AVERAGE_WINDOWS}),
+            'weekday_profile': {'labels': list(WEEKDAY_LABELS), 'mean': _to_list(profile[i])},
+            'percentiles': dict(zip((f'p{p}' for p in PERCENTILES), _to_list(percentiles[:, i]))),
+            'month_over_month': {
+                'labels': months[1:],
+                'net_increase': _to_list(totals[i, 1:], 0),
+                'delta': _to_list(deltas[i], 0),
+                'delta_percent': _to_list(delta_percent[i]),
+            },
+        }
+    return stats
+
+
+def usage_stats(data):
+    """Return the usage statistics of one printer, see fleet_usage_stats."""
+    return fleet_usage_stats({None: data})[None]
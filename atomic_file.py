@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+
+
+def write_file_atomically(path, write, mode='w', newline=None, fsync=False):
+    """
+    Call write(file) on a temporary file next to path, which then replaces
+    path, so readers see either the old or the new file, never half of one
+    (and a crash leaves no partial file). The directory is created if needed.
+    The new file keeps the permissions of the one it replaces, 0o644 if
+    there is none. With fsync set the data is on disk before the rename.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    suffix = os.path.splitext(path)[1] + '.tmp'
+    fd, temp_file = tempfile.mkstemp(dir=directory, prefix='.', suffix=suffix)
+    try:
+        with os.fdopen(fd, mode, newline=newline) as f:
+            write(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_file)
+        else:
+            os.chmod(temp_file, 0o644)
+        os.replace(temp_file, path)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
@@ -0,0 +1,56 @@
+"""
+Analytics benchmark: times analytics.fleet_usage_stats on synthetic fleets,
+the whole fleet in one batch and one printer at a time.
+
+    python benchmarks/bench_analytics.py --printers 300 --days 1825
+"""
+import argparse
+import random
+from datetime import date, timedelta
+
+from common import summarize, time_call, write_results
+
+import analytics
+
+
+def make_fleet(printers, days):
+    """Return {printer: data} of printers daily histories ending today, with a missing day now and then."""
+    start = date.today() - timedelta(days=days)
+    fleet = {}
+    for i in range(printers):
+        total = 0
+        data = []
+        for offset in range(days):
+            if random.random() < 0.02:
+                continue
+            net = random.randint(0, 200)
+            total += net
+            data.append({'date': (start + timedelta(days=offset)).isoformat(),
+                         'total_page_count': total, 'net_increase': net})
+        fleet[f'printer-{i}'] = data
+    return fleet
+
+
+def per_printer(fleet):
+    return {printer: analytics.usage_stats(data) for printer, data in fleet.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the usage statistics of a fleet.")
+    parser.add_argument('--printers', type=int, default=300, help="printers in the fleet")
+    parser.add_argument('--days', type=int, default=5 * 365, help="days of history per printer")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement")
+    parser.add_argument('--output', help="JSON results file (default: results/<commit>-analytics.json)")
+    args = parser.parse_args()
+
+    if not analytics.is_available():
+        parser.exit(1, "NumPy is not installed\n")
+    fleet = make_fleet(args.printers, args.days)
+    results = {}
+    samples, _ = time_call(analytics.fleet_usage_stats, fleet, repeat=args.repeat)
+    results['fleet_usage_stats'] = summarize(samples)
+    samples, _ = time_call(per_printer, fleet, repeat=args.repeat)
+    results['usage_stats_per_printer'] = summarize(samples)
+    for name, result in results.items():
+        print(f"{name}: median {result['median_ms']} ms")
+    print(f"Results written to {write_results('analytics', vars(args), results, args.output)}")
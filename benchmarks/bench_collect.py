@@ -0,0 +1,251 @@
+"""
+Collection benchmark: polls a fleet of simulated printers (see snmp_agent.py)
+through printer.poll_fleet and reports sweep throughput and the latency of
+each page count query. With --workers the fleet is split across worker
+processes as coordinator.py does. With --fake the printers are simulated in
+memory by transport.FakeTransport instead, so the collector runs without
+pysnmp or sockets.
+
+    python benchmarks/bench_collect.py --printers 500 --latency 0.02 --loss 0.01
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common import summarize, write_results
+import snmp_agent
+
+import coordinator
+import printer
+from storage import CsvStorage, PartitionedCsvStorage, SqliteStorage
+from transport import FakeTransport
+
+
+def make_printers(count, port, directory, timeout, collect_tables, dead=0, backend='csv'):
+    """
+    Return printer entries like printer.load_printers does, with one CSV file
+    each, monthly CSV files each or one shared SQLite database.
+    The last dead printers use a community the agent ignores, so they never answer.
+    """
+    def make_storage(name):
+        if backend == 'sqlite':
+            return SqliteStorage(f'{directory}/printers.db', name)
+        if backend == 'partitioned':
+            return PartitionedCsvStorage(directory, name)
+        return CsvStorage(f'{directory}/{name}.csv')
+
+    return [{
+        'name': f'printer-{i}',
+        'ip_address': '127.0.0.1',
+        'port': port,
+        'community_string': snmp_agent.community_for(i) if i < count - dead else f'dead-{i}',
+        'timeout': timeout,
+        'collect_tables': collect_tables,
+        'storage': make_storage(f'printer-{i}'),
+    } for i in range(count)]
+
+
+def growing_counter(start, growth):
+    """Return a function giving a page count that grows by up to growth pages per call."""
+    count = start
+
+    def next_count():
+        nonlocal count
+        count += random.randint(0, growth)
+        return count
+    return next_count
+
+
+def make_fake_transport(printers, latency, loss, growth):
+    """
+    Give every printer its own address on a FakeTransport answering like
+    snmp_agent.py; dead printers are not registered, so they time out.
+    """
+    transport = FakeTransport(wait_on_timeout=True)
+    for i, entry in enumerate(printers):
+        entry['ip_address'] = f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+        if entry['community_string'].startswith('dead-'):
+            continue
+        values = {
+            printer.SYS_DESCR_OID: f'Simulated printer {i}',
+            snmp_agent.SYS_UPTIME_OID: 0,
+            snmp_agent.MARKER_LIFE_COUNT_OID: growing_counter(random.randint(1000, 100000), growth),
+            snmp_agent.MARKER_POWER_ON_COUNT_OID: 0,
+        }
+        for supply in range(1, snmp_agent.SUPPLY_COUNT + 1):
+            values[f'{snmp_agent.SUPPLY_MAX_CAPACITY_OID}.{supply}'] = 100
+            values[f'{snmp_agent.SUPPLY_LEVEL_OID}.{supply}'] = (i * 7 + supply * 13) % 100
+        transport.add_printer(entry['ip_address'], values, port=entry['port'], latency=latency, loss=loss)
+    return transport
+
+
+def run_with_fake_transport(args):
+    """Poll printers simulated by a FakeTransport, see make_fake_transport."""
+    with tempfile.TemporaryDirectory() as directory:
+        printers = make_printers(args.printers, 161, directory, args.timeout, args.collect_tables,
+                                 args.dead, args.backend)
+        printer.TRANSPORT = make_fake_transport(printers, args.latency, args.loss, args.growth)
+        try:
+            if args.workers > 1:
+                return run_sharded_sweeps(printers, args.sweeps, args.warmup, args.max_in_flight, args.workers)
+            return asyncio.run(run_sweeps(printers, args.sweeps, args.warmup, args.max_in_flight))
+        finally:
+            printer.TRANSPORT = None
+
+
+def add_disk_latency(seconds):
+    """
+    Make every page count write of both storages sleep for seconds first, as
+    on a slow or network disk. Batched writes pay it once per batch.
+    """
+    def slowed(write):
+        def wrapper(*args, **kwargs):
+            time.sleep(seconds)
+            return write(*args, **kwargs)
+        return wrapper
+
+    for storage_class in (CsvStorage, SqliteStorage):
+        for name in ('write', 'write_many'):
+            if hasattr(storage_class, name):
+                setattr(storage_class, name, slowed(getattr(storage_class, name)))
+
+
+def timed(function, samples):
+    """Wrap the coroutine function so the duration of each call is appended to samples."""
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+async def run_sweeps(printers, sweeps, warmup, max_in_flight):
+    """
+    Poll the fleet warmup + sweeps times on one event loop and return the
+    results of the measured sweeps.
+    """
+    latencies = []
+    query = printer.get_printer_page_count
+    printer.get_printer_page_count = timed(query, latencies)
+    sweep_times = []
+    failures = 0
+    try:
+        for sweep in range(warmup + sweeps):
+            if sweep == warmup:
+                latencies.clear()
+            start = time.perf_counter()
+            page_counts = await printer.poll_fleet(printers, max_in_flight)
+            elapsed = time.perf_counter() - start
+            if sweep >= warmup:
+                sweep_times.append(elapsed)
+                failures += sum(1 for page_count in page_counts.values() if page_count is None)
+    finally:
+        printer.get_printer_page_count = query
+        printer.close_snmp_engine()
+    # The warm-up sweeps pay for importing pysnmp and creating the engine
+    return {
+        'sweep': summarize(sweep_times),
+        'printers_per_second': round(len(printers) * len(sweep_times) / sum(sweep_times), 1),
+        'query_latency': summarize(latencies),
+        'failed_queries': failures,
+    }
+
+
+def run_sharded_sweeps(printers, sweeps, warmup, max_in_flight, workers):
+    """
+    Poll the fleet warmup + sweeps times as coordinator.collect does, one shard
+    per worker process. The pool is kept across sweeps, so the warm-up sweeps
+    pay for starting the workers and importing pysnmp in each of them.
+    """
+    shards = [shard for shard in coordinator.split_fleet(
+        printers, [f'worker-{i}' for i in range(workers)]).values() if shard]
+    sweep_times = []
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=coordinator.init_worker,
+                             initargs=(None,)) as pool:
+        for sweep in range(warmup + sweeps):
+            start = time.perf_counter()
+            page_counts = {}
+            for shard_page_counts, _ in pool.map(coordinator.poll_shard, shards,
+                                                 [max_in_flight] * len(shards)):
+                page_counts.update(shard_page_counts)
+            elapsed = time.perf_counter() - start
+            if sweep >= warmup:
+                sweep_times.append(elapsed)
+                failures += sum(1 for page_count in page_counts.values() if page_count is None)
+    return {
+        'sweep': summarize(sweep_times),
+        'printers_per_second': round(len(printers) * len(sweep_times) / sum(sweep_times), 1),
+        'query_latency': None,
+        'failed_queries': failures,
+    }
+
+
+def run(args):
+    if args.fake:
+        return run_with_fake_transport(args)
+    ready = multiprocessing.Queue()
+    agent = multiprocessing.Process(
+        target=snmp_agent.serve, daemon=True,
+        args=(args.printers, 0, args.latency, args.jitter, args.loss, args.growth, ready))
+    agent.start()
+    try:
+        port = ready.get(timeout=30)
+        with tempfile.TemporaryDirectory() as directory:
+            printers = make_printers(args.printers, port, directory, args.timeout, args.collect_tables,
+                                     args.dead, args.backend)
+            if args.workers > 1:
+                return run_sharded_sweeps(printers, args.sweeps, args.warmup, args.max_in_flight, args.workers)
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(
+                    run_sweeps(printers, args.sweeps, args.warmup, args.max_in_flight))
+            finally:
+                loop.close()
+    finally:
+        agent.terminate()
+        agent.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure fleet polling against simulated printers.")
+    parser.add_argument('--printers', type=int, default=200, help="number of simulated printers")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds before each agent response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds per response")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of requests the agent drops")
+    parser.add_argument('--dead', type=int, default=0, help="printers that never answer")
+    parser.add_argument('--growth', type=int, default=10, help="most pages added per page count query")
+    parser.add_argument('--timeout', type=float, default=1, help="SNMP timeout per request in seconds")
+    parser.add_argument('--max-in-flight', type=int, default=50, help="printers queried at the same time")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes sharing the fleet, as with coordinator.py")
+    parser.add_argument('--fake', action='store_true',
+                        help="simulate the printers in memory instead of over UDP (--jitter is ignored)")
+    parser.add_argument('--backend', choices=('csv', 'partitioned', 'sqlite'), default='csv', help="page count storage")
+    parser.add_argument('--disk-latency', type=float, default=0.0,
+                        help="seconds added to every storage write, to simulate a slow disk")
+    parser.add_argument('--collect-tables', action='store_true', help="also walk the Printer-MIB tables")
+    parser.add_argument('--sweeps', type=int, default=3, help="measured sweeps")
+    parser.add_argument('--warmup', type=int, default=1, help="sweeps run before measuring")
+    parser.add_argument('--output', help="JSON results file (default: results/<commit>-collect.json)")
+    args = parser.parse_args()
+
+    # Log records are still created, as in production, but not printed
+    logging.getLogger('report_logger').addHandler(logging.NullHandler())
+    if args.disk_latency:
+        add_disk_latency(args.disk_latency)
+
+    results = run(args)
+    latency = results['query_latency']
+    print(f"{args.printers} printers: {results['printers_per_second']} printers/s, "
+          f"sweep median {results['sweep']['median_ms']} ms, "
+          + (f"query p50 {latency['p50_ms']} ms, p99 {latency['p99_ms']} ms, " if latency else "")
+          + f"{results['failed_queries']} failed queries")
+    print(f"Results written to {write_results('collect', vars(args), results, args.output)}")
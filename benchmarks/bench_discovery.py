@@ -0,0 +1,67 @@
+"""
+Discovery benchmark: sweeps a network of 127.0.0.0/8 with discovery.sweep.
+One simulated printer (see snmp_agent.py) listens on every loopback address,
+and drops the requests of a share of them so those addresses stay silent, as
+most addresses of a real network do.
+
+    python benchmarks/bench_discovery.py --network 127.1.0.0/20 --answering 0.05
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+
+from common import write_results
+import snmp_agent
+
+import discovery
+
+
+def run(args):
+    ready = multiprocessing.Queue()
+    agent = multiprocessing.Process(
+        target=snmp_agent.serve, daemon=True,
+        args=(1, 0, args.latency, 0.0, 1 - args.answering, 10, ready, '0.0.0.0'))
+    agent.start()
+    try:
+        port = ready.get(timeout=30)
+        loop = asyncio.new_event_loop()
+        try:
+            start = time.perf_counter()
+            printers = loop.run_until_complete(discovery.sweep(
+                [args.network], [snmp_agent.community_for(0)], port=port, timeout=args.timeout,
+                retries=args.retries, max_in_flight=args.max_in_flight, rate=args.rate))
+            elapsed = time.perf_counter() - start
+        finally:
+            loop.close()
+    finally:
+        agent.terminate()
+        agent.join()
+    addresses = sum(1 for _ in discovery.iter_addresses([args.network]))
+    return {
+        'addresses': addresses,
+        'printers_found': len(printers),
+        'sweep_seconds': round(elapsed, 3),
+        'addresses_per_second': round(addresses / elapsed, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure a discovery sweep of a simulated network.")
+    parser.add_argument('--network', default='127.1.0.0/20', help="network of 127.0.0.0/8 to sweep")
+    parser.add_argument('--answering', type=float, default=0.05, help="share of the addresses that answer")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds before each agent response")
+    parser.add_argument('--timeout', type=float, default=1, help="seconds to wait for an address")
+    parser.add_argument('--retries', type=int, default=0, help="attempts after a timeout")
+    parser.add_argument('--max-in-flight', type=int, default=1000, help="addresses waiting for an answer")
+    parser.add_argument('--rate', type=float, default=None, help="requests per second (default: no limit)")
+    parser.add_argument('--output', help="JSON results file (default: results/<commit>-discovery.json)")
+    args = parser.parse_args()
+
+    logging.getLogger('report_logger').addHandler(logging.NullHandler())
+
+    results = run(args)
+    print(f"{results['addresses']} addresses in {results['sweep_seconds']} s "
+          f"({results['addresses_per_second']} addresses/s), {results['printers_found']} printers found")
+    print(f"Results written to {write_results('discovery', vars(args), results, args.output)}")
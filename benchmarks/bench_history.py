@@ -0,0 +1,146 @@
+"""
+History benchmark: times fill_missing_dates, read_csv_data,
+generate_html_table and read_report_data on synthetic page count histories
+of growing size.
+
+    python benchmarks/bench_history.py --sizes 1000 10000 100000 1000000 10000000
+
+Histories span at most MAX_DAYS days, so the larger ones hold several
+samples per day, as the collector does in daemon mode. One day in
+GAP_EVERY is left out for the full repair to fill, and the history ends
+TRAILING_GAP days before today for the incremental fill.
+"""
+import argparse
+import csv
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+from common import summarize, time_call, write_results
+
+import history
+import printer
+import generate_html_report
+from storage import CsvStorage, PartitionedCsvStorage, migrate_csv_to_partitions
+
+MAX_DAYS = 50 * 365
+GAP_EVERY = 97
+TRAILING_GAP = 30
+
+
+def make_history(csv_file, rows):
+    """Write a synthetic history of rows rows to csv_file. Returns the number of days it spans."""
+    per_day = -(-rows // min(rows, MAX_DAYS))
+    days = -(-rows // per_day)
+    dates = []
+    day = datetime.now() - timedelta(days=TRAILING_GAP)
+    while len(dates) < days:
+        if day.toordinal() % GAP_EVERY:
+            dates.append(day.strftime('%Y-%m-%d'))
+        day -= timedelta(days=1)
+    dates.reverse()
+
+    total = 0
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for row in range(rows):
+            net = row % 50
+            total += net
+            writer.writerow([dates[row // per_day], total, net])
+    return days
+
+
+def bench_size(directory, rows, repeat):
+    """Return the timings of every operation on a history of rows rows."""
+    source = os.path.join(directory, f'history-{rows}.csv')
+    work = os.path.join(directory, 'work.csv')
+    days = make_history(source, rows)
+
+    def fresh_copy():
+        shutil.copyfile(source, work)
+        history._date_indexes.clear()
+
+    def cold_index():
+        history._date_indexes.clear()
+
+    storage = CsvStorage(work)
+    results = {'rows': rows, 'days': days, 'bytes': os.path.getsize(source)}
+
+    samples, _ = time_call(printer.fill_missing_dates, storage, repeat=repeat, setup=fresh_copy)
+    results['fill_missing_dates'] = summarize(samples)
+    samples, _ = time_call(printer.fill_missing_dates, storage, full=True, repeat=repeat, setup=fresh_copy)
+    results['fill_missing_dates_full'] = summarize(samples)
+
+    fresh_copy()
+    samples, data = time_call(generate_html_report.read_csv_data, storage=storage, repeat=repeat)
+    results['read_csv_data'] = summarize(samples)
+    last_month = (datetime.now() - timedelta(days=TRAILING_GAP + 30)).strftime('%Y-%m-%d')
+    samples, _ = time_call(generate_html_report.read_csv_data, start_date=last_month, storage=storage,
+                           repeat=repeat, setup=cold_index)
+    results['read_csv_data_last_month_cold'] = summarize(samples)
+    samples, _ = time_call(generate_html_report.read_csv_data, start_date=last_month, storage=storage,
+                           repeat=repeat)
+    results['read_csv_data_last_month_warm'] = summarize(samples)
+
+    samples, _ = time_call(generate_html_report.generate_html_table, data, repeat=repeat)
+    results['generate_html_table'] = summarize(samples)
+
+    # Report data through the checkpoint: read whole, then after one poll appended a row
+    checkpoint_file = generate_html_report.checkpoint_file_path(work)
+
+    def no_checkpoint():
+        if os.path.exists(checkpoint_file):
+            os.unlink(checkpoint_file)
+
+    def append_row():
+        generate_html_report.read_report_data(storage)
+        total, date = storage.latest()
+        storage.write(date, total + 1, 1)
+
+    samples, _ = time_call(generate_html_report.read_report_data, storage, repeat=repeat, setup=no_checkpoint)
+    results['read_report_data_full'] = summarize(samples)
+    samples, _ = time_call(generate_html_report.read_report_data, storage, repeat=repeat, setup=append_row)
+    results['read_report_data_appended'] = summarize(samples)
+    no_checkpoint()
+
+    # The same history in monthly files: gap repair and a last-month read
+    partition_dir = os.path.join(directory, 'partitions')
+    partitioned = PartitionedCsvStorage(partition_dir, 'bench')
+
+    def fresh_partitions():
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        migrate_csv_to_partitions(source, partition_dir, 'bench')
+        history._date_indexes.clear()
+
+    samples, _ = time_call(printer.fill_missing_dates, partitioned, full=True, repeat=repeat,
+                           setup=fresh_partitions)
+    results['fill_missing_dates_full_partitioned'] = summarize(samples)
+    samples, _ = time_call(partitioned.read_range, start_date=last_month, repeat=repeat, setup=cold_index)
+    results['read_range_last_month_partitioned_cold'] = summarize(samples)
+    shutil.rmtree(partition_dir)
+    os.unlink(source)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure history maintenance and reporting on synthetic data.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help="history sizes in rows")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per operation")
+    parser.add_argument('--output', help="JSON results file (default: results/<commit>-history.json)")
+    args = parser.parse_args()
+
+    # Log records are still created, as in production, but not printed
+    logging.getLogger('report_logger').addHandler(logging.NullHandler())
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.sizes:
+            result = bench_size(directory, rows, args.repeat)
+            results.append(result)
+            print(f"{rows} rows: " + ', '.join(
+                f"{name} {timing['median_ms']} ms" for name, timing in result.items()
+                if isinstance(timing, dict)))
+    print(f"Results written to {write_results('history', vars(args), results, args.output)}")
@@ -0,0 +1,48 @@
+"""
+Startup-time benchmark: how long `import printer` and
+`import generate_html_report` take in a fresh interpreter.
+
+    python benchmarks/bench_startup.py [--runs 20] [--output results.json]
+"""
+import argparse
+import subprocess
+import sys
+
+from common import REPO_DIR, summarize, write_results
+
+MODULES = ('printer', 'generate_html_report')
+
+# Run in a child process so each sample pays the full import cost
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module, runs):
+    """Return the import time of module in seconds for each of runs fresh interpreters."""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET.format(module=module)],
+            cwd=REPO_DIR, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def run(runs):
+    """Return the import time summary of every module."""
+    return {module: summarize(time_import(module, runs)) for module in MODULES}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import time of the collector and report modules.")
+    parser.add_argument('--runs', type=int, default=20, help="fresh interpreters per module")
+    parser.add_argument('--output', help="JSON results file (default: results/<commit>-startup.json)")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    for module, result in results.items():
+        print(f"import {module}: median {result['median_ms']} ms, min {result['min_ms']} ms")
+    print(f"Results written to {write_results('startup', vars(args), results, args.output)}")
@@ -0,0 +1,98 @@
+"""
+Helpers shared by the benchmarks: timing, percentiles and the JSON results
+files compared by compare.py.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+# Make the scripts importable when a benchmark is run as `python benchmarks/<name>.py`
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+def git_commit():
+    """Return (short commit hash, True if the working tree has changes), or ('unknown', False)."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, bool(status)
+
+
+def percentile(samples, p):
+    """Return the p-th percentile (0-100) of samples, interpolating between the nearest ranks."""
+    samples = sorted(samples)
+    if not samples:
+        return None
+    rank = (len(samples) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(samples) - 1)
+    return samples[low] + (samples[high] - samples[low]) * (rank - low)
+
+
+def summarize(samples):
+    """Return min/median/p50/p99/max of a list of seconds, in milliseconds."""
+    return {
+        'count': len(samples),
+        'min_ms': round(min(samples) * 1000, 3),
+        'median_ms': round(statistics.median(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def time_call(function, *args, repeat=3, setup=None, **kwargs):
+    """
+    Call function repeat times and return (seconds of each call, last result).
+    setup, if given, is called before each call and is not timed.
+    """
+    samples = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def write_results(name, parameters, results, output=None):
+    """
+    Write the results of benchmark name as JSON, to output or to
+    results/<commit>-<name>.json, together with the commit and the machine
+    they were measured on. Returns the path written.
+    """
+    commit, dirty = git_commit()
+    document = {
+        'benchmark': name,
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'results': results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}-{name}.json")
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    return output
@@ -0,0 +1,65 @@
+"""
+Compare two results files of the same benchmark, e.g. from two commits:
+
+    python benchmarks/compare.py results/a25858f-history.json results/HEAD-history.json
+
+Prints every median and p99 timing side by side and exits with status 1 if
+one got slower by more than --threshold.
+"""
+import argparse
+import json
+import sys
+
+# Timings compared; the other values are context
+COMPARED = ('median_ms', 'p99_ms')
+
+
+def flatten(value, prefix=''):
+    """Yield (dotted key, number) for the numeric leaves of a results document."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f'{prefix}.{key}' if prefix else key)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            # History results are a list with one entry per size
+            label = f"{item['rows']} rows" if isinstance(item, dict) and 'rows' in item else str(i)
+            yield from flatten(item, f'{prefix}[{label}]')
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare(old, new, threshold):
+    """Print the compared timings and return the keys that regressed."""
+    old_values = dict(flatten(old['results']))
+    new_values = dict(flatten(new['results']))
+    print(f"{old['benchmark']}: {old['commit']} -> {new['commit']}")
+    regressions = []
+    for key, new_value in new_values.items():
+        if not key.endswith(COMPARED) or key not in old_values:
+            continue
+        old_value = old_values[key]
+        ratio = new_value / old_value if old_value else float('inf')
+        marker = ''
+        if ratio > threshold:
+            marker = '  REGRESSION'
+            regressions.append(key)
+        print(f"  {key}: {old_value} -> {new_value} ms ({ratio:.2f}x){marker}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark results files.")
+    parser.add_argument('old', help="results file of the baseline")
+    parser.add_argument('new', help="results file to check")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="slowdown ratio reported as a regression (default 1.2)")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if old['benchmark'] != new['benchmark']:
+        sys.exit(f"Cannot compare {old['benchmark']} results with {new['benchmark']} results")
+    if compare(old, new, args.threshold):
+        sys.exit(1)
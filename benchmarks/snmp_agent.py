@@ -0,0 +1,205 @@
+"""
+Local stand-in for a fleet of SNMP printers, used by the collection benchmark.
+
+One UDP socket on localhost answers for N simulated printers. Each printer is
+addressed by its community string (`printer-<n>`) and answers SNMPv2c GET and
+GETBULK requests for sysDescr, sysObjectID, sysUpTime, sysName, the Host
+Resources device type and the Printer-MIB marker and supply tables. Every GET of the marker life count advances that printer's counter,
+and responses can be delayed or dropped to mimic a slow or lossy network.
+
+    python benchmarks/snmp_agent.py --printers 500 --latency 0.02 --loss 0.01
+"""
+import argparse
+import asyncio
+import bisect
+import random
+import time
+
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api
+from pysnmp.proto.rfc1902 import Integer, ObjectIdentifier, ObjectName, OctetString, TimeTicks
+from pysnmp.proto.rfc1905 import EndOfMibView, NoSuchObject
+
+SYS_DESCR_OID = '1.3.6.1.2.1.1.1.0'
+SYS_OBJECT_ID_OID = '1.3.6.1.2.1.1.2.0'
+SYS_UPTIME_OID = '1.3.6.1.2.1.1.3.0'
+SYS_NAME_OID = '1.3.6.1.2.1.1.5.0'
+HR_DEVICE_TYPE_OID = '1.3.6.1.2.1.25.3.2.1.2.1'
+MARKER_LIFE_COUNT_OID = '1.3.6.1.2.1.43.10.2.1.4.1.1'
+MARKER_POWER_ON_COUNT_OID = '1.3.6.1.2.1.43.10.2.1.5.1.1'
+SUPPLY_MAX_CAPACITY_OID = '1.3.6.1.2.1.43.11.1.1.8.1'
+SUPPLY_LEVEL_OID = '1.3.6.1.2.1.43.11.1.1.9.1'
+
+# Supplies (black, cyan, magenta, yellow) of every simulated printer
+SUPPLY_COUNT = 4
+
+
+def community_for(index):
+    """Return the community string that addresses simulated printer index."""
+    return f'printer-{index}'
+
+
+class SimulatedPrinter:
+    """
+    MIB of one simulated printer. The marker life count grows by a random
+    amount between 0 and growth pages on every GET of it.
+    """
+
+    def __init__(self, index, growth, start_time):
+        self.index = index
+        self.growth = growth
+        self.start_time = start_time
+        self.page_count = random.randint(1000, 100000)
+
+    def values(self):
+        """Return {oid tuple: value} of every object of the printer."""
+        values = {
+            SYS_DESCR_OID: OctetString(f'Simulated printer {self.index}'),
+            # An enterprise OID under the documentation prefix of RFC 5612
+            SYS_OBJECT_ID_OID: ObjectIdentifier('1.3.6.1.4.1.32473.1'),
+            SYS_UPTIME_OID: TimeTicks(int((time.monotonic() - self.start_time) * 100)),
+            SYS_NAME_OID: OctetString(f'printer-{self.index}'),
+            # hrDevicePrinter
+            HR_DEVICE_TYPE_OID: ObjectIdentifier('1.3.6.1.2.1.25.3.1.5'),
+            MARKER_LIFE_COUNT_OID: Integer(self.page_count),
+            MARKER_POWER_ON_COUNT_OID: Integer(self.page_count % 5000),
+        }
+        for supply in range(1, SUPPLY_COUNT + 1):
+            values[f'{SUPPLY_MAX_CAPACITY_OID}.{supply}'] = Integer(100)
+            values[f'{SUPPLY_LEVEL_OID}.{supply}'] = Integer((self.index * 7 + supply * 13) % 100)
+        return {ObjectName(oid).asTuple(): value for oid, value in values.items()}
+
+    def get(self, oid):
+        if oid == ObjectName(MARKER_LIFE_COUNT_OID).asTuple():
+            self.page_count += random.randint(0, self.growth)
+        return self.values().get(oid, NoSuchObject(''))
+
+    def get_next(self, oid):
+        """Return (oid, value) of the object following oid, or EndOfMibView."""
+        values = self.values()
+        oids = sorted(values)
+        i = bisect.bisect_right(oids, oid)
+        if i == len(oids):
+            return oid, EndOfMibView('')
+        return oids[i], values[oids[i]]
+
+
+class AgentProtocol(asyncio.DatagramProtocol):
+    """Decodes requests, looks up the printer by community and sends the response."""
+
+    def __init__(self, printers, latency=0.0, jitter=0.0, loss=0.0):
+        self.printers = printers
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.transport = None
+        self.requests = 0
+        self.dropped = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests += 1
+        if self.loss and random.random() < self.loss:
+            self.dropped += 1
+            return
+        response = self.respond(data)
+        if response is None:
+            return
+        delay = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            asyncio.get_event_loop().call_later(delay, self.transport.sendto, response, addr)
+        else:
+            self.transport.sendto(response, addr)
+
+    def respond(self, data):
+        try:
+            version = int(api.decodeMessageVersion(data))
+            p_mod = api.protoModules[version]
+            request, _ = decoder.decode(data, asn1Spec=p_mod.Message())
+        except Exception:
+            return None
+        community = str(p_mod.apiMessage.getCommunity(request))
+        printer = self.printers.get(community)
+        if printer is None:
+            # Wrong community: real agents stay silent
+            return None
+
+        request_pdu = p_mod.apiMessage.getPDU(request)
+        response = p_mod.apiMessage.getResponse(request)
+        response_pdu = p_mod.apiMessage.getPDU(response)
+        var_binds = [(oid.asTuple(), value) for oid, value in p_mod.apiPDU.getVarBinds(request_pdu)]
+
+        if request_pdu.isSameTypeWith(p_mod.GetRequestPDU()):
+            result = [(oid, printer.get(oid)) for oid, _ in var_binds]
+        elif request_pdu.isSameTypeWith(p_mod.GetNextRequestPDU()):
+            result = [printer.get_next(oid) for oid, _ in var_binds]
+        elif version == api.protoVersion2c and request_pdu.isSameTypeWith(p_mod.GetBulkRequestPDU()):
+            result = self.get_bulk(printer, p_mod, request_pdu, var_binds)
+        else:
+            p_mod.apiPDU.setErrorStatus(response_pdu, 5)  # genErr
+            result = var_binds
+        p_mod.apiPDU.setVarBinds(response_pdu, result)
+        return encoder.encode(response)
+
+    @staticmethod
+    def get_bulk(printer, p_mod, request_pdu, var_binds):
+        non_repeaters = int(p_mod.apiBulkPDU.getNonRepeaters(request_pdu))
+        max_repetitions = int(p_mod.apiBulkPDU.getMaxRepetitions(request_pdu))
+        result = [printer.get_next(oid) for oid, _ in var_binds[:non_repeaters]]
+        next_oids = [oid for oid, _ in var_binds[non_repeaters:]]
+        for _ in range(max_repetitions):
+            row = [printer.get_next(oid) for oid in next_oids]
+            result.extend(row)
+            next_oids = [oid for oid, _ in row]
+            if all(isinstance(value, EndOfMibView) for _, value in row):
+                break
+        return result
+
+
+async def start_agent(printer_count, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                      loss=0.0, growth=10):
+    """
+    Start answering for printer_count simulated printers on the running loop.
+    Returns (transport, protocol); the bound port is
+    transport.get_extra_info('sockname')[1].
+    """
+    start_time = time.monotonic()
+    printers = {community_for(i): SimulatedPrinter(i, growth, start_time) for i in range(printer_count)}
+    loop = asyncio.get_event_loop()
+    return await loop.create_datagram_endpoint(
+        lambda: AgentProtocol(printers, latency, jitter, loss), local_addr=(host, port))
+
+
+def serve(printer_count, port, latency=0.0, jitter=0.0, loss=0.0, growth=10, ready=None, host='127.0.0.1'):
+    """
+    Run the agent until the process is stopped. If ready is given (a
+    multiprocessing queue), the bound port is put on it once listening.
+    Bound to 0.0.0.0, it answers on every address of 127.0.0.0/8.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    transport, _ = loop.run_until_complete(
+        start_agent(printer_count, host=host, port=port, latency=latency, jitter=jitter, loss=loss,
+                    growth=growth))
+    if ready is not None:
+        ready.put(transport.get_extra_info('sockname')[1])
+    try:
+        loop.run_forever()
+    finally:
+        transport.close()
+        loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer SNMP requests for a fleet of simulated printers.")
+    parser.add_argument('--printers', type=int, default=100, help="number of simulated printers")
+    parser.add_argument('--port', type=int, default=1161, help="UDP port on 127.0.0.1")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before each response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds per response")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of requests left unanswered")
+    parser.add_argument('--growth', type=int, default=10, help="most pages added per page count query")
+    args = parser.parse_args()
+    print(f"Simulating {args.printers} printers on 127.0.0.1:{args.port} (community printer-<n>)")
+    serve(args.printers, args.port, args.latency, args.jitter, args.loss, args.growth)
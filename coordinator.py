@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metrics
+import printer
+import storage as storage_module
+from atomic_file import write_file_atomically
+from resilience import configure_circuit_breaker
+from settings import load_config, script_dir, setup_logging
+
+logger = logging.getLogger('report_logger')
+
+# Points of each shard on the hash ring: enough for shards to get within a
+# few percent of an even share of a large fleet
+RING_REPLICAS = 100
+RESULTS_VERSION = 1
+
+
+def ring_hash(key):
+    """Return the 64-bit position of key on the hash ring."""
+    return int.from_bytes(hashlib.md5(str(key).encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of printers onto shards. Each shard owns `replicas`
+    points of a ring of 64-bit hashes, and a printer belongs to the shard of
+    the first point after the hash of its name. Adding or removing a shard
+    only moves the printers of the points it gains or loses, about 1/n of
+    the fleet, so every other printer stays with the same worker or node.
+    """
+
+    def __init__(self, shards, replicas=RING_REPLICAS):
+        if not shards:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted((ring_hash(f'{shard}#{i}'), str(shard)) for shard in shards for i in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        """Return the shard of the printer named key."""
+        return self.shards[bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)]
+
+
+def split_fleet(printers, shards, replicas=RING_REPLICAS):
+    """Return {shard: printers} for the printers hashed to each of the shards."""
+    ring = HashRing(shards, replicas)
+    split = {str(shard): [] for shard in shards}
+    for entry in printers:
+        split[ring.shard_for(entry['name'])].append(entry)
+    return split
+
+
+def coordinator_nodes(config):
+    """Return the host names sharing the fleet (`coordinator.nodes`), empty for a single host."""
+    return [str(node) for node in (config.get('coordinator') or {}).get('nodes') or []]
+
+
+def shared_dir(config):
+    """Return the absolute `coordinator.shared_dir` of the node results, or None."""
+    directory = (config.get('coordinator') or {}).get('shared_dir')
+    return os.path.join(script_dir, directory) if directory else None
+
+
+def node_printers(config, printers, node):
+    """
+    Return the printers polled by node: all of them on a single host,
+    otherwise those hashed to it among `coordinator.nodes`.
+    """
+    nodes = coordinator_nodes(config)
+    if not nodes:
+        return printers
+    if node not in nodes:
+        raise ValueError(f"Node '{node}' is not listed in `coordinator.nodes` ({', '.join(nodes)})")
+    return split_fleet(printers, nodes)[node]
+
+
+def init_worker(breaker_config):
+    """
+    Set up a worker process: drop SQLite connections inherited from the
+    coordinator and apply the circuit breaker settings.
+    """
+    storage_module.reset_connections()
+    configure_circuit_breaker(breaker_config)
+
+
+def poll_shard(printers, max_in_flight):
+    """
+    Runs in a worker: poll one shard of the fleet with printer.poll_fleet on
+    the worker's own event loop and SnmpEngine. Each printer writes to its
+    own storage, so workers never write to the same CSV file.
+    Returns (page counts by printer name, snapshot of the worker's metrics).
+    """
+    metrics.REGISTRY.reset()
+
+    async def run():
+        try:
+            return await printer.poll_fleet(printers, max_in_flight)
+        finally:
+            printer.close_snmp_engine()
+
+    page_counts = asyncio.run(run())
+    return page_counts, metrics.REGISTRY.snapshot()
+
+
+def record_sweep(page_counts, duration):
+    """Set the sweep metrics of the merged results, over those of the shards."""
+    metrics.SWEEP_DURATION.set(duration)
+    metrics.SWEEP_FAILURES.set(sum(1 for page_count in page_counts.values() if page_count is None))
+    metrics.SWEEP_TIMESTAMP.set(time.time())
+
+
+def collect(config, workers=None, node=None):
+    """
+    Poll the printers of this node (see node_printers) with a pool of
+    `workers` processes (`coordinator.workers`, or one per CPU). The printers
+    are split across the workers by consistent hashing on their name; each
+    worker keeps up to `fleet.max_in_flight` of them in flight.
+    The page counts and metrics of the workers are merged, and written to
+    `coordinator.shared_dir` for merge_node_results when it is set.
+    Returns a dict mapping printer name to page count (None on failure).
+    """
+    coordinator_config = config.get('coordinator') or {}
+    node = node or socket.gethostname()
+    printers = node_printers(config, printer.load_printers(config), node)
+    max_in_flight = (config.get('fleet') or {}).get('max_in_flight', 50)
+    workers = max(1, min(workers or coordinator_config.get('workers') or os.cpu_count() or 1, len(printers)))
+    shards = split_fleet(printers, [f'worker-{i}' for i in range(workers)])
+
+    start = time.perf_counter()
+    page_counts = {}
+    if printers:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(config.get('circuit_breaker'),)) as pool:
+            futures = {pool.submit(poll_shard, shard_printers, max_in_flight): shard
+                       for shard, shard_printers in shards.items() if shard_printers}
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    shard_page_counts, snapshot = future.result()
+                except Exception as e:
+                    logger.error(f"Polling shard {shard} failed: {e}")
+                    shard_page_counts = {entry['name']: None for entry in shards[shard]}
+                    snapshot = {}
+                page_counts.update(shard_page_counts)
+                metrics.REGISTRY.merge(snapshot)
+    duration = time.perf_counter() - start
+    record_sweep(page_counts, duration)
+    logger.info(f"Node {node} polled {len(printers)} printer(s) with {workers} worker(s) in {duration:.1f} s")
+
+    results_dir = shared_dir(config)
+    if results_dir:
+        write_node_results(results_dir, node, page_counts, duration)
+    return page_counts
+
+
+def node_results_file(results_dir, node):
+    return os.path.join(results_dir, f"{str(node).replace(os.sep, '_')}.json")
+
+
+def write_node_results(results_dir, node, page_counts, duration):
+    """Write the page counts and metrics of the last sweep of node to results_dir, atomically."""
+    os.makedirs(results_dir, exist_ok=True)
+    results = {
+        'version': RESULTS_VERSION,
+        'node': node,
+        'finished_at': time.time(),
+        'duration': duration,
+        'page_counts': {str(name): page_count for name, page_count in page_counts.items()},
+        'metrics': metrics.REGISTRY.snapshot(),
+    }
+    write_file_atomically(node_results_file(results_dir, node), lambda f: f.write(json.dumps(results)))
+
+
+def read_node_results(results_dir, node, max_age=None):
+    """Return the last results of node, or None if it has none (newer than max_age seconds)."""
+    try:
+        with open(node_results_file(results_dir, node), 'r') as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if results.get('version') != RESULTS_VERSION:
+        return None
+    if max_age is not None and time.time() - results['finished_at'] > max_age:
+        return None
+    return results
+
+
+def merge_node_results(config):
+    """
+    Merge the results written by every node of `coordinator.nodes` into
+    `coordinator.shared_dir`. Nodes without results, or with results older
+    than `coordinator.max_result_age` seconds, count as failed for all of
+    their printers. Their metrics are merged into metrics.REGISTRY.
+    Returns (page counts by printer name, names of the missing nodes).
+    """
+    nodes = coordinator_nodes(config)
+    results_dir = shared_dir(config)
+    if not nodes or not results_dir:
+        raise ValueError("Merging needs `coordinator.nodes` and `coordinator.shared_dir`")
+    max_age = (config.get('coordinator') or {}).get('max_result_age')
+
+    page_counts = {}
+    missing = []
+    finished = []
+    durations = []
+    for node, printers in split_fleet(printer.load_printers(config), nodes).items():
+        results = read_node_results(results_dir, node, max_age)
+        if results is None:
+            missing.append(node)
+            results = {'page_counts': {}, 'metrics': {}}
+        else:
+            finished.append(results['finished_at'])
+            durations.append(results['duration'])
+        for entry in printers:
+            page_counts[entry['name']] = results['page_counts'].get(str(entry['name']))
+        metrics.REGISTRY.merge(results['metrics'])
+    metrics.SWEEP_FAILURES.set(sum(1 for page_count in page_counts.values() if page_count is None))
+    if finished:
+        # The nodes sweep side by side, so the fleet took as long as the slowest one
+        metrics.SWEEP_DURATION.set(max(durations))
+        metrics.SWEEP_TIMESTAMP.set(max(finished))
+    if missing:
+        logger.error(f"No recent results from node(s): {', '.join(missing)}")
+    return page_counts, missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll the fleet with several worker processes, "
+                                                 "or one share of it per host.")
+    parser.add_argument('--workers', type=int, help="worker processes (default: coordinator.workers or one per CPU)")
+    parser.add_argument('--node', help="name of this host in coordinator.nodes (default: its host name)")
+    parser.add_argument('--merge', action='store_true',
+                        help="merge the results of every node in coordinator.shared_dir instead of polling")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config)
+    configure_circuit_breaker(config.get('circuit_breaker'))
+    metrics_config = config.get('metrics') or {}
+
+    missing = []
+    try:
+        if args.merge:
+            page_counts, missing = merge_node_results(config)
+        else:
+            page_counts = collect(config, args.workers, args.node)
+    except ValueError as e:
+        logger.error(str(e))
+        exit(2)
+    if metrics_config.get('textfile'):
+        try:
+            metrics.write_textfile(metrics_config['textfile'])
+        except OSError as e:
+            logger.error(f"Failed to write metrics to {metrics_config['textfile']}: {e}")
+    failed = [str(name) for name, page_count in page_counts.items() if page_count is None]
+    if failed:
+        logger.error(f"Failed to query {len(failed)} of {len(page_counts)} printer(s): {', '.join(failed)}")
+    if failed or missing:
+        exit(1)
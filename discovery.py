@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import ipaddress
+import logging
+import random
+import socket
+import time
+from datetime import date
+
+import settings
+from atomic_file import write_file_atomically
+from settings import load_config, setup_logging
+from printer import MARKER_LIFE_COUNT_OID, SYS_DESCR_OID
+
+logger = logging.getLogger('report_logger')
+
+# Objects requested from every address in one GET: the sysDescr.0 of
+# printer.check_network_connectivity, sysObjectID.0, sysName.0, the type of
+# the first Host Resources device and the Printer-MIB page count
+SYS_OBJECT_ID_OID = '1.3.6.1.2.1.1.2.0'
+SYS_NAME_OID = '1.3.6.1.2.1.1.5.0'
+HR_DEVICE_TYPE_OID = '1.3.6.1.2.1.25.3.2.1.2.1'
+PROBE_OIDS = (SYS_OBJECT_ID_OID, SYS_DESCR_OID, SYS_NAME_OID, HR_DEVICE_TYPE_OID, MARKER_LIFE_COUNT_OID)
+# hrDeviceType of a printer (HOST-RESOURCES-TYPES::hrDevicePrinter)
+HR_DEVICE_PRINTER = '1.3.6.1.2.1.25.3.1.5'
+
+# Largest request-id of SNMP (Integer32)
+MAX_REQUEST_ID = 0x7fffffff
+# Room for the answers of thousands of probes in flight
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+# Addresses probed between two progress messages
+PROGRESS_INTERVAL = 10000
+
+
+class RateLimiter:
+    """Spaces out calls of wait() so that at most rate happen per second (None: no limit)."""
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = None
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_event_loop().time()
+        # No credit is saved up while idle, so there is never a burst
+        if self.next_time is None or self.next_time < now:
+            self.next_time = now
+        delay = self.next_time - now
+        self.next_time += self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class SnmpProber(asyncio.DatagramProtocol):
+    """
+    Sends SNMPv2c GET requests to any number of agents from one UDP socket
+    and matches the answers to them by request-id. Unlike the pysnmp engine
+    used by printer.py, nothing is configured per agent, so probing an
+    address costs one encoded datagram and, if it answers, one decode.
+    Requests are sent at most rate per second. Use open_prober() to create one.
+    """
+
+    def __init__(self, rate=None):
+        from pyasn1.codec.ber import decoder, encoder
+        from pysnmp.proto import api, rfc1905
+
+        self.encoder = encoder
+        self.decoder = decoder
+        self.proto = api.protoModules[api.protoVersion2c]
+        self.no_value_types = (rfc1905.NoSuchObject, rfc1905.NoSuchInstance, rfc1905.EndOfMibView)
+        self.limiter = RateLimiter(rate)
+        self.transport = None
+        # request-id: (future of the attempt, community)
+        self.pending = {}
+        self.request_id = random.randint(1, MAX_REQUEST_ID)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        except OSError as e:
+            logger.debug(f"Could not enlarge the receive buffer: {e}")
+
+    def error_received(self, exc):
+        logger.debug(f"Discovery socket error: {exc}")
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def next_request_id(self):
+        self.request_id = self.request_id % MAX_REQUEST_ID + 1
+        return self.request_id
+
+    def encode_get(self, request_id, community, oids):
+        proto = self.proto
+        pdu = proto.GetRequestPDU()
+        proto.apiPDU.setDefaults(pdu)
+        proto.apiPDU.setRequestID(pdu, request_id)
+        proto.apiPDU.setVarBinds(pdu, [(oid, proto.Null('')) for oid in oids])
+        message = proto.Message()
+        proto.apiMessage.setDefaults(message)
+        proto.apiMessage.setCommunity(message, community)
+        proto.apiMessage.setPDU(message, pdu)
+        return self.encoder.encode(message)
+
+    def datagram_received(self, data, addr):
+        proto = self.proto
+        try:
+            message, _ = self.decoder.decode(data, asn1Spec=proto.Message())
+            pdu = proto.apiMessage.getPDU(message)
+            request_id = int(proto.apiPDU.getRequestID(pdu))
+        except Exception as e:
+            logger.debug(f"Ignoring an undecodable datagram from {addr[0]}: {e}")
+            return
+        entry = self.pending.pop(request_id, None)
+        if entry is None or entry[0].done():
+            return
+        future, community = entry
+        if int(proto.apiPDU.getErrorStatus(pdu)):
+            # The agent answered, but not with the objects
+            future.set_result((community, {}))
+            return
+        future.set_result((community, {str(oid): self.to_python(value)
+                                       for oid, value in proto.apiPDU.getVarBinds(pdu)}))
+
+    def to_python(self, value):
+        """Return an answered value as an int or str, None for a missing object."""
+        if isinstance(value, self.no_value_types):
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value.prettyPrint()
+
+    async def get(self, address, communities, oids, port=161, timeout=1, retries=0):
+        """
+        GET oids from the agent at address with each of the communities at
+        once. Returns (community, {oid: value}) of the first answer, or None
+        if none came within timeout seconds after retries more attempts.
+        """
+        loop = asyncio.get_event_loop()
+        for _ in range(retries + 1):
+            future = loop.create_future()
+            request_ids = []
+            try:
+                for community in communities:
+                    await self.limiter.wait()
+                    request_id = self.next_request_id()
+                    self.pending[request_id] = (future, community)
+                    request_ids.append(request_id)
+                    self.transport.sendto(self.encode_get(request_id, community, oids), (address, port))
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                for request_id in request_ids:
+                    self.pending.pop(request_id, None)
+        return None
+
+
+async def open_prober(rate=None):
+    """Return a SnmpProber on a new UDP socket of the running event loop."""
+    loop = asyncio.get_event_loop()
+    _, prober = await loop.create_datagram_endpoint(lambda: SnmpProber(rate), local_addr=('0.0.0.0', 0))
+    return prober
+
+
+def iter_addresses(networks):
+    """
+    Yield the host addresses of the IPv4 networks given in CIDR notation
+    (a single address is a /32). Raises ValueError for anything else.
+    """
+    for network in networks:
+        network = ipaddress.ip_network(network, strict=False)
+        if network.version != 4:
+            raise ValueError(f"Only IPv4 networks can be swept, not {network}")
+        if network.num_addresses == 1:
+            yield str(network.network_address)
+            continue
+        for address in network.hosts():
+            yield str(address)
+
+
+def is_printer(values, printer_sys_object_ids=()):
+    """
+    Tell a printer from the answer of an agent to PROBE_OIDS: its
+    sysObjectID is under one of printer_sys_object_ids, its first Host
+    Resources device is a printer, or it has a Printer-MIB page count.
+    """
+    sys_object_id = values.get(SYS_OBJECT_ID_OID) or ''
+    if any(sys_object_id == prefix or sys_object_id.startswith(f'{prefix}.') for prefix in printer_sys_object_ids):
+        return True
+    if values.get(HR_DEVICE_TYPE_OID) == HR_DEVICE_PRINTER:
+        return True
+    return isinstance(values.get(MARKER_LIFE_COUNT_OID), int)
+
+
+async def probe_address(prober, address, communities, port=161, timeout=1, retries=0):
+    """
+    Probe one address. Returns None if nothing answered, otherwise its
+    inventory entry (see write_inventory) and the values it answered.
+    """
+    answer = await prober.get(address, communities, PROBE_OIDS, port, timeout, retries)
+    if answer is None:
+        return None
+    community, values = answer
+    return {
+        'ip_address': address,
+        'port': port,
+        'community_string': community,
+        'sys_object_id': values.get(SYS_OBJECT_ID_OID),
+        'sys_name': values.get(SYS_NAME_OID),
+        'description': values.get(SYS_DESCR_OID),
+    }, values
+
+
+async def sweep(networks, communities=('public',), port=161, timeout=1, retries=0,
+                max_in_flight=1000, rate=1000, printer_sys_object_ids=()):
+    """
+    Probe every address of networks (see iter_addresses) with up to
+    max_in_flight addresses waiting for an answer and at most rate requests
+    sent per second, all from one socket. Addresses are taken lazily, so a
+    /16 never has more than max_in_flight probes in memory.
+    Returns the inventory entries of the printers found, by address.
+    """
+    prober = await open_prober(rate)
+    in_flight = asyncio.Semaphore(max_in_flight)
+    printers = []
+    counts = {'probed': 0, 'answered': 0}
+    start = time.perf_counter()
+
+    async def probe(address):
+        try:
+            result = await probe_address(prober, address, communities, port, timeout, retries)
+        except Exception as e:
+            logger.error(f"Probing {address} failed: {e}")
+            return
+        finally:
+            in_flight.release()
+        if result is None:
+            return
+        counts['answered'] += 1
+        entry, values = result
+        if is_printer(values, printer_sys_object_ids):
+            printers.append(entry)
+        else:
+            logger.debug(f"{address} answered but is not a printer ({entry['sys_object_id']})")
+
+    tasks = set()
+    try:
+        for address in iter_addresses(networks):
+            await in_flight.acquire()
+            task = asyncio.ensure_future(probe(address))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            counts['probed'] += 1
+            if counts['probed'] % PROGRESS_INTERVAL == 0:
+                logger.info(f"Probed {counts['probed']} addresses, {len(printers)} printer(s) found so far")
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        prober.close()
+    logger.info(f"Probed {counts['probed']} addresses in {time.perf_counter() - start:.1f} s: "
+                f"{counts['answered']} answered, {len(printers)} printer(s)")
+    return sorted(printers, key=lambda entry: ipaddress.ip_address(entry['ip_address']))
+
+
+def load_inventory(path):
+    """Return the printers listed in the inventory file at path, [] if there is none."""
+    import yaml
+
+    try:
+        with open(path, 'r') as f:
+            inventory = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return []
+    return inventory.get('printers') or []
+
+
+def merge_inventory(entries, found, today=None):
+    """
+    Add the printers found by a sweep to the inventory entries. Printers
+    already listed keep their name and any setting added by hand; those not
+    found this time are kept with their previous `last_seen` date.
+    """
+    today = (today or date.today()).isoformat()
+    merged = {entry['ip_address']: dict(entry) for entry in entries}
+    for printer in found:
+        entry = merged.setdefault(printer['ip_address'], {'name': printer['ip_address']})
+        entry.update(printer, last_seen=today)
+    return sorted(merged.values(), key=lambda entry: ipaddress.ip_address(entry['ip_address']))
+
+
+def write_inventory(path, entries):
+    """
+    Write the inventory loaded by printer.load_printers: a `printers` list
+    in the format of config.yaml. The file is replaced atomically.
+    """
+    import yaml
+
+    def write(f):
+        f.write("# Written by discovery.py; names and settings edited here are kept by later sweeps\n")
+        yaml.safe_dump({'printers': entries}, f, default_flow_style=False, sort_keys=False)
+    write_file_atomically(path, write)
+
+
+async def discover(config, networks=None, inventory_file=None):
+    """
+    Sweep the networks (default `discovery.networks`) with the settings under
+    `discovery` and merge the printers found into the inventory file
+    (default `fleet.inventory_file`). Returns the printers found.
+    """
+    discovery_config = config.get('discovery') or {}
+    networks = networks or discovery_config.get('networks') or []
+    inventory_file = inventory_file or settings.inventory_file(config)
+    if not networks:
+        raise ValueError("No networks to sweep: pass them or set `discovery.networks`")
+    if not inventory_file:
+        raise ValueError("No inventory file: pass one or set `fleet.inventory_file`")
+    communities = discovery_config.get('community_strings') or [
+        (config.get('printer') or {}).get('community_string', 'public')]
+
+    found = await sweep(networks, communities,
+                        port=discovery_config.get('port', 161),
+                        timeout=discovery_config.get('timeout', 1),
+                        retries=discovery_config.get('retries', 1),
+                        max_in_flight=discovery_config.get('max_in_flight', 1000),
+                        rate=discovery_config.get('rate', 1000),
+                        printer_sys_object_ids=discovery_config.get('printer_sys_object_ids') or ())
+    write_inventory(inventory_file, merge_inventory(load_inventory(inventory_file), found))
+    logger.info(f"Inventory written to '{inventory_file}'")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the SNMP printers of IPv4 networks and list them "
+                                                 "in the inventory polled by printer.py.")
+    parser.add_argument('networks', nargs='*', help="networks in CIDR notation (default: discovery.networks)")
+    parser.add_argument('--inventory', help="inventory file to update (default: fleet.inventory_file)")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config)
+    try:
+        printers = asyncio.run(discover(config, args.networks, args.inventory))
+    except ValueError as e:
+        logger.error(str(e))
+        exit(2)
+    print(f"{len(printers)} printer(s) found")
@@ -17,4 +17,18 @@ Feature: Printer Connectivity
     Given a printer with IP address 192.168.1.100
     And a printer with previous page count of 4500
     When the printer is offline
-    Then the system should use the previous page count
\ No newline at end of file
+    Then the system should use the previous page count
+
+  Scenario: Skip a printer that keeps timing out
+    Given a printer with IP address 192.168.1.100
+    And a printer with previous page count of 4500
+    When the printer times out on 3 polls in a row
+    Then the next poll should not query the printer
+
+  Scenario: Shorten the timeout of a printer that answers quickly
+    Given a printer with IP address 192.168.1.100
+    And the printer has a timeout of 5 seconds
+    And the printer answers in 20 ms
+    When I poll the printer 5 times
+    Then the first poll should have waited 5.0 seconds
+    And the last poll should have waited 1.0 seconds
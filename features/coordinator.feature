@@ -0,0 +1,27 @@
+Feature: Sharded Collection
+  As a system administrator
+  I want to split the polling of a large fleet across processes and hosts
+  So that collection is not bound by a single core
+
+  Scenario: Split the fleet by consistent hashing
+    Given a fleet of 400 printers to shard
+    When I split the fleet across 4 shards
+    Then every printer should be in exactly one shard
+    And every shard should hold between 15% and 35% of the printers
+    When I split the fleet across 5 shards
+    Then only printers of the new shard should have moved
+
+  Scenario: Poll the fleet with several worker processes
+    Given a fleet of 4 printers with page count history
+    When I collect the page counts with 2 workers
+    Then every printer should have a page count of 5000
+    And the merged metrics should count 4 successful polls
+
+  Scenario: Merge the results of the nodes sharing the fleet
+    Given a fleet of 6 printers with page count history
+    And the fleet is shared by nodes "collector-a" and "collector-b"
+    When node "collector-a" collects its page counts
+    And I merge the results of the nodes
+    Then the printers of node "collector-a" should have a page count of 5000
+    And the printers of node "collector-b" should count as failed
+    And node "collector-b" should be reported as missing
@@ -0,0 +1,47 @@
+Feature: Date Index
+  As a system administrator
+  I want the dates of the page count history to be indexed
+  So that looking up a day does not read the whole CSV file
+
+  Scenario: Index the rows appended since the last lookup without a rebuild
+    Given a page count CSV file from 2025-03-01 to 2025-03-10
+    And the dates of the CSV file have been indexed
+    When a row for 2025-03-11 is appended to the CSV file
+    And I look up 2025-03-11 in the index
+    Then the index should contain 2025-03-11
+    And only the appended rows should have been read
+
+  Scenario: Rebuild the index of a file replaced by an edited copy
+    Given a page count CSV file from 2025-03-01 to 2025-03-10
+    And the dates of the CSV file have been indexed
+    When the CSV file is replaced by a copy where 2025-03-01 reads 2025-02-28 and 2025-03-11 is appended
+    And I look up 2025-03-01 in the index
+    Then the index should not contain 2025-03-01
+    And the index should contain 2025-02-28
+    And the whole CSV file should have been read
+
+  Scenario: Rebuild the index of a truncated file
+    Given a page count CSV file from 2025-03-01 to 2025-03-10
+    And the dates of the CSV file have been indexed
+    When the CSV file is truncated after 2025-03-05
+    And I look up 2025-03-06 in the index
+    Then the index should not contain 2025-03-06
+    And the index should contain 2025-03-05
+    And the whole CSV file should have been read
+
+  Scenario: Keep the index in date order when a date is appended out of order
+    Given a page count CSV file from 2025-03-01 to 2025-03-10
+    And the dates of the CSV file have been indexed
+    When a row for 2025-02-20 is appended to the CSV file
+    Then the rows from 2025-02-01 to 2025-03-02 should be dated 2025-02-20, 2025-03-01, 2025-03-02
+
+  Scenario: Ignore a partially written last line
+    Given a page count CSV file from 2025-03-01 to 2025-03-10
+    And the dates of the CSV file have been indexed
+    When the CSV file ends with the partial line "2025-03-11,51"
+    And I look up 2025-03-11 in the index
+    Then the index should not contain 2025-03-11
+    When the rest of the line "00,10" is written
+    And I look up 2025-03-11 in the index
+    Then the index should contain 2025-03-11
+    And the rows from 2025-03-11 to 2025-03-11 should be dated 2025-03-11
@@ -0,0 +1,31 @@
+Feature: Printer Discovery
+  As a system administrator
+  I want to find the printers of whole networks
+  So that I don't have to list thousands of devices in config.yaml by hand
+
+  Scenario: Find the printers of a network
+    Given a network 192.0.2.0/29 where 192.0.2.2 is a printer and 192.0.2.5 is a router
+    When I sweep the network
+    Then the inventory should list the printer 192.0.2.2 only
+
+  Scenario: Identify a printer from its SNMP answer
+    Given an SNMP agent of a printer on 127.0.0.1
+    When I sweep the range 127.0.0.1/32
+    Then the printer should be found with its sysName and sysObjectID
+
+  Scenario: Keep the names given to printers in the inventory
+    Given a network 192.0.2.0/29 where 192.0.2.2 is a printer and 192.0.2.5 is a router
+    And an inventory where 192.0.2.2 is named "lobby"
+    When I sweep the network
+    Then the inventory should name 192.0.2.2 "lobby"
+
+  Scenario: Poll the printers of the inventory
+    Given an inventory where 192.0.2.2 is named "lobby"
+    When the collector loads the printers of a configuration listing 192.0.2.9
+    Then it should poll 192.0.2.9 and 192.0.2.2
+
+  Scenario: Keep polling the configured printer next to the inventory
+    Given an inventory where 192.0.2.2 is named "lobby"
+    When the collector loads the printers of a configuration without a printers list
+    Then it should poll 10.1.1.6 and 192.0.2.2
+    And 10.1.1.6 should keep writing to the configured CSV file
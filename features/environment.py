@@ -3,6 +3,12 @@ import os
 import tempfile
 import shutil
 
+import metrics
+import printer
+import resilience
+import timing
+from transport import FakeTransport
+
 def before_all(context):
     """Setup before all tests"""
     # Create a base temporary directory for all tests
@@ -14,9 +20,17 @@ def before_scenario(context, scenario):
     # Create a temporary directory for this scenario
     context.temp_dir = tempfile.mkdtemp(dir=context.base_temp_dir)
     print(f"Created temporary directory for scenario: {context.temp_dir}")
+    # Start every scenario without round-trip times or failures from earlier ones
+    resilience.reset_device_health()
+    metrics.REGISTRY.reset()
+    timing.reset()
+    printer.reset_auth_data()
+    # Printers are simulated in memory; steps register them with add_printer
+    context.transport = printer.TRANSPORT = FakeTransport()
 
 def after_scenario(context, scenario):
     """Cleanup after each scenario"""
+    printer.TRANSPORT = None
     # Clean up any patches that might be active
     if hasattr(context, 'csv_patch') and context.csv_patch:
         context.csv_patch.stop()
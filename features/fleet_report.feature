@@ -0,0 +1,24 @@
+Feature: Fleet Report
+  As a system administrator
+  I want one report per printer and an index page for the whole fleet
+  So that I can check every printer without waiting for one report after another
+
+  Scenario: Generate a report for every printer of the fleet
+    Given a fleet of 3 printers with page count history
+    When I generate the fleet report with 2 workers
+    Then a report should be written for every printer
+    And the index page should link the report of every printer
+
+  Scenario: Skip printers whose history has not changed
+    Given a fleet of 3 printers with page count history
+    And the fleet report has been generated
+    When printer "printer-1" records a new page count
+    And I generate the fleet report with 2 workers
+    Then only the report of printer "printer-1" should be written
+    And the index page should link the report of every printer
+
+  Scenario: Compute the usage analytics of the whole fleet at once
+    Given a fleet of 3 printers with page count history
+    When I generate the fleet report with 2 workers
+    Then the usage analytics should have been computed once for 3 printers
+    And the report of every printer should include its usage analytics
@@ -0,0 +1,23 @@
+Feature: Collector Metrics
+  As a system administrator
+  I want the collector to expose Prometheus metrics
+  So that I can watch poll outcomes and latency without reading the logs
+
+  Scenario: Count a successful poll and its page count
+    Given a printer with IP address 192.168.1.100
+    When I query the printer for its page count
+    Then the metrics should count 1 "ok" poll of the printer
+    And the metrics should show a page count of 5000 for the printer
+
+  Scenario: Count the fallback of an offline printer
+    Given a printer with IP address 192.168.1.100
+    And a printer with previous page count of 4500
+    When the printer times out on 1 polls in a row
+    Then the metrics should count 1 "error_indication" poll of the printer
+    And the metrics should count 1 fallback of the printer
+
+  Scenario: Serve the metrics over HTTP
+    Given a printer with IP address 192.168.1.100
+    When I query the printer for its page count
+    And I request /metrics from the metrics server
+    Then the response should be the metrics in the Prometheus text format
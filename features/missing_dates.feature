@@ -0,0 +1,31 @@
+Feature: Missing Date Filling
+  As a system administrator
+  I want days without a sample to be filled with the previous page count
+  So that the history has one row per day
+
+  Scenario: Append the days missing since the last sample
+    Given a page count history from 2025-03-01 to 2025-03-05
+    When I fill missing dates until 2025-03-09
+    Then the history should contain every day from 2025-03-01 to 2025-03-08
+    And the rows up to 2025-03-05 should be unchanged
+
+  Scenario: Repair a gap in the middle of the history
+    Given a page count history from 2025-03-01 to 2025-03-10 without 2025-03-04
+    When I repair the whole history
+    Then the history should contain every day from 2025-03-01 to 2025-03-10
+    And 2025-03-04 should have the page count of 2025-03-03
+
+  Scenario: Keep every sample of a day polled several times
+    Given a page count history from 2025-01-01 to 2025-01-05 without 2025-01-03
+    And 2025-01-02 has 3 samples with a net increase of 10 each
+    When I repair the whole history
+    Then the history should contain every day from 2025-01-01 to 2025-01-05
+    And the net increase of 2025-01-02 should be 30
+    And 2025-01-03 should have the page count of 2025-01-02
+
+  Scenario: Repair a history whose last line was cut off
+    Given a page count history from 2025-03-01 to 2025-03-10 without 2025-03-04
+    And the history ends with the partial line "2025-03-1"
+    When I repair the whole history
+    Then the history should contain every day from 2025-03-01 to 2025-03-10
+    And 2025-03-04 should have the page count of 2025-03-03
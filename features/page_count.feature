@@ -14,4 +14,77 @@ Feature: Printer Page Count
     And a printer with previous page count of 4500
     When I query the printer and receive a page count of 4600
     Then the page count should be stored in the CSV file
-    And the net increase should be 100 pages
\ No newline at end of file
+    And the net increase should be 100 pages
+
+  Scenario: Ignore a partially written last line
+    Given a printer with IP address 192.168.1.100
+    And a printer with previous page count of 4500
+    And the CSV file ends with a partially written line
+    When I query the printer and receive a page count of 4600
+    Then the net increase should be 100 pages
+    And every line in the CSV file should be complete
+
+  Scenario: Query an SNMPv3 printer with the same credentials on every poll
+    Given a printer with IP address 192.168.1.100
+    And the printer uses SNMPv3 user "monitor" with sha and aes
+    When I query the printer twice
+    Then both queries should authenticate as "monitor" with usmHMACSHAAuthProtocol and usmAesCfb128Protocol
+
+  Scenario: Refuse a shared SNMPv3 user with different passwords
+    Given a printer with IP address 192.168.1.100
+    And the printer uses SNMPv3 user "monitor" with sha and aes
+    When another printer uses SNMPv3 user "monitor" with other passwords
+    Then its credentials should be refused until it sets its engine_id
+
+  Scenario: Refuse conflicting SNMPv3 credentials when the printers are loaded
+    Given a configuration where printers "finance" and "legal" use SNMPv3 user "monitor" with other passwords
+    When the collector loads the printers of the configuration
+    Then loading the printers should fail for printer "legal"
+    And no SNMPv3 credentials should have been built
+
+  Scenario: Keep discovered SNMPv3 engines for longer
+    When the shared SNMP engine keeps SNMPv3 engines for 900 seconds
+    Then engine information should only expire on every 3rd timer tick
+
+  Scenario: Walk the marker and supply tables
+    Given a printer with IP address 192.168.1.100
+    And the printer has the Printer-MIB values
+      | oid                         | value |
+      | 1.3.6.1.2.1.43.10.2.1.4.1.1 | 5000  |
+      | 1.3.6.1.2.1.43.11.1.1.9.1.1 | 40    |
+      | 1.3.6.1.2.1.43.11.1.1.9.1.2 | 75    |
+      | 1.3.6.1.2.1.43.12.1.1.4.1.1 | 3     |
+    When I walk the printer tables 2 rows at a time
+    Then the walk should return marker_life_count.1.1=5000 supply_level.1.1=40 supply_level.1.2=75
+
+  Scenario: End a table walk on an agent that does not move forward
+    Given a printer with IP address 192.168.1.100
+    And the printer repeats the first row of every table
+    When I walk the printer tables 2 rows at a time
+    Then the walk should return marker_life_count.1=1 marker_power_on_count.1=1 supply_max_capacity.1=1 supply_level.1=1
+    And the walk should have taken 1 request
+
+  Scenario: Give up on a table that never ends
+    Given a printer with IP address 192.168.1.100
+    And the printer has a marker table that never ends
+    When I try to walk the printer tables
+    Then the walk should fail after 40 requests
+
+  Scenario: Poll a printer as a daemon until it is stopped
+    Given a printer with IP address 192.168.1.100
+    When I run the daemon with a poll interval of 0.1 seconds and a jitter of 0 seconds for 0.35 seconds
+    Then the printer should have been polled between 3 and 5 times
+    And the daemon should have stored the page count
+
+  Scenario: Never poll a printer back to back when the jitter exceeds the interval
+    Given a printer with IP address 192.168.1.100
+    And every poll interval is shortened by the full jitter
+    When I run the daemon with a poll interval of 0.1 seconds and a jitter of 1 seconds for 0.35 seconds
+    Then the printer should have been polled between 3 and 9 times
+    And the daemon should have warned that the jitter is too large
+
+  Scenario: Poll a fleet concurrently within the in-flight limit
+    Given a fleet of 12 simulated printers answering in 20 ms
+    When I poll the fleet with at most 4 printers in flight
+    Then every printer of the fleet should have a page count of 5000
+    And more than 1 and at most 4 requests should have been in flight at once
@@ -18,4 +18,89 @@ Feature: Report Generation
     Given a CSV file with printer page count data for multiple days
     When I generate an HTML report
     Then the report should include daily usage data
-    And the report should include monthly usage data
\ No newline at end of file
+    And the report should include monthly usage data
+
+  Scenario: Update the report data from the rows appended since the last run
+    Given a CSV file with printer page count data for multiple days
+    And the report data has been read once
+    When a poll appends a row to the CSV file
+    And I read the report data again
+    Then only the appended rows should have been parsed
+    And the report data should match a full read of the CSV file
+
+  Scenario: Read the whole CSV file again after it was rewritten
+    Given a CSV file with printer page count data for multiple days
+    And the report data has been read once
+    When the CSV file is rewritten with a changed row
+    And I read the report data again
+    Then the CSV file should have been parsed from the start
+    And the report data should match a full read of the CSV file
+
+  Scenario: Report usage analytics
+    Given a CSV file with printer page count data for multiple days
+    When I generate an HTML report
+    Then the report should include usage analytics
+    And the 7-day moving average in the report should be 100 pages per day
+    And the median day in the report should be 100 pages
+
+  Scenario: Generate a report without NumPy
+    Given a CSV file with printer page count data for multiple days
+    And NumPy is not installed
+    When I generate an HTML report
+    Then the HTML report should be created successfully
+    And the report should not include usage analytics
+
+  Scenario: Generate a self-contained static build of the report
+    Given a CSV file with printer page count data for multiple days
+    And a vendored copy of Chart.js
+    When I generate a static build of the HTML report
+    Then the report should load its data from a separate file
+    And the report should not load anything from the internet
+    And the compressed copy of the report should match the report
+
+  Scenario: Replace the data file of an earlier static build
+    Given a CSV file with printer page count data for multiple days
+    And a vendored copy of Chart.js
+    And a static build of the HTML report has been generated
+    When a poll appends a row to the CSV file
+    And I generate a static build of the HTML report
+    Then only the data file of the latest build should remain
+
+  Scenario: Refuse a static build without the vendored Chart.js
+    Given a CSV file with printer page count data for multiple days
+    And Chart.js has not been vendored
+    When I generate a static build of the HTML report
+    Then no report should be written
+
+  Scenario: Roll the daily page counts up into weeks, months and years
+    Given printer page count data of 10 pages a day from 2024-12-28 to 2025-02-02
+    When I compute the rollups of the report data
+    Then the weekly rollup should be
+      | label    | net_increase | total_page_count |
+      | 2024-W52 | 20           | 5020             |
+      | 2025-W01 | 70           | 5090             |
+      | 2025-W02 | 70           | 5160             |
+      | 2025-W03 | 70           | 5230             |
+      | 2025-W04 | 70           | 5300             |
+      | 2025-W05 | 70           | 5370             |
+    And the monthly rollup should be
+      | label   | net_increase | total_page_count |
+      | 2024-12 | 40           | 5040             |
+      | 2025-01 | 310          | 5350             |
+      | 2025-02 | 20           | 5370             |
+    And the yearly rollup should be
+      | label | net_increase | total_page_count |
+      | 2024  | 40           | 5040             |
+      | 2025  | 330          | 5370             |
+
+  Scenario: Merge the points of a long history into buckets
+    Given printer page count data of 10 pages a day from 2025-01-01 to 2025-01-10
+    When I build the chart data with at most 4 points per chart
+    Then the daily chart should merge 3 points per bucket
+    And the daily chart should be
+      | label      | net_increase | total_page_count |
+      | 2025-01-01 | 30           | 5030             |
+      | 2025-01-04 | 30           | 5060             |
+      | 2025-01-07 | 30           | 5090             |
+      | 2025-01-10 | 10           | 5100             |
+    And the monthly chart should merge 1 point per bucket
@@ -2,10 +2,11 @@
 from behave import given, when, then
 import asyncio
 import os
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 # Import the module to test
 import printer
+from page_count_steps import poll_values
 
 @given('a printer with IP address {ip_address}')
 def step_printer_with_ip(context, ip_address):
@@ -14,28 +15,24 @@ def step_printer_with_ip(context, ip_address):
     # Create a temporary directory for test files
     import tempfile
     context.temp_dir = tempfile.mkdtemp()
+    # Simulated printer at that address, answering once given its values
+    context.agent = context.transport.add_printer(ip_address)
 
 @when('I check the printer connectivity')
 def step_check_connectivity(context):
-    # Mock the SNMP response for connectivity check
-    with patch('printer.getCmd') as mock_get_cmd:
-        # Configure the mock to return a successful response
-        mock_var_bind = MagicMock()
-        mock_var_bind.__getitem__.side_effect = lambda i: mock_var_bind if i == 0 else "Printer Description"
-        mock_get_cmd.return_value = (None, 0, 0, [mock_var_bind])
-        
-        # Run the connectivity check function
-        context.connectivity_result = asyncio.run(printer.check_network_connectivity(context.ip_address, 'public'))
+    # The simulated printer answers the connectivity check
+    context.agent.values[printer.SYS_DESCR_OID] = "Printer Description"
+
+    # Run the connectivity check function
+    context.connectivity_result = asyncio.run(printer.check_network_connectivity(context.ip_address, 'public'))
 
 @when('the printer is offline')
 def step_printer_offline(context):
-    # Mock the SNMP response for a failed connectivity check
-    with patch('printer.getCmd') as mock_get_cmd:
-        # Configure the mock to return an error
-        mock_get_cmd.return_value = ("Timeout", None, None, None)
-        
-        # Run the connectivity check function
-        context.connectivity_result = asyncio.run(printer.check_network_connectivity(context.ip_address, 'public'))
+    # Every request to the simulated printer times out
+    context.agent.online = False
+
+    # Run the connectivity check function
+    context.connectivity_result = asyncio.run(printer.check_network_connectivity(context.ip_address, 'public'))
 
 @then('the connectivity check should succeed')
 def step_connectivity_check_success(context):
@@ -52,11 +49,68 @@ def step_use_previous_count(context):
     # Check if the system used the previous page count
     with patch('printer.read_previous_page_count', return_value=(context.previous_count, None)), \
          patch('printer.write_page_count') as mock_write:
-        # Run the page count query function with a failed connectivity check
-        with patch('printer.check_network_connectivity', return_value=False):
-            asyncio.run(printer.get_printer_page_count(context.ip_address, 'public'))
+        # Run the page count query function with the poll request timing out
+        sent = len(context.transport.requests_to(context.ip_address))
+        asyncio.run(printer.get_printer_page_count(context.ip_address, 'public'))
+
+        # The page count query is the only SNMP request sent, retried after the timeout
+        requests = len(context.transport.requests_to(context.ip_address)) - sent
+        assert requests == 1 + printer.DEFAULT_RETRIES, \
+            f"Expected {1 + printer.DEFAULT_RETRIES} requests, got {requests}"
         
         # Check if write_page_count was called with the previous count
         mock_write.assert_called_once()
         args, _ = mock_write.call_args
-        assert args[1] == context.previous_count, f"Expected {context.previous_count}, got {args[1]}"
\ No newline at end of file
+        assert args[1] == context.previous_count, f"Expected {context.previous_count}, got {args[1]}"
+
+@when('the printer times out on {count:d} polls in a row')
+def step_printer_times_out(context, count):
+    context.agent.online = False
+    with patch('printer.read_previous_page_count', return_value=(context.previous_count, None)), \
+         patch('printer.write_page_count'):
+        for _ in range(count):
+            asyncio.run(printer.get_printer_page_count(context.ip_address, 'public'))
+
+@then('the next poll should not query the printer')
+def step_next_poll_skipped(context):
+    sent = len(context.transport.requests_to(context.ip_address))
+    with patch('printer.read_previous_page_count', return_value=(context.previous_count, None)), \
+         patch('printer.write_page_count') as mock_write:
+        result = asyncio.run(printer.get_printer_page_count(context.ip_address, 'public'))
+
+    assert result is None, f"Expected no page count, got {result}"
+    assert len(context.transport.requests_to(context.ip_address)) == sent, "The printer should not be queried"
+    # The skipped poll still records the previous page count
+    mock_write.assert_called_once()
+    args, _ = mock_write.call_args
+    assert args[1:3] == (context.previous_count, 0), f"Expected ({context.previous_count}, 0), got {args[1:3]}"
+
+@given('the printer has a timeout of {seconds:d} seconds')
+def step_printer_timeout(context, seconds):
+    context.timeout = seconds
+
+@given('the printer answers in {milliseconds:d} ms')
+def step_printer_latency(context, milliseconds):
+    context.agent.latency = milliseconds / 1000
+    context.agent.values.update(poll_values(5000))
+
+@when('I poll the printer {count:d} times')
+def step_poll_printer(context, count):
+    with patch('printer.read_previous_page_count', return_value=(0, None)), \
+         patch('printer.write_page_count'):
+        for _ in range(count):
+            asyncio.run(printer.get_printer_page_count(context.ip_address, 'public', timeout=context.timeout))
+
+def poll_timeouts(context):
+    """Return the timeout the transport was given for each poll of the printer."""
+    return [request[4] for request in context.transport.requests_to(context.ip_address)]
+
+@then('the first poll should have waited {seconds:g} seconds')
+def step_first_poll_timeout(context, seconds):
+    timeout = poll_timeouts(context)[0]
+    assert timeout == seconds, f"Expected a timeout of {seconds}s, got {timeout}s"
+
+@then('the last poll should have waited {seconds:g} seconds')
+def step_last_poll_timeout(context, seconds):
+    timeout = poll_timeouts(context)[-1]
+    assert timeout == seconds, f"Expected a timeout of {seconds}s, got {timeout}s"
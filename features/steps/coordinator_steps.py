@@ -0,0 +1,108 @@
+# features/steps/coordinator_steps.py
+from behave import given, when, then
+import os
+from unittest.mock import patch
+
+# Import the module to test
+import coordinator
+import metrics
+from page_count_steps import poll_values
+from transport import FakeTransport
+
+def sharding_config(context):
+    """The configuration of the fleet step, without the inventory of the checkout."""
+    config = dict(context.fleet_config)
+    config['fleet'] = dict(config.get('fleet') or {}, inventory_file=None)
+    return config
+
+def collect_page_counts(config, workers=None, node=None):
+    # The worker processes are forked with the simulated printers
+    transport = FakeTransport()
+    for entry in config['printers']:
+        transport.add_printer(entry['ip_address'], poll_values(5000))
+    with patch('printer.TRANSPORT', transport):
+        return coordinator.collect(config, workers=workers, node=node)
+
+@given('a fleet of {count:d} printers to shard')
+def step_fleet_to_shard(context, count):
+    context.printers = [{'name': f'printer-{i}', 'ip_address': f'10.1.{i // 250}.{i % 250 + 1}'}
+                        for i in range(count)]
+    context.shards = {}
+
+@when('I split the fleet across {count:d} shards')
+def step_split_fleet(context, count):
+    context.previous_shards = context.shards
+    split = coordinator.split_fleet(context.printers, [f'worker-{i}' for i in range(count)])
+    context.split = split
+    context.shards = {entry['name']: shard for shard, printers in split.items() for entry in printers}
+
+@then('every printer should be in exactly one shard')
+def step_every_printer_in_one_shard(context):
+    names = [entry['name'] for printers in context.split.values() for entry in printers]
+    assert sorted(names) == sorted(entry['name'] for entry in context.printers), \
+        "Every printer should be assigned to exactly one shard"
+
+@then('every shard should hold between {low:d}% and {high:d}% of the printers')
+def step_shards_balanced(context, low, high):
+    for shard, printers in context.split.items():
+        share = 100 * len(printers) / len(context.printers)
+        assert low <= share <= high, f"Shard {shard} holds {share:.1f}% of the printers"
+
+@then('only printers of the new shard should have moved')
+def step_only_new_shard_moved(context):
+    new_shard = f'worker-{len(context.split) - 1}'
+    moved = [name for name, shard in context.shards.items() if shard != context.previous_shards[name]]
+    assert moved, "The new shard should have taken over some printers"
+    assert all(context.shards[name] == new_shard for name in moved), \
+        f"Printers moved between old shards: {[name for name in moved if context.shards[name] != new_shard]}"
+
+@when('I collect the page counts with {workers:d} workers')
+def step_collect_with_workers(context, workers):
+    metrics.REGISTRY.reset()
+    context.page_counts = collect_page_counts(sharding_config(context), workers=workers)
+
+@then('every printer should have a page count of {count:d}')
+def step_every_printer_page_count(context, count):
+    assert context.page_counts == {name: count for name in context.printer_names}, \
+        f"Unexpected page counts: {context.page_counts}"
+
+@then('the merged metrics should count {count:d} successful polls')
+def step_merged_poll_metrics(context, count):
+    ok_polls = sum(value for key, value in metrics.POLLS.snapshot() if key[1] == 'ok')
+    assert ok_polls == count, f"Expected {count} successful polls in the merged metrics, got {ok_polls}"
+
+@given('the fleet is shared by nodes "{first}" and "{second}"')
+def step_fleet_shared_by_nodes(context, first, second):
+    config = sharding_config(context)
+    config['coordinator'] = {'nodes': [first, second], 'workers': 1,
+                             'shared_dir': os.path.join(context.temp_dir, 'results')}
+    context.fleet_config = config
+    printers = [{'name': name} for name in context.printer_names]
+    context.node_printers = {node: [entry['name'] for entry in entries]
+                             for node, entries in coordinator.split_fleet(printers, [first, second]).items()}
+    assert all(context.node_printers.values()), f"Both nodes should get printers: {context.node_printers}"
+
+@when('node "{node}" collects its page counts')
+def step_node_collects(context, node):
+    context.page_counts = collect_page_counts(context.fleet_config, node=node)
+    assert sorted(context.page_counts) == sorted(context.node_printers[node]), \
+        f"Node {node} should only poll its own printers, polled {sorted(context.page_counts)}"
+
+@when('I merge the results of the nodes')
+def step_merge_node_results(context):
+    metrics.REGISTRY.reset()
+    context.page_counts, context.missing_nodes = coordinator.merge_node_results(context.fleet_config)
+
+@then('the printers of node "{node}" should have a page count of {count:d}')
+def step_node_page_counts(context, node, count):
+    for name in context.node_printers[node]:
+        assert context.page_counts[name] == count, f"Printer {name} has page count {context.page_counts[name]}"
+
+@then('the printers of node "{node}" should count as failed')
+def step_node_failed(context, node):
+    for name in context.node_printers[node]:
+        assert context.page_counts[name] is None, f"Printer {name} should have no page count"
+
+@then('node "{node}" should be reported as missing')
+def step_node_missing(context, node):
+    assert context.missing_nodes == [node], f"Expected missing nodes [{node}], got {context.missing_nodes}"
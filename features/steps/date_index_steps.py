@@ -0,0 +1,97 @@
+# features/steps/date_index_steps.py
+from behave import given, when, then
+import os
+import csv
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Import the module to test
+import history
+
+def date_range(start, end):
+    current = datetime.strptime(start, "%Y-%m-%d")
+    end = datetime.strptime(end, "%Y-%m-%d")
+    while current <= end:
+        yield current.strftime("%Y-%m-%d")
+        current += timedelta(days=1)
+
+def write_rows(csv_file, rows):
+    with open(csv_file, 'w', newline='') as csvfile:
+        csv.writer(csvfile).writerows(rows)
+
+def append_text(context, text):
+    with open(context.csv_file, 'a', newline='') as csvfile:
+        csvfile.write(text)
+
+@given('a page count CSV file from {start} to {end}')
+def step_page_count_file(context, start, end):
+    context.csv_file = os.path.join(context.temp_dir, 'test_printer_page_counts.csv')
+    context.rows = [[date, 5000 + i * 10, 10] for i, date in enumerate(date_range(start, end))]
+    write_rows(context.csv_file, context.rows)
+
+@given('the dates of the CSV file have been indexed')
+def step_indexed(context):
+    history.load_date_index(context.csv_file)
+    context.indexed_size = os.path.getsize(context.csv_file)
+
+@when('a row for {date} is appended to the CSV file')
+def step_append_row(context, date):
+    append_text(context, f"{date},6000,10\n")
+
+@when('the CSV file is replaced by a copy where {date} reads {new_date} and {appended} is appended')
+def step_replace_file(context, date, new_date, appended):
+    # Same length up to the indexed end, so only the new inode tells it apart from an append
+    rows = [[new_date if row[0] == date else row[0]] + row[1:] for row in context.rows]
+    rows.append([appended, 6000, 10])
+    temp_file = context.csv_file + '.new'
+    write_rows(temp_file, rows)
+    os.replace(temp_file, context.csv_file)
+
+@when('the CSV file is truncated after {date}')
+def step_truncate_file(context, date):
+    write_rows(context.csv_file, [row for row in context.rows if row[0] <= date])
+
+@when('the CSV file ends with the partial line "{text}"')
+def step_partial_line(context, text):
+    # An append interrupted before the end of its line
+    append_text(context, text)
+
+@when('the rest of the line "{text}" is written')
+def step_rest_of_line(context, text):
+    append_text(context, text + '\n')
+
+@when('I look up {date} in the index')
+def step_look_up(context, date):
+    # Record the offset each refresh of the index starts reading from
+    context.read_offsets = []
+    read_rows = history.DateIndex._read_rows
+
+    def recording_read_rows(index, f):
+        context.read_offsets.append(index.indexed_size)
+        return read_rows(index, f)
+
+    with patch.object(history.DateIndex, '_read_rows', recording_read_rows):
+        context.index = history.load_date_index(context.csv_file)
+
+@then('the index should contain {date}')
+def step_contains(context, date):
+    assert context.index.contains(date), f"{date} is not in the index {context.index.dates}"
+
+@then('the index should not contain {date}')
+def step_not_contains(context, date):
+    assert not context.index.contains(date), f"{date} should not be in the index {context.index.dates}"
+
+@then('only the appended rows should have been read')
+def step_read_appended(context):
+    assert context.read_offsets == [context.indexed_size], \
+        f"Expected one read from offset {context.indexed_size}, got {context.read_offsets}"
+
+@then('the whole CSV file should have been read')
+def step_read_whole(context):
+    assert context.read_offsets == [0], f"Expected one read from the start, got {context.read_offsets}"
+
+@then('the rows from {start} to {end} should be dated {dates}')
+def step_rows_between(context, start, end, dates):
+    rows = history.read_rows_between(context.csv_file, start, end)
+    expected = [date.strip() for date in dates.split(',')]
+    assert [row[0] for row in rows] == expected, f"Expected {expected}, got {rows}"
@@ -0,0 +1,146 @@
+# features/steps/discovery_steps.py
+from behave import given, when, then
+import asyncio
+import os
+from unittest.mock import patch
+
+# Import the module to test
+import discovery
+import printer
+import settings
+
+PRINTER_ANSWER = {
+    discovery.SYS_OBJECT_ID_OID: '1.3.6.1.4.1.11.2.3.9.1',
+    discovery.SYS_NAME_OID: 'prn-2f',
+    discovery.HR_DEVICE_TYPE_OID: discovery.HR_DEVICE_PRINTER,
+    printer.MARKER_LIFE_COUNT_OID: 12345,
+}
+ROUTER_ANSWER = {
+    discovery.SYS_OBJECT_ID_OID: '1.3.6.1.4.1.9.1.1',
+    discovery.SYS_NAME_OID: 'gw',
+    discovery.HR_DEVICE_TYPE_OID: None,
+    printer.MARKER_LIFE_COUNT_OID: None,
+}
+
+def discovery_config(context):
+    config = dict(settings.load_config())
+    config['fleet'] = dict(config.get('fleet') or {}, inventory_file=context.inventory_file)
+    return config
+
+@given('a network {network} where {printer_address} is a printer and {router_address} is a router')
+def step_network(context, network, printer_address, router_address):
+    context.network = network
+    context.inventory_file = os.path.join(context.temp_dir, 'inventory.yaml')
+    answers = {printer_address: PRINTER_ANSWER, router_address: ROUTER_ANSWER}
+
+    async def get(prober, address, communities, oids, port=161, timeout=1, retries=0):
+        # Every other address stays silent
+        if address not in answers:
+            return None
+        return communities[0], answers[address]
+
+    context.get_patch = patch.object(discovery.SnmpProber, 'get', get)
+    context.get_patch.start()
+    context.add_cleanup(context.get_patch.stop)
+
+@given('an inventory where {address} is named "{name}"')
+def step_inventory(context, address, name):
+    context.inventory_file = os.path.join(context.temp_dir, 'inventory.yaml')
+    discovery.write_inventory(context.inventory_file, [
+        {'name': name, 'ip_address': address, 'last_seen': '2020-01-01'}])
+
+@given('an SNMP agent of a printer on {address}')
+def step_snmp_agent(context, address):
+    from pyasn1.codec.ber import decoder, encoder
+    from pysnmp.proto import api
+    from pysnmp.proto.rfc1902 import Integer, ObjectIdentifier, OctetString
+
+    proto = api.protoModules[api.protoVersion2c]
+    values = {
+        discovery.SYS_OBJECT_ID_OID: ObjectIdentifier(PRINTER_ANSWER[discovery.SYS_OBJECT_ID_OID]),
+        printer.SYS_DESCR_OID: OctetString('Test printer'),
+        discovery.SYS_NAME_OID: OctetString(PRINTER_ANSWER[discovery.SYS_NAME_OID]),
+        discovery.HR_DEVICE_TYPE_OID: ObjectIdentifier(discovery.HR_DEVICE_PRINTER),
+        printer.MARKER_LIFE_COUNT_OID: Integer(12345),
+    }
+
+    class Agent(asyncio.DatagramProtocol):
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def datagram_received(self, data, addr):
+            request, _ = decoder.decode(data, asn1Spec=proto.Message())
+            response = proto.apiMessage.getResponse(request)
+            proto.apiPDU.setVarBinds(proto.apiMessage.getPDU(response), [
+                (oid, values[str(oid)])
+                for oid, _ in proto.apiPDU.getVarBinds(proto.apiMessage.getPDU(request))])
+            self.transport.sendto(encoder.encode(response), addr)
+
+    context.agent = Agent
+    context.agent_address = address
+    context.inventory_file = os.path.join(context.temp_dir, 'inventory.yaml')
+
+@when('I sweep the range {network}')
+def step_sweep_address(context, network):
+    async def sweep():
+        loop = asyncio.get_event_loop()
+        transport, _ = await loop.create_datagram_endpoint(context.agent, local_addr=(context.agent_address, 0))
+        try:
+            return await discovery.sweep([network], port=transport.get_extra_info('sockname')[1])
+        finally:
+            transport.close()
+
+    context.found = asyncio.run(sweep())
+
+@when('I sweep the network')
+def step_sweep_network(context):
+    context.found = asyncio.run(discovery.discover(discovery_config(context), [context.network]))
+
+@then('the inventory should list the printer {address} only')
+def step_inventory_lists(context, address):
+    entries = discovery.load_inventory(context.inventory_file)
+    assert [entry['ip_address'] for entry in entries] == [address], f"Unexpected inventory {entries}"
+    assert entries[0]['sys_name'] == 'prn-2f', f"Unexpected sysName {entries[0]['sys_name']}"
+
+@then('the printer should be found with its sysName and sysObjectID')
+def step_printer_found(context):
+    assert len(context.found) == 1, f"Expected one printer, found {context.found}"
+    entry = context.found[0]
+    assert entry['ip_address'] == context.agent_address, entry
+    assert entry['sys_name'] == PRINTER_ANSWER[discovery.SYS_NAME_OID], entry
+    assert entry['sys_object_id'] == PRINTER_ANSWER[discovery.SYS_OBJECT_ID_OID], entry
+    assert entry['description'] == 'Test printer', entry
+
+@then('the inventory should name {address} "{name}"')
+def step_inventory_names(context, address, name):
+    [entry] = [entry for entry in discovery.load_inventory(context.inventory_file) if entry['ip_address'] == address]
+    assert entry['name'] == name, f"Expected name {name}, got {entry['name']}"
+    assert entry['last_seen'] != '2020-01-01', "last_seen was not updated"
+
+@when('the collector loads the printers of a configuration listing {address}')
+def step_load_printers(context, address):
+    config = discovery_config(context)
+    config['csv_file_name'] = os.path.join(context.temp_dir, 'page_counts.csv')
+    config['storage'] = {'backend': 'csv'}
+    config['printers'] = [{'name': 'office', 'ip_address': address}]
+    context.printers = printer.load_printers(config)
+
+@when('the collector loads the printers of a configuration without a printers list')
+def step_load_single_printer(context):
+    config = discovery_config(context)
+    config['printer'] = dict(config['printer'], ip_address='10.1.1.6')
+    config['printers'] = []
+    config['storage'] = {'backend': 'csv'}
+    context.csv_file = os.path.join(context.temp_dir, 'page_counts.csv')
+    with patch('printer.CSV_FILE', context.csv_file):
+        context.printers = printer.load_printers(config)
+
+@then('{address} should keep writing to the configured CSV file')
+def step_keeps_csv_file(context, address):
+    [entry] = [entry for entry in context.printers if entry['ip_address'] == address]
+    assert entry['csv_file'] == context.csv_file, f"Expected {context.csv_file}, got {entry['csv_file']}"
+
+@then('it should poll {first} and {second}')
+def step_polls(context, first, second):
+    addresses = [entry['ip_address'] for entry in context.printers]
+    assert addresses == [first, second], f"Expected {[first, second]}, got {addresses}"
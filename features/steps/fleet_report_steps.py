@@ -0,0 +1,86 @@
+# features/steps/fleet_report_steps.py
+from behave import given, when, then
+import os
+import csv
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Import the module to test
+import analytics
+import fleet_report
+import settings
+from storage import CsvStorage
+
+@given('a fleet of {count:d} printers with page count history')
+def step_fleet_with_history(context, count):
+    context.fleet_dir = os.path.join(context.temp_dir, 'fleet')
+    config = dict(settings.load_config())
+    config['csv_file_name'] = os.path.join(context.temp_dir, 'page_counts.csv')
+    config['printers'] = [{'name': f'printer-{i}', 'ip_address': f'10.1.1.{i + 10}'} for i in range(count)]
+    config['storage'] = {'backend': 'csv'}
+    config['report'] = dict(config['report'], fleet_output_dir=context.fleet_dir)
+    context.fleet_config = config
+    context.printer_names = [entry['name'] for entry in config['printers']]
+
+    start = datetime.now() - timedelta(days=30)
+    for i, name in enumerate(context.printer_names):
+        with open(os.path.join(context.temp_dir, f'page_counts_{name}.csv'), 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            for day in range(30):
+                date = (start + timedelta(days=day)).strftime("%Y-%m-%d")
+                writer.writerow([date, 1000 * (i + 1) + day * 10, 10])
+
+@given('the fleet report has been generated')
+def step_fleet_report_generated(context):
+    fleet_report.generate_fleet_reports(context.fleet_config, workers=2)
+
+@when('printer "{name}" records a new page count')
+def step_printer_records_page_count(context, name):
+    storage = CsvStorage(os.path.join(context.temp_dir, f'page_counts_{name}.csv'))
+    total_page_count, _ = storage.latest()
+    storage.write(datetime.now().strftime("%Y-%m-%d"), total_page_count + 25, 25)
+
+@when('I generate the fleet report with {workers:d} workers')
+def step_generate_fleet_report(context, workers):
+    # The workers are forked with these patches: one computing the analytics
+    # of its own printer fails its report
+    with patch('analytics.fleet_usage_stats', wraps=analytics.fleet_usage_stats) as fleet_usage_stats, \
+         patch('analytics.usage_stats', side_effect=AssertionError("usage_stats called by a worker")):
+        context.written = fleet_report.generate_fleet_reports(context.fleet_config, workers=workers)
+    context.fleet_usage_calls = fleet_usage_stats.call_args_list
+
+@then('a report should be written for every printer')
+def step_report_for_every_printer(context):
+    assert sorted(context.written) == sorted(context.printer_names), \
+        f"Expected reports for {context.printer_names}, got {context.written}"
+    for name in context.printer_names:
+        with open(os.path.join(context.fleet_dir, f'{name}.html'), 'r') as htmlfile:
+            content = htmlfile.read()
+        assert f"Printer Page Count Report - {name}" in content, f"Report of {name} has no title"
+
+@then('only the report of printer "{name}" should be written')
+def step_only_report_written(context, name):
+    assert context.written == [name], f"Expected only {name} to be written, got {context.written}"
+
+@then('the index page should link the report of every printer')
+def step_index_links_reports(context):
+    with open(os.path.join(context.fleet_dir, 'index.html'), 'r') as htmlfile:
+        content = htmlfile.read()
+    for name in context.printer_names:
+        assert f'<a href="{name}.html">{name}</a>' in content, f"Index page does not link {name}"
+
+@then('the usage analytics should have been computed once for {count:d} printers')
+def step_fleet_usage_computed(context, count):
+    assert len(context.fleet_usage_calls) == 1, f"Expected one call, got {len(context.fleet_usage_calls)}"
+    histories = context.fleet_usage_calls[0].args[0]
+    assert len(histories) == count and sorted(histories) == sorted(context.printer_names), \
+        f"Expected the {count} printers of the fleet, got {sorted(histories)}"
+
+@then('the report of every printer should include its usage analytics')
+def step_reports_include_usage(context):
+    assert sorted(context.written) == sorted(context.printer_names), \
+        f"Expected reports for {context.printer_names}, got {context.written}"
+    for name in context.printer_names:
+        with open(os.path.join(context.fleet_dir, f'{name}.html'), 'r') as htmlfile:
+            content = htmlfile.read()
+        assert 'let usageStats = {"moving_averages"' in content, f"Report of {name} has no usage analytics"
@@ -0,0 +1,55 @@
+# features/steps/metrics_steps.py
+from behave import when, then
+import asyncio
+
+# Import the module to test
+import metrics
+
+def find_sample(line_start):
+    """Return the value of the first rendered sample line starting with line_start."""
+    for line in metrics.REGISTRY.render().splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.split()[-1])
+    return None
+
+@then('the metrics should count {count:d} "{outcome}" poll of the printer')
+def step_metrics_poll_count(context, count, outcome):
+    value = find_sample(f'printer_polls_total{{printer="{context.ip_address}",outcome="{outcome}"}}')
+    assert value == count, f"Expected {count} {outcome} poll(s), got {value}"
+
+@then('the metrics should show a page count of {count:d} for the printer')
+def step_metrics_page_count(context, count):
+    value = find_sample(f'printer_page_count{{printer="{context.ip_address}"}}')
+    assert value == count, f"Expected page count {count}, got {value}"
+
+@then('the metrics should count {count:d} fallback of the printer')
+def step_metrics_fallbacks(context, count):
+    value = find_sample(f'printer_fallbacks_total{{printer="{context.ip_address}"}}')
+    assert value == count, f"Expected {count} fallback(s), got {value}"
+
+@when('I request /metrics from the metrics server')
+def step_request_metrics(context):
+    async def fetch():
+        server = await metrics.start_metrics_server('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    context.response = asyncio.run(fetch())
+
+@then('the response should be the metrics in the Prometheus text format')
+def step_metrics_response(context):
+    head, _, body = context.response.partition('\r\n\r\n')
+    assert head.startswith('HTTP/1.0 200'), f"Unexpected response: {head}"
+    assert 'text/plain; version=0.0.4' in head, f"Unexpected content type: {head}"
+    assert '# TYPE printer_snmp_rtt_seconds histogram' in body
+    assert f'printer_snmp_rtt_seconds_bucket{{printer="{context.ip_address}",le="+Inf"}} 1.0' in body, body
+    assert f'printer_polls_total{{printer="{context.ip_address}",outcome="ok"}} 1.0' in body, body
@@ -0,0 +1,82 @@
+# features/steps/missing_dates_steps.py
+from behave import given, when, then
+import os
+import csv
+from datetime import datetime, timedelta
+
+# Import the module to test
+import printer
+
+def date_range(start, end):
+    current = datetime.strptime(start, "%Y-%m-%d")
+    end = datetime.strptime(end, "%Y-%m-%d")
+    while current <= end:
+        yield current.strftime("%Y-%m-%d")
+        current += timedelta(days=1)
+
+def read_rows(context):
+    with open(context.csv_file, 'r') as csvfile:
+        return list(csv.reader(csvfile))
+
+@given('a page count history from {start} to {end} without {skipped}')
+def step_history_with_gap(context, start, end, skipped):
+    context.csv_file = os.path.join(context.temp_dir, 'test_printer_page_counts.csv')
+    with open(context.csv_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        for i, date in enumerate(date_range(start, end)):
+            if date != skipped:
+                writer.writerow([date, 5000 + i * 10, 10])
+    context.original_rows = read_rows(context)
+
+@given('a page count history from {start} to {end}')
+def step_history(context, start, end):
+    step_history_with_gap(context, start, end, None)
+
+@given('{date} has {count:d} samples with a net increase of {increase:d} each')
+def step_several_samples(context, date, count, increase):
+    # Replace the row of date with count samples, as polls during the day write them
+    rows = [row for row in read_rows(context) if row[0] != date]
+    total = int(next(row for row in read_rows(context) if row[0] == date)[1])
+    samples = [[date, total + i * increase, increase] for i in range(count)]
+    index = next(i for i, row in enumerate(rows) if row[0] > date)
+    with open(context.csv_file, 'w', newline='') as csvfile:
+        csv.writer(csvfile).writerows(rows[:index] + samples + rows[index:])
+    context.original_rows = read_rows(context)
+
+@given('the history ends with the partial line "{text}"')
+def step_partial_line(context, text):
+    # An append interrupted before the end of its line
+    with open(context.csv_file, 'a', newline='') as csvfile:
+        csvfile.write(text)
+
+@when('I fill missing dates until {until}')
+def step_fill_until(context, until):
+    printer.fill_missing_dates(context.csv_file, until=until)
+
+@when('I repair the whole history')
+def step_repair(context):
+    printer.fill_missing_dates(context.csv_file, full=True)
+
+@then('the history should contain every day from {start} to {end}')
+def step_every_day(context, start, end):
+    # Days sampled several times have a row per sample
+    dates = list(dict.fromkeys(row[0] for row in read_rows(context)))
+    expected = list(date_range(start, end))
+    assert dates == expected, f"Expected {expected}, got {dates}"
+
+@then('the rows up to {date} should be unchanged')
+def step_rows_unchanged(context, date):
+    rows = read_rows(context)
+    assert rows[:len(context.original_rows)] == context.original_rows, "Existing rows were modified"
+
+@then('the net increase of {date} should be {increase:d}')
+def step_net_increase_of_day(context, date, increase):
+    net_increase = sum(int(row[2]) for row in read_rows(context) if row[0] == date)
+    assert net_increase == increase, f"Expected a net increase of {increase}, got {net_increase}"
+
+@then('{date} should have the page count of {previous_date}')
+def step_filled_page_count(context, date, previous_date):
+    # The last row of a day holds its latest page count
+    rows = {row[0]: row for row in read_rows(context)}
+    assert rows[date][1] == rows[previous_date][1], f"Expected {rows[previous_date][1]}, got {rows[date][1]}"
+    assert rows[date][2] == '0', f"Expected a net increase of 0, got {rows[date][2]}"
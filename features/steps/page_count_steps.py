@@ -3,21 +3,59 @@ from behave import given, when, then
 import asyncio
 import os
 import csv
+import sys
+import types
+from contextlib import contextmanager
 from datetime import datetime
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
 # Import the module to test
 import printer
+import storage
+
+def poll_values(page_count):
+    """Return the sysDescr, sysUpTime and marker life count of a simulated printer."""
+    return dict(zip(printer.POLL_OIDS, ["Printer Description", 12345, page_count]))
+
+@contextmanager
+def pysnmp_asyncio_commands(**commands):
+    """
+    Stand in for pysnmp.hlapi.asyncio while the block runs, with the given
+    commands and mocked transport targets, so that PysnmpTransport sends
+    nothing. Other pysnmp modules are the real ones.
+    """
+    module = types.ModuleType('pysnmp.hlapi.asyncio')
+    module.UdpTransportTarget = MagicMock()
+    module.ContextData = MagicMock()
+    for name, command in commands.items():
+        setattr(module, name, command)
+    real_module = sys.modules.get('pysnmp.hlapi.asyncio')
+    sys.modules['pysnmp.hlapi.asyncio'] = module
+    try:
+        yield
+    finally:
+        if real_module is None:
+            del sys.modules['pysnmp.hlapi.asyncio']
+        else:
+            sys.modules['pysnmp.hlapi.asyncio'] = real_module
+
+def make_poll_var_binds(page_count):
+    """Build the sysDescr, sysUpTime and marker life count var binds of a pysnmp poll response."""
+    values = ["Printer Description", 12345, page_count]
+    var_binds = []
+    for oid, value in zip(printer.POLL_OIDS, values):
+        var_bind = MagicMock()
+        var_bind.__getitem__.side_effect = lambda i, oid=oid, value=value: oid if i == 0 else value
+        var_binds.append(var_bind)
+    return var_binds
 
 @when('I query the printer for its page count')
 def step_query_printer_page_count(context):
-    # Mock the SNMP response for page count
-    with patch('printer.getCmd') as mock_get_cmd:
-        # Configure the mock to return a page count
-        mock_var_bind = MagicMock()
-        mock_var_bind.__getitem__.side_effect = lambda i: mock_var_bind if i == 0 else 5000
-        mock_get_cmd.return_value = (None, 0, 0, [mock_var_bind])
-        
+    context.csv_file = os.path.join(context.temp_dir, 'test_printer_page_counts.csv')
+
+    # The simulated printer answers with a page count
+    context.agent.values.update(poll_values(5000))
+    with patch('printer.CSV_FILE', context.csv_file):
         # Run the page count query function
         asyncio.run(printer.get_printer_page_count(context.ip_address, 'public'))
 
@@ -38,18 +76,25 @@ def step_previous_page_count(context, count):
         mock_read.return_value = (count, yesterday)
         context.mock_read = mock_read
 
+@given('the CSV file ends with a partially written line')
+def step_partial_last_line(context):
+    # Simulate a write that was interrupted before the end of the line
+    with open(context.csv_file, 'a', newline='') as csvfile:
+        csvfile.write(datetime.now().strftime("%Y-%m-%d") + ',46')
+    context.read_from_file = True
+
 @when('I query the printer and receive a page count of {count:d}')
 def step_receive_page_count(context, count):
-    # Mock the SNMP response for page count
-    with patch('printer.getCmd') as mock_get_cmd, \
-         patch('printer.CSV_FILE', context.csv_file), \
-         patch('printer.read_previous_page_count', return_value=(context.previous_count, None)):
-        
-        # Configure the mock to return the specified page count
-        mock_var_bind = MagicMock()
-        mock_var_bind.__getitem__.side_effect = lambda i: mock_var_bind if i == 0 else count
-        mock_get_cmd.return_value = (None, 0, 0, [mock_var_bind])
-        
+    if getattr(context, 'read_from_file', False):
+        # Read the previous page count from the CSV file itself
+        read_patch = patch('printer.read_previous_page_count', wraps=printer.read_previous_page_count)
+    else:
+        read_patch = patch('printer.read_previous_page_count', return_value=(context.previous_count, None))
+
+    # The simulated printer answers with the specified page count
+    context.agent.values.update(poll_values(count))
+    with patch('printer.CSV_FILE', context.csv_file), \
+         read_patch:
         # Run the page count query function
         asyncio.run(printer.get_printer_page_count(context.ip_address, 'public'))
 
@@ -77,4 +122,220 @@ def step_net_increase(context, increase):
         reader = csv.reader(csvfile)
         rows = list(reader)
         assert len(rows) > 0, "No data was written to the CSV file"
-        assert int(rows[-1][2]) == increase, f"Expected net increase of {increase}, got {rows[-1][2]}"
\ No newline at end of file
+        assert int(rows[-1][2]) == increase, f"Expected net increase of {increase}, got {rows[-1][2]}"
+
+@then('every line in the CSV file should be complete')
+def step_csv_lines_complete(context):
+    with open(context.csv_file, 'r') as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert all(len(row) == 3 for row in rows), f"Incomplete rows found: {rows}"
+
+@given('the printer uses SNMPv3 user "{user}" with {auth_protocol} and {priv_protocol}')
+def step_snmpv3_printer(context, user, auth_protocol, priv_protocol):
+    context.snmpv3 = {'user': user, 'auth_protocol': auth_protocol, 'auth_password': 'auth-secret',
+                      'priv_protocol': priv_protocol, 'priv_password': 'priv-secret'}
+
+@when('I query the printer twice')
+def step_query_printer_twice(context):
+    context.csv_file = os.path.join(context.temp_dir, 'test_printer_page_counts.csv')
+    # The credentials are built by the pysnmp transport, whose asyncio commands are mocked
+    mock_get_cmd = AsyncMock(return_value=(None, 0, 0, make_poll_var_binds(5000)))
+    with patch('printer.TRANSPORT', printer.PysnmpTransport()), \
+         pysnmp_asyncio_commands(getCmd=mock_get_cmd), \
+         patch('printer.CSV_FILE', context.csv_file):
+        for _ in range(2):
+            asyncio.run(printer.get_printer_page_count(context.ip_address, 'public',
+                                                       snmpv3=dict(context.snmpv3)))
+        context.auth_data = [call.args[1] for call in mock_get_cmd.call_args_list]
+
+@then('both queries should authenticate as "{user}" with {auth_protocol} and {priv_protocol}')
+def step_check_snmpv3_auth(context, user, auth_protocol, priv_protocol):
+    from pysnmp.hlapi import auth
+
+    first, second = context.auth_data
+    assert first is second, "The credentials should be reused by the second poll"
+    assert first.userName == user, f"Expected user {user}, got {first.userName}"
+    assert first.authProtocol == getattr(auth, auth_protocol), f"Unexpected auth protocol {first.authProtocol}"
+    assert first.privProtocol == getattr(auth, priv_protocol), f"Unexpected priv protocol {first.privProtocol}"
+
+@when('another printer uses SNMPv3 user "{user}" with other passwords')
+def step_conflicting_snmpv3_user(context, user):
+    printer.auth_data('public', context.snmpv3)
+    context.other_snmpv3 = dict(context.snmpv3, user=user, auth_password='other-secret')
+    try:
+        printer.auth_data('public', context.other_snmpv3)
+        context.error = None
+    except ValueError as e:
+        context.error = e
+
+@then('its credentials should be refused until it sets its engine_id')
+def step_conflicting_snmpv3_refused(context):
+    assert context.error is not None, "Conflicting SNMPv3 credentials should raise ValueError"
+    engine_id = '80:00:1f:88:04:70:72:69:6e:74'
+    usm_user = printer.auth_data('public', dict(context.other_snmpv3, engine_id=engine_id))
+    assert usm_user.securityEngineId.asOctets() == bytes.fromhex(engine_id.replace(':', '')), \
+        f"Unexpected engine ID {usm_user.securityEngineId.prettyPrint()}"
+
+@given('a configuration where printers "{first}" and "{second}" use SNMPv3 user "{user}" with other passwords')
+def step_conflicting_snmpv3_config(context, first, second, user):
+    context.printer_config = dict(printer.load_config(), storage={'backend': 'csv'},
+                          csv_file_name=os.path.join(context.temp_dir, 'page_counts.csv'))
+    context.printer_config['fleet'] = dict(context.printer_config.get('fleet') or {}, inventory_file=None)
+    context.printer_config['printers'] = [
+        {'name': first, 'ip_address': '192.0.2.10',
+         'snmpv3': {'user': user, 'auth_password': 'auth-secret', 'priv_password': 'priv-secret'}},
+        {'name': second, 'ip_address': '192.0.2.11',
+         'snmpv3': {'user': user, 'auth_password': 'other-secret', 'priv_password': 'priv-secret'}},
+    ]
+
+@when('the collector loads the printers of the configuration')
+def step_load_configured_printers(context):
+    try:
+        context.printers = printer.load_printers(context.printer_config)
+        context.error = None
+    except ValueError as e:
+        context.error = e
+
+@then('loading the printers should fail for printer "{name}"')
+def step_load_printers_failed(context, name):
+    assert context.error is not None, "Conflicting SNMPv3 credentials should raise ValueError"
+    assert str(context.error).startswith(f"Printer {name}:"), f"Unexpected error: {context.error}"
+
+@then('no SNMPv3 credentials should have been built')
+def step_no_snmpv3_credentials(context):
+    assert not printer._usm_users and not printer._usm_credentials, \
+        "Checking the configuration should not register credentials with the shared engine"
+
+@when('the shared SNMP engine keeps SNMPv3 engines for {lifetime:d} seconds')
+def step_extend_engine_cache(context, lifetime):
+    from pysnmp.entity.engine import SnmpEngine
+    from pysnmp.proto.mpmod.rfc3412 import SnmpV3MessageProcessingModel
+    from pysnmp.proto.secmod.rfc3414.service import SnmpUSMSecurityModel
+
+    engine = SnmpEngine()
+    message_processing = engine.messageProcessingSubsystems[SnmpV3MessageProcessingModel.messageProcessingModelID]
+    usm = engine.securityModels[SnmpUSMSecurityModel.securityModelID]
+    message_processing.receiveTimerTick = MagicMock()
+    usm.receiveTimerTick = MagicMock()
+    context.expiry_ticks = (message_processing.receiveTimerTick, usm.receiveTimerTick)
+    printer.extend_engine_cache(engine, lifetime)
+    for tick in range(9):
+        message_processing.receiveTimerTick(engine, tick)
+        usm.receiveTimerTick(engine, tick)
+
+@then('engine information should only expire on every {every:d}rd timer tick')
+def step_check_engine_cache(context, every):
+    for expiry_tick in context.expiry_ticks:
+        assert expiry_tick.call_count == 9 // every, f"Expected {9 // every} expiries, got {expiry_tick.call_count}"
+
+@given('the printer has the Printer-MIB values')
+def step_printer_mib_values(context):
+    context.agent.values.update({row['oid']: int(row['value']) for row in context.table})
+
+@when('I walk the printer tables {count:d} rows at a time')
+def step_walk_printer_tables(context, count):
+    context.table_values = asyncio.run(printer.walk_printer_tables(context.ip_address, 'public',
+                                                                   max_repetitions=count))
+
+def answer_bulk(context, next_oid):
+    """Make the simulated printer answer every GETBULK with next_oid(oid) of each requested oid."""
+    async def bulk(ip_address, port, oids, max_repetitions, timeout, retries=0,
+                   community_string='public', snmpv3=None):
+        context.transport.requests.append(('bulk', ip_address, port, tuple(oids), timeout))
+        rows = []
+        for _ in range(max_repetitions):
+            oids = [next_oid(oid) for oid in oids]
+            rows.append([(oid, 1) for oid in oids])
+        return None, None, 0, rows
+    context.transport.bulk = bulk
+
+@given('the printer repeats the first row of every table')
+def step_agent_repeats_row(context):
+    columns = set(printer.TABLE_COLUMNS)
+    answer_bulk(context, lambda oid: oid + '.1' if oid in columns else oid)
+
+@given('the printer has a marker table that never ends')
+def step_endless_table(context):
+    answer_bulk(context, lambda oid: oid + '.1')
+
+@when('I try to walk the printer tables')
+def step_try_walk(context):
+    try:
+        asyncio.run(printer.walk_printer_tables(context.ip_address, 'public'))
+        context.error = None
+    except RuntimeError as e:
+        context.error = e
+
+@then('the walk should fail after {count:d} requests')
+def step_walk_failed(context, count):
+    assert context.error is not None, "The walk of an endless table should fail"
+    step_walk_requests(context, count)
+
+@then('the walk should have taken {count:d} request')
+def step_walk_requests(context, count):
+    requests = len(context.transport.requests_to(context.ip_address))
+    assert requests == count, f"Expected {count} requests, got {requests}"
+
+@then('the walk should return {values}')
+def step_check_walk(context, values):
+    expected = {name: int(value) for name, value in (pair.split('=') for pair in values.split())}
+    assert context.table_values == expected, f"Expected {expected}, got {context.table_values}"
+
+@given('every poll interval is shortened by the full jitter')
+def step_shortest_intervals(context):
+    # random.uniform(a, b) always returns a, the shortest delay it may draw
+    context.uniform_patch = patch('printer.random.uniform', side_effect=lambda a, b: a)
+
+@when('I run the daemon with a poll interval of {interval:g} seconds and a jitter of {jitter:g} seconds for {duration:g} seconds')
+def step_run_daemon(context, interval, jitter, duration):
+    context.agent.values.update(poll_values(5000))
+    context.daemon_storage = storage.CsvStorage(os.path.join(context.temp_dir, 'test_printer_page_counts.csv'))
+    printers = [{'name': 'office-2f', 'ip_address': context.ip_address, 'storage': context.daemon_storage}]
+
+    async def run():
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(duration, stop.set)
+        await printer.run_daemon(printers, poll_interval=interval, jitter=jitter, stop=stop)
+
+    uniform_patch = getattr(context, 'uniform_patch', patch('printer.random.uniform', wraps=printer.random.uniform))
+    with uniform_patch, patch.object(printer.logger, 'warning') as warning:
+        asyncio.run(asyncio.wait_for(run(), timeout=duration + 5))
+    context.warnings = [call_args[0][0] for call_args in warning.call_args_list]
+
+@then('the printer should have been polled between {low:d} and {high:d} times')
+def step_polled_times(context, low, high):
+    polls = [request for request in context.transport.requests_to(context.ip_address) if request[0] == 'get']
+    assert low <= len(polls) <= high, f"Expected {low} to {high} polls, got {len(polls)}"
+
+@then('the daemon should have stored the page count')
+def step_daemon_stored(context):
+    page_count, _ = context.daemon_storage.latest()
+    assert page_count == 5000, f"Expected a page count of 5000, got {page_count}"
+
+@then('the daemon should have warned that the jitter is too large')
+def step_jitter_warning(context):
+    assert any('jitter' in message for message in context.warnings), f"No jitter warning in {context.warnings}"
+
+@given('a fleet of {count:d} simulated printers answering in {milliseconds:d} ms')
+def step_simulated_fleet(context, count, milliseconds):
+    context.fleet = []
+    for i in range(count):
+        ip_address = f'10.2.0.{i + 1}'
+        context.transport.add_printer(ip_address, poll_values(5000), latency=milliseconds / 1000)
+        csv_file = os.path.join(context.temp_dir, f'page_counts_printer-{i}.csv')
+        context.fleet.append({'name': f'printer-{i}', 'ip_address': ip_address,
+                              'storage': storage.CsvStorage(csv_file)})
+
+@when('I poll the fleet with at most {max_in_flight:d} printers in flight')
+def step_poll_fleet(context, max_in_flight):
+    context.page_counts = asyncio.run(printer.poll_fleet(context.fleet, max_in_flight))
+
+@then('every printer of the fleet should have a page count of {page_count:d}')
+def step_fleet_page_counts(context, page_count):
+    expected = {entry['name']: page_count for entry in context.fleet}
+    assert context.page_counts == expected, f"Expected {expected}, got {context.page_counts}"
+
+@then('more than 1 and at most {max_in_flight:d} requests should have been in flight at once')
+def step_peak_in_flight(context, max_in_flight):
+    peak = context.transport.peak_in_flight
+    assert 1 < peak <= max_in_flight, f"Expected 2 to {max_in_flight} requests in flight at once, got {peak}"
@@ -2,11 +2,14 @@
 from behave import given, when, then
 import os
 import csv
+import json
+import re
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 
 # Import the module to test
 import generate_html_report
+from storage import CsvStorage
 
 @given('a CSV file with printer page count data')
 def step_csv_with_data(context):
@@ -130,6 +133,193 @@ def step_report_includes_monthly_data(context):
         content = htmlfile.read()
         assert "Monthly Usage" in content or "monthly" in content.lower(), "Monthly usage data not found in report"
 
+@given('the report data has been read once')
+def step_report_data_read_once(context):
+    with patch('generate_html_report.CSV_FILE', context.csv_file):
+        generate_html_report.read_report_data()
+    context.csv_size = os.path.getsize(context.csv_file)
+
+@when('a poll appends a row to the CSV file')
+def step_poll_appends_row(context):
+    storage = CsvStorage(context.csv_file)
+    total_page_count, date = storage.latest()
+    storage.write(date, total_page_count + 40, 40)
+    storage.write(datetime.now().strftime("%Y-%m-%d"), total_page_count + 100, 60)
+
+@when('the CSV file is rewritten with a changed row')
+def step_csv_rewritten(context):
+    storage = CsvStorage(context.csv_file)
+    rows = storage.read_range()
+    date, total_page_count, _ = rows[0]
+    # Same size as before, so only the content tells the change
+    rows[0] = (date, total_page_count, 999)
+    storage.replace_all(rows)
+
+@when('I read the report data again')
+def step_read_report_data_again(context):
+    with patch('generate_html_report.CSV_FILE', context.csv_file), \
+         patch('generate_html_report.read_new_rows', wraps=generate_html_report.read_new_rows) as read_new_rows:
+        context.report_data, context.rollups = generate_html_report.read_report_data()
+    context.parsed_offsets = [call_args[0][1] for call_args in read_new_rows.call_args_list]
+
+@then('only the appended rows should have been parsed')
+def step_only_appended_rows_parsed(context):
+    assert context.parsed_offsets == [context.csv_size], \
+        f"Expected parsing from offset {context.csv_size}, got {context.parsed_offsets}"
+
+@then('the CSV file should have been parsed from the start')
+def step_parsed_from_start(context):
+    assert context.parsed_offsets == [0], f"Expected parsing from offset 0, got {context.parsed_offsets}"
+
+@then('the report data should match a full read of the CSV file')
+def step_report_data_matches_full_read(context):
+    with patch('generate_html_report.CSV_FILE', context.csv_file):
+        data = generate_html_report.read_csv_data()
+    assert context.report_data == data, "Report data differs from a full read of the CSV file"
+    assert context.rollups == generate_html_report.compute_rollups(data), \
+        "Rollups differ from those computed from a full read of the CSV file"
+
+def read_usage_stats(context):
+    """Returns the usage statistics embedded in the HTML report."""
+    with open(context.html_file, 'r') as htmlfile:
+        content = htmlfile.read()
+    match = re.search(r'let usageStats = (.*);\n', content)
+    assert match, "Usage statistics not found in HTML report"
+    return json.loads(match.group(1))
+
+@given('NumPy is not installed')
+def step_numpy_not_installed(context):
+    context.numpy_patch = patch('analytics.load_numpy', return_value=None)
+    context.numpy_patch.start()
+    context.add_cleanup(context.numpy_patch.stop)
+
+@then('the report should include usage analytics')
+def step_report_includes_analytics(context):
+    usage = read_usage_stats(context)
+    for section in ('moving_averages', 'weekday_profile', 'percentiles', 'month_over_month'):
+        assert section in usage, f"{section} not found in usage statistics"
+
+@then('the {window:d}-day moving average in the report should be {pages:d} pages per day')
+def step_moving_average(context, window, pages):
+    averages = read_usage_stats(context)['moving_averages'][f'days_{window}']
+    assert averages[-1] == pages, f"Expected {pages}, got {averages[-1]}"
+
+@then('the median day in the report should be {pages:d} pages')
+def step_median_day(context, pages):
+    median = read_usage_stats(context)['percentiles']['p50']
+    assert median == pages, f"Expected {pages}, got {median}"
+
+@then('the report should not include usage analytics')
+def step_report_without_analytics(context):
+    assert read_usage_stats(context) is None, "Expected no usage statistics without NumPy"
+
+@given('a vendored copy of Chart.js')
+def step_vendored_chart_js(context):
+    vendor_file = os.path.join(context.temp_dir, 'chart.umd.min.js')
+    with open(vendor_file, 'w') as f:
+        f.write('window.Chart = function () {}; /* vendored Chart.js */')
+    context.vendor_patch = patch('generate_html_report.VENDOR_CHART_JS', vendor_file)
+    context.vendor_patch.start()
+    context.add_cleanup(context.vendor_patch.stop)
+
+@given('Chart.js has not been vendored')
+def step_chart_js_missing(context):
+    context.vendor_patch = patch('generate_html_report.VENDOR_CHART_JS',
+                                 os.path.join(context.temp_dir, 'vendor', 'chart.umd.min.js'))
+    context.vendor_patch.start()
+    context.add_cleanup(context.vendor_patch.stop)
+
+@then('no report should be written')
+def step_no_report(context):
+    assert not os.path.exists(context.html_file), "A report that needs the CDN was written"
+    assert not data_files(context), "Data files were written"
+
+@given('a static build of the HTML report has been generated')
+@when('I generate a static build of the HTML report')
+def step_generate_static_build(context):
+    with patch('generate_html_report.CSV_FILE', context.csv_file), \
+         patch('generate_html_report.HTML_FILE', context.html_file):
+        data, rollups = generate_html_report.read_report_data()
+        generate_html_report.write_html_report(data, rollups, static_build=True)
+
+def data_files(context):
+    """Returns the data files of the static builds of the report."""
+    return sorted(name for name in os.listdir(context.temp_dir)
+                  if re.match(r'test_printer_report\.data\.[0-9a-f]{12}\.json$', name))
+
+@then('the report should load its data from a separate file')
+def step_report_loads_data_file(context):
+    with open(context.html_file, 'r') as htmlfile:
+        content = htmlfile.read()
+    [data_file] = data_files(context)
+    assert f'const reportDataUrl = "{data_file}";' in content, "Data file not referenced by the report"
+    assert 'let usageStats = null;' in content, "Expected no data embedded in the report"
+    with open(os.path.join(context.temp_dir, data_file), 'r') as f:
+        report_data = json.load(f)
+    with open(context.csv_file, 'r') as csvfile:
+        dates = [row[0] for row in csv.reader(csvfile)]
+    assert report_data['daily']['labels'] == dates, "Daily data missing from the data file"
+    assert os.path.exists(os.path.join(context.temp_dir, data_file + '.gz')), "Data file not compressed"
+
+@then('the report should not load anything from the internet')
+def step_report_self_contained(context):
+    with open(context.html_file, 'r') as htmlfile:
+        content = htmlfile.read()
+    assert 'vendored Chart.js' in content, "Chart.js not inlined"
+    assert 'https://' not in content, "Report still loads files from the internet"
+
+@then('the compressed copy of the report should match the report')
+def step_compressed_copy(context):
+    import gzip
+
+    with open(context.html_file, 'rb') as htmlfile, gzip.open(context.html_file + '.gz', 'rb') as compressed:
+        assert compressed.read() == htmlfile.read(), "Compressed copy differs from the report"
+
+@then('only the data file of the latest build should remain')
+def step_latest_data_file_only(context):
+    with open(context.html_file, 'r') as htmlfile:
+        content = htmlfile.read()
+    files = data_files(context)
+    assert len(files) == 1 and files[0] in content, f"Expected only the latest data file, found {files}"
+    copies = [name for name in os.listdir(context.temp_dir)
+              if name.startswith('test_printer_report.data.') and not name.startswith(files[0])]
+    assert not copies, f"Compressed copies of earlier data files left: {copies}"
+    with open(os.path.join(context.temp_dir, files[0]), 'r') as f:
+        assert json.load(f)['daily']['labels'][-1] == datetime.now().strftime("%Y-%m-%d"), \
+            "Data file does not include the appended row"
+
+@given('printer page count data of {pages:d} pages a day from {start} to {end}')
+def step_report_data_range(context, pages, start, end):
+    day = datetime.strptime(start, "%Y-%m-%d")
+    rows = []
+    while day <= datetime.strptime(end, "%Y-%m-%d"):
+        rows.append((day.strftime("%Y-%m-%d"), 5000 + (len(rows) + 1) * pages, pages))
+        day += timedelta(days=1)
+    context.report_data = []
+    generate_html_report.fold_rows(context.report_data, {}, rows)
+
+@when('I compute the rollups of the report data')
+def step_compute_rollups(context):
+    context.series = generate_html_report.compute_rollups(context.report_data)
+
+@when('I build the chart data with at most {max_points:d} points per chart')
+def step_build_chart_data(context, max_points):
+    context.series = generate_html_report.build_chart_data(context.report_data, max_points)
+
+@then('the {period} rollup should be')
+@then('the {period} chart should be')
+def step_series_should_be(context, period):
+    series = context.series[period]
+    actual = list(zip(series['labels'], series['net_increase'], series['total_page_count']))
+    expected = [(row['label'], int(row['net_increase']), int(row['total_page_count'])) for row in context.table]
+    assert actual == expected, f"Expected {expected}, got {actual}"
+
+@then('the {period} chart should merge {size:d} point per bucket')
+@then('the {period} chart should merge {size:d} points per bucket')
+def step_bucket_size(context, period, size):
+    bucket_size = context.series[period]['bucket_size']
+    assert bucket_size == size, f"Expected {size} points per bucket, got {bucket_size}"
+
 # Cleanup after each scenario
 def after_scenario(context, scenario):
     # Stop any active patches
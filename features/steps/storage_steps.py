@@ -0,0 +1,200 @@
+# features/steps/storage_steps.py
+from behave import given, when, then
+import asyncio
+import os
+import csv
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Import the module to test
+import printer
+import storage
+from writer import BatchWriter
+
+def open_test_storage(context, printer_id):
+    """Open the storage of printer_id in the scenario's CSV directory, partition directory or SQLite database."""
+    backend = getattr(context, 'backend', 'SQLite')
+    if backend == 'CSV':
+        return storage.CsvStorage(os.path.join(context.temp_dir, f'{printer_id}.csv'))
+    if backend == 'Partitioned':
+        return storage.PartitionedCsvStorage(context.partition_dir, printer_id)
+    return storage.SqliteStorage(context.db_file, printer_id)
+
+@given('an empty SQLite page count database')
+def step_empty_sqlite(context):
+    context.db_file = os.path.join(context.temp_dir, 'test_printer_page_counts.db')
+
+@when('printer "{printer_id}" records a page count of {count:d} on {date}')
+def step_record_page_count(context, printer_id, count, date):
+    store = storage.SqliteStorage(context.db_file, printer_id)
+    previous_count, _ = store.latest()
+    store.write(date, count, count - previous_count)
+
+@when('printer "{printer_id}" records a page count of {count:d} with a net increase of {increase:d} on {date}')
+def step_record_page_count_increase(context, printer_id, count, increase, date):
+    storage.SqliteStorage(context.db_file, printer_id).write(date, count, increase)
+
+@then('the latest page count of printer "{printer_id}" should be {count:d} on {date}')
+def step_latest_page_count(context, printer_id, count, date):
+    latest = open_test_storage(context, printer_id).latest()
+    assert latest == (count, date), f"Expected {(count, date)}, got {latest}"
+
+@then('printer "{printer_id}" should have 1 row with a page count of {count:d} and a net increase of {increase:d}')
+def step_single_row(context, printer_id, count, increase):
+    rows = storage.SqliteStorage(context.db_file, printer_id).read_range()
+    assert len(rows) == 1, f"Expected 1 row, got {rows}"
+    assert rows[0][1:] == (count, increase), f"Expected {(count, increase)}, got {rows[0][1:]}"
+
+@given('a CSV file with page counts for {days:d} days')
+def step_csv_history(context, days):
+    context.csv_file = os.path.join(context.temp_dir, 'test_printer_page_counts.csv')
+    context.db_file = os.path.join(context.temp_dir, 'test_printer_page_counts.db')
+    start = datetime(2025, 3, 1)
+    with open(context.csv_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        for i in range(days):
+            writer.writerow([(start + timedelta(days=i)).strftime("%Y-%m-%d"), 5000 + i * 10, 10])
+
+@given('the CSV file holds a row with only "{short_row}" and ends with "{partial_line}"')
+def step_incomplete_rows(context, short_row, partial_line):
+    with open(context.csv_file, 'r') as csvfile:
+        lines = csvfile.read().splitlines(keepends=True)
+    # A row missing its net increase, and an append interrupted before the end of its line
+    lines.insert(len(lines) // 2, short_row + '\n')
+    with open(context.csv_file, 'w', newline='') as csvfile:
+        csvfile.write(''.join(lines) + partial_line)
+
+@when('I read the whole history of the CSV file')
+def step_read_whole_history(context):
+    context.rows = storage.CsvStorage(context.csv_file).read_range()
+
+@when('I migrate the CSV file into SQLite for printer "{printer_id}"')
+def step_migrate(context, printer_id):
+    storage.migrate_csv_to_sqlite(context.csv_file, context.db_file, printer_id)
+
+@then('printer "{printer_id}" should have the same history in SQLite')
+def step_same_history(context, printer_id):
+    expected = storage.CsvStorage(context.csv_file).read_range()
+    actual = storage.SqliteStorage(context.db_file, printer_id).read_range()
+    assert actual == expected, f"Expected {expected}, got {actual}"
+
+@given('an empty {backend} page count storage')
+def step_empty_storage(context, backend):
+    context.backend = backend
+    context.db_file = os.path.join(context.temp_dir, 'test_printer_page_counts.db')
+    context.partition_dir = os.path.join(context.temp_dir, 'page_counts')
+
+@when('printer "{first}" and printer "{second}" queue page counts of {first_count:d} and {second_count:d} on {date} through the batch writer')
+def step_queue_page_counts(context, first, second, first_count, second_count, date):
+    async def sweep():
+        writer = BatchWriter()
+        writer.start()
+        queued = {printer_id: writer.wrap(open_test_storage(context, printer_id)) for printer_id in (first, second)}
+        queued[first].write(date, first_count, first_count)
+        queued[second].write(date, second_count, second_count)
+        # Nothing has been written yet: the writer task has not run
+        context.latest_before_flush = {printer_id: store.latest() for printer_id, store in queued.items()}
+        context.stored_before_flush = {printer_id: store.storage.latest() for printer_id, store in queued.items()}
+        context.expected_latest = {first: (first_count, date), second: (second_count, date)}
+        await writer.close()
+
+    asyncio.run(sweep())
+
+@then('the queued page counts should be visible before they are written')
+def step_queued_visible(context):
+    assert context.latest_before_flush == context.expected_latest, \
+        f"Expected {context.expected_latest}, got {context.latest_before_flush}"
+    for printer_id, latest in context.stored_before_flush.items():
+        assert latest == (0, None), f"Printer {printer_id} was written before the writer ran: {latest}"
+
+@when('printer "{printer_id}" queues {metric} = {value:d} on {date} through the batch writer')
+def step_queue_metrics(context, printer_id, metric, value, date):
+    async def sweep():
+        writer = BatchWriter()
+        writer.start()
+        queued = writer.wrap(open_test_storage(context, printer_id))
+        queued.write_metrics(date, {metric: value})
+        # Nothing has been written yet: the writer task has not run
+        context.metrics_before_flush = queued.storage.read_metrics()
+        await writer.close()
+
+    asyncio.run(sweep())
+
+@then('the queued values should only be written by the batch writer')
+def step_queued_metrics_deferred(context):
+    assert context.metrics_before_flush == [], \
+        f"Values were written on the event loop: {context.metrics_before_flush}"
+
+@then('printer "{printer_id}" should have {metric} = {value:d} on {date}')
+def step_stored_metrics(context, printer_id, metric, value, date):
+    rows = open_test_storage(context, printer_id).read_metrics()
+    assert rows == [(date, metric, value)], f"Expected {[(date, metric, value)]}, got {rows}"
+
+@given('page counts stored in monthly files from {start} to {end}')
+def step_partitioned_history(context, start, end):
+    context.partition_dir = os.path.join(context.temp_dir, 'page_counts')
+    context.partitioned = storage.PartitionedCsvStorage(context.partition_dir, 'office-2f')
+    day = datetime.strptime(start, "%Y-%m-%d")
+    rows = []
+    while day <= datetime.strptime(end, "%Y-%m-%d"):
+        rows.append((day.strftime("%Y-%m-%d"), 5000 + len(rows) * 10, 10))
+        day += timedelta(days=1)
+    context.partitioned.write_many(rows)
+
+@given('the page count of {date} is missing')
+def step_page_count_missing(context, date):
+    shard = storage.CsvStorage(context.partitioned.shard_file(date[:7]))
+    shard.replace_all([row for row in shard.read_range() if row[0] != date])
+
+@when('I read the page counts from {start} to {end}')
+def step_read_partitioned_range(context, start, end):
+    with patch.object(storage.CsvStorage, 'read_range', autospec=True,
+                      side_effect=storage.CsvStorage.read_range) as read_range:
+        context.rows = context.partitioned.read_range(start, end)
+    context.files_read = [call_args[0][0].csv_file for call_args in read_range.call_args_list]
+
+@then('I should get the {count:d} page counts from {start} to {end}')
+def step_partitioned_rows(context, count, start, end):
+    dates = [row[0] for row in context.rows]
+    assert len(dates) == count, f"Expected {count} rows, got {dates}"
+    assert dates[0] == start and dates[-1] == end, f"Expected {start} to {end}, got {dates[0]} to {dates[-1]}"
+
+@then('only the file of {month} should have been read')
+def step_only_month_read(context, month):
+    expected = [context.partitioned.shard_file(month)]
+    assert context.files_read == expected, f"Expected {expected} to be read, got {context.files_read}"
+
+@when('I split the CSV file into monthly files for printer "{printer_id}"')
+def step_split_csv(context, printer_id):
+    context.partition_dir = os.path.join(context.temp_dir, 'page_counts')
+    storage.migrate_csv_to_partitions(context.csv_file, context.partition_dir, printer_id)
+
+@then('printer "{printer_id}" should have {count:d} monthly files')
+def step_monthly_files(context, printer_id, count):
+    partitioned = storage.PartitionedCsvStorage(context.partition_dir, printer_id)
+    months = partitioned.months()
+    assert len(months) == count, f"Expected {count} months, got {months}"
+    for month in months:
+        assert os.path.exists(partitioned.shard_file(month)), f"Missing file for {month}"
+
+@then('printer "{printer_id}" should have the same history in its monthly files')
+def step_same_partitioned_history(context, printer_id):
+    expected = storage.CsvStorage(context.csv_file).read_range()
+    actual = storage.PartitionedCsvStorage(context.partition_dir, printer_id).read_range()
+    assert actual == expected, f"Expected {expected}, got {actual}"
+
+@when('I repair the history of the monthly files')
+def step_repair_partitioned(context):
+    partitioned = context.partitioned
+    context.inodes = {month: os.stat(partitioned.shard_file(month)).st_ino for month in partitioned.months()}
+    printer.fill_missing_dates(partitioned, full=True)
+
+@then('the page count of {date} should be filled')
+def step_page_count_filled(context, date):
+    assert context.partitioned.has_date(date), f"{date} was not filled"
+
+@then('only the file of {month} should have been rewritten')
+def step_only_month_rewritten(context, month):
+    partitioned = context.partitioned
+    rewritten = [m for m, inode in context.inodes.items() if os.stat(partitioned.shard_file(m)).st_ino != inode]
+    assert rewritten == [month], f"Expected only {month} to be rewritten, got {rewritten}"
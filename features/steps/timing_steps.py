@@ -0,0 +1,40 @@
+# features/steps/timing_steps.py
+from behave import given, when, then
+import io
+import os
+import pstats
+
+# Import the module to test
+import generate_html_report
+import timing
+
+@then('the timing summary should count {count:d} span of {stages}')
+def step_timing_summary(context, count, stages):
+    summary = timing.summary()
+    for stage in stages.replace(' and ', ', ').split(', '):
+        assert stage in summary, f"No span of {stage} in {sorted(summary)}"
+        assert summary[stage]['count'] == count, f"Expected {count} span(s) of {stage}, got {summary[stage]}"
+
+@given('the logs are written to a temporary directory')
+def step_logs_directory(context):
+    context.log_dir = os.path.join(context.temp_dir, 'logs')
+    context.timing_config = {'logging': {'directory': context.log_dir}}
+
+@when('I profile the generation of a report')
+def step_profile_report(context):
+    data = []
+    generate_html_report.fold_rows(data, {}, [('2025-01-01', 1000, 10), ('2025-01-02', 1020, 20)])
+    profiler = timing.start_profiling()
+    generate_html_report.render_template(generate_html_report.load_template(), data, io.StringIO())
+    context.profile_file = timing.stop_profiling(profiler, 'generate_html_report', context.timing_config)
+
+@then('a profile of {name} should be written to the logs directory')
+def step_profile_written(context, name):
+    assert os.path.dirname(context.profile_file) == context.log_dir, f"Profile written to {context.profile_file}"
+    assert os.path.basename(context.profile_file).startswith(name + '-'), f"Unexpected name {context.profile_file}"
+    assert os.path.getsize(context.profile_file) > 0, "The profile is empty"
+
+@then('it should include {function}')
+def step_profile_includes(context, function):
+    functions = [name for _, _, name in pstats.Stats(context.profile_file).stats]
+    assert function in functions, f"{function} is not in the profile"
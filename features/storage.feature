@@ -0,0 +1,73 @@
+Feature: Page Count Storage
+  As a system administrator
+  I want to keep the page count history of a fleet in SQLite or monthly files
+  So that lookups stay fast as the history grows
+
+  Scenario: Store page counts for several printers in SQLite
+    Given an empty SQLite page count database
+    When printer "office-2f" records a page count of 5000 on 2025-03-01
+    And printer "office-3f" records a page count of 7000 on 2025-03-01
+    And printer "office-2f" records a page count of 5100 on 2025-03-02
+    Then the latest page count of printer "office-2f" should be 5100 on 2025-03-02
+    And the latest page count of printer "office-3f" should be 7000 on 2025-03-01
+
+  Scenario: Record the same date twice in SQLite
+    Given an empty SQLite page count database
+    When printer "office-2f" records a page count of 5000 with a net increase of 20 on 2025-03-01
+    And printer "office-2f" records a page count of 5030 with a net increase of 30 on 2025-03-01
+    Then printer "office-2f" should have 1 row with a page count of 5030 and a net increase of 50
+
+  Scenario: Migrate CSV history into SQLite
+    Given a CSV file with page counts for 10 days
+    When I migrate the CSV file into SQLite for printer "office-2f"
+    Then printer "office-2f" should have the same history in SQLite
+
+  Scenario Outline: Write the page counts of a sweep in batches
+    Given an empty <backend> page count storage
+    When printer "office-2f" and printer "office-3f" queue page counts of 5000 and 7000 on 2025-03-01 through the batch writer
+    Then the queued page counts should be visible before they are written
+    And the latest page count of printer "office-2f" should be 5000 on 2025-03-01
+    And the latest page count of printer "office-3f" should be 7000 on 2025-03-01
+
+    Examples:
+      | backend     |
+      | CSV         |
+      | SQLite      |
+      | Partitioned |
+
+  Scenario Outline: Write the Printer-MIB values of a sweep through the batch writer
+    Given an empty <backend> page count storage
+    When printer "office-2f" queues supply_level.1.1 = 40 on 2025-03-01 through the batch writer
+    Then the queued values should only be written by the batch writer
+    And printer "office-2f" should have supply_level.1.1 = 40 on 2025-03-01
+
+    Examples:
+      | backend     |
+      | CSV         |
+      | SQLite      |
+      | Partitioned |
+
+  Scenario: Skip incomplete rows when reading the whole history
+    Given a CSV file with page counts for 5 days
+    And the CSV file holds a row with only "2025-03-03,5020" and ends with "2025-03-0"
+    When I read the whole history of the CSV file
+    Then I should get the 5 page counts from 2025-03-01 to 2025-03-05
+
+  Scenario: Read a date range from monthly files
+    Given page counts stored in monthly files from 2025-02-01 to 2025-04-30
+    When I read the page counts from 2025-03-10 to 2025-03-20
+    Then I should get the 11 page counts from 2025-03-10 to 2025-03-20
+    And only the file of 2025-03 should have been read
+
+  Scenario: Split a CSV file into monthly files
+    Given a CSV file with page counts for 45 days
+    When I split the CSV file into monthly files for printer "office-2f"
+    Then printer "office-2f" should have 2 monthly files
+    And printer "office-2f" should have the same history in its monthly files
+
+  Scenario: Repair a gap by rewriting only its month
+    Given page counts stored in monthly files from 2025-02-01 to 2025-04-30
+    And the page count of 2025-03-15 is missing
+    When I repair the history of the monthly files
+    Then the page count of 2025-03-15 should be filled
+    And only the file of 2025-03 should have been rewritten
@@ -0,0 +1,15 @@
+Feature: Stage Timings
+  As a system administrator
+  I want to know where the time of a slow run goes
+  So that I can tell the network, the storage and the report apart
+
+  Scenario: Time the stages of a poll
+    Given a printer with IP address 192.168.1.100
+    When I query the printer for its page count
+    Then the timing summary should count 1 span of snmp_get, read_previous_page_count and write_page_count
+
+  Scenario: Profile a run with cProfile
+    Given the logs are written to a temporary directory
+    When I profile the generation of a report
+    Then a profile of generate_html_report should be written to the logs directory
+    And it should include render_template
@@ -0,0 +1,248 @@
+import html
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+import analytics
+import generate_html_report
+from atomic_file import write_file_atomically
+import storage as storage_module
+from settings import load_config, script_dir
+
+logger = logging.getLogger('report_logger')
+
+# Page listing the printers of the fleet, with {printer_rows} and {generated_at} slots
+INDEX_TEMPLATE_FILE = os.path.join(script_dir, 'templates', 'fleet_index_template.html')
+INDEX_FILE_NAME = 'index.html'
+# Inputs of the reports written so far, kept in the fleet output directory
+STATE_FILE_NAME = '.fleet-report-state.json'
+STATE_VERSION = 1
+
+# Template of the report, parsed once per worker process by init_worker
+_worker_segments = None
+_worker_static_build = False
+
+
+def fleet_output_dir(config):
+    """Return the directory of the fleet reports, `report.fleet_output_dir`."""
+    report_config = config['report']
+    return os.path.join(script_dir, report_config.get('fleet_output_dir', 'reports/fleet'))
+
+
+def report_file_name(printer_name):
+    """Return the file name of the report of printer_name."""
+    return f"{str(printer_name).replace(os.sep, '_')}.html"
+
+
+def file_fingerprint(path):
+    """Return [size, mtime] of path, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_state(output_dir):
+    """Return the state saved by the last run, or an empty one."""
+    try:
+        with open(os.path.join(output_dir, STATE_FILE_NAME), 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state if state.get('version') == STATE_VERSION else {}
+
+
+def save_state(output_dir, state):
+    state = dict(state, version=STATE_VERSION)
+    write_file_atomically(
+        os.path.join(output_dir, STATE_FILE_NAME), lambda f: f.write(json.dumps(state)))
+
+
+def init_worker(template_file, max_chart_points, static_build=False):
+    """
+    Set up a worker process: parse the report template once for all the
+    printers it renders, and drop SQLite connections inherited from the parent.
+    """
+    global _worker_segments, _worker_static_build
+    storage_module.reset_connections()
+    generate_html_report.TEMPLATE_FILE = template_file
+    generate_html_report.MAX_CHART_POINTS = max_chart_points
+    _worker_segments = generate_html_report.load_template()
+    if static_build:
+        _worker_segments = generate_html_report.make_self_contained(_worker_segments)
+    _worker_static_build = static_build
+
+
+def summarize(printer_name, data, file_name):
+    """Return the row of the index page for a printer with the daily data."""
+    last = data[-1]
+    month_ago = (date.fromisoformat(last['date']) - timedelta(days=30)).isoformat()
+    return {
+        'name': printer_name,
+        'file': file_name,
+        'first_date': data[0]['date'],
+        'last_date': last['date'],
+        'total_page_count': last['total_page_count'],
+        'last_30_days': sum(item['net_increase'] for item in data if item['date'] > month_ago),
+    }
+
+
+def fleet_usage(jobs):
+    """
+    Return the usage statistics of the printers of jobs by name, computed for
+    all of them at once by analytics.fleet_usage_stats, or {} when NumPy is
+    not installed.
+    """
+    if not analytics.is_available():
+        return {}
+    histories = {}
+    for name, storage, _, _ in jobs:
+        data, _ = generate_html_report.read_report_data(storage)
+        if data:
+            histories[name] = data
+    return analytics.fleet_usage_stats(histories) if histories else {}
+
+
+def render_printer_report(printer_name, storage, html_file, usage=None):
+    """
+    Runs in a worker: reads the history of one printer and writes its report
+    to html_file, with the usage statistics computed for the fleet (see
+    fleet_usage). Returns its row of the index page, or None without data.
+    """
+    data, rollups = generate_html_report.read_report_data(storage)
+    if not data:
+        return None
+    title = f"{generate_html_report.REPORT_TITLE} - {printer_name}"
+    generate_html_report.write_report_files(html_file, _worker_segments, data, rollups, usage, title=title,
+                                            static_build=_worker_static_build)
+    return summarize(printer_name, data, os.path.basename(html_file))
+
+
+def iter_index_rows(printers, summaries):
+    for printer in printers:
+        summary = summaries.get(str(printer['name']))
+        name = html.escape(str(printer['name']))
+        if summary is None:
+            yield f"""
+                <tr>
+                    <td>{name}</td>
+                    <td colspan="4">No data</td>
+                </tr>
+            """
+            continue
+        yield f"""
+                <tr>
+                    <td><a href="{html.escape(summary['file'])}">{name}</a></td>
+                    <td>{summary['first_date']}</td>
+                    <td>{summary['last_date']}</td>
+                    <td>{summary['total_page_count']}</td>
+                    <td>{summary['last_30_days']}</td>
+                </tr>
+            """
+
+
+def write_index(output_dir, printers, summaries, static_build=False):
+    """Write the index page linking the report of every printer."""
+    with open(INDEX_TEMPLATE_FILE, 'r') as f:
+        template = f.read()
+    if static_build:
+        [(_, template)] = generate_html_report.make_self_contained([(None, template)])
+    page = template.replace('{generated_at}', datetime.now().strftime('%Y-%m-%d %H:%M'))
+    page = page.replace('{printer_rows}', ''.join(iter_index_rows(printers, summaries)))
+    index_file = os.path.join(output_dir, INDEX_FILE_NAME)
+    write_file_atomically(index_file, lambda f: f.write(page))
+    if static_build:
+        generate_html_report.write_compressed_copies(index_file)
+
+
+def generate_fleet_reports(config=None, workers=None, force=False, static_build=False):
+    """
+    Write the report of every printer of the fleet (see printer.load_printers)
+    and an index page linking them into `report.fleet_output_dir`.
+
+    Reports are rendered by a pool of `workers` processes (`report.workers`,
+    or one per CPU). A printer whose history and the template have not
+    changed since its last report is skipped unless force is set; every page
+    replaces the previous one atomically. static_build writes them as
+    generate_html_report.write_report_files does. The usage statistics of
+    the printers to render are computed once for all of them, see fleet_usage.
+    Returns the names of the printers whose report was written.
+    """
+    from printer import load_printers
+
+    config = config or load_config()
+    report_config = config['report']
+    try:
+        printers = load_printers(config)
+    except ValueError as e:
+        error_msg = f"Error: {e}"
+        logger.error(error_msg)
+        print(error_msg)
+        return []
+    output_dir = fleet_output_dir(config)
+    os.makedirs(output_dir, exist_ok=True)
+
+    template_file = generate_html_report.TEMPLATE_FILE or os.path.join(script_dir, report_config['template'])
+    max_chart_points = generate_html_report.MAX_CHART_POINTS or report_config.get('max_chart_points', 400)
+    if not os.path.exists(template_file):
+        error_msg = f"Error: Template file '{template_file}' not found."
+        logger.error(error_msg)
+        print(error_msg)
+        return []
+    if static_build:
+        # Checked before the workers start, which would each fail on it
+        try:
+            generate_html_report.read_vendor_chart_js()
+        except FileNotFoundError as e:
+            error_msg = f"Error: {e}"
+            logger.error(error_msg)
+            print(error_msg)
+            return []
+    # A new template or chart size makes every report stale
+    settings_fingerprint = [file_fingerprint(template_file), max_chart_points, bool(static_build)]
+    state = load_state(output_dir)
+    previous_reports = state.get('reports', {}) if state.get('settings') == settings_fingerprint else {}
+
+    reports = {}
+    jobs = []
+    for printer in printers:
+        name = str(printer['name'])
+        html_file = os.path.join(output_dir, report_file_name(name))
+        fingerprint = printer['storage'].fingerprint()
+        previous = previous_reports.get(name)
+        if (not force and previous and previous['input'] == fingerprint
+                and (previous['summary'] is None or os.path.exists(html_file))):
+            reports[name] = previous
+        else:
+            jobs.append((name, printer['storage'], html_file, fingerprint))
+
+    written = []
+    if jobs:
+        usage = fleet_usage(jobs)
+        workers = min(workers or report_config.get('workers') or os.cpu_count() or 1, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(template_file, max_chart_points, static_build)) as pool:
+            futures = {pool.submit(render_printer_report, name, storage, html_file, usage.get(name)):
+                       (name, fingerprint)
+                       for name, storage, html_file, fingerprint in jobs}
+            for future in as_completed(futures):
+                name, fingerprint = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to generate the report of printer {name}: {e}")
+                    continue
+                reports[name] = {'input': fingerprint, 'summary': summary}
+                written.append(name)
+
+    write_index(output_dir, printers,
+                {name: report['summary'] for name, report in reports.items()}, static_build)
+    save_state(output_dir, {'settings': settings_fingerprint, 'reports': reports})
+    message = (f"Fleet report written to '{os.path.join(output_dir, INDEX_FILE_NAME)}': "
+               f"{len(written)} printer report(s) updated, {len(printers) - len(jobs)} unchanged")
+    logger.info(message)
+    print(message)
+    return written
@@ -1,87 +1,344 @@
+import argparse
 import csv
-import yaml  # Change from json to yaml
+import gzip
+import hashlib
+import html
+import io
+import json
+import re
 import logging
 import os
-from datetime import datetime
-from logging.handlers import TimedRotatingFileHandler
+from datetime import date
+
+import analytics
+import settings
+import timing
+from atomic_file import write_file_atomically
+from settings import load_config, setup_logging
+from storage import CsvStorage, open_storage
 
 # Get the directory containing the script
 script_dir = os.path.dirname(os.path.abspath(__file__))
-# Construct absolute path to config file
-config_path = os.path.join(script_dir, 'config.yaml')  # Change from config.json to config.yaml
-
-# Load configuration
-with open(config_path, 'r') as f:
-    config = yaml.safe_load(f)  # Change from json.load to yaml.safe_load
-
-# Configure logging
-if config['logging']['enabled']:
-    # Create logs directory if it doesn't exist
-    log_dir = os.path.join(script_dir, config['logging']['directory'])
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # Configure the logger
-    logger = logging.getLogger('report_logger')
-    logger.setLevel(getattr(logging, config['logging']['level']))
-    
-    # Create a timed rotating file handler
-    log_file = os.path.join(log_dir, 'report.log')
-    handler = TimedRotatingFileHandler(
-        log_file,
-        when='midnight',
-        interval=1,
-        backupCount=config['logging']['max_days']
-    )
-    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(handler)
-
-# Construct absolute paths for all files
-CSV_FILE = os.path.join(script_dir, config['csv_file_name'])
-HTML_FILE = os.path.join(script_dir, config['report']['output_dir'], config['report']['output_file'])
-TEMPLATE_FILE = os.path.join(script_dir, config['report']['template'])
-
-def read_csv_data():
-    """Reads data from the CSV file and returns a list of dictionaries."""
-    data = {}
+
+# Input, template and output files. None means the value in config.yaml, read
+# on first use; set them to override it (tests do).
+CSV_FILE = None
+HTML_FILE = None
+TEMPLATE_FILE = None
+
+# Most points drawn per chart; longer series are merged into buckets.
+# None means `report.max_chart_points` (400 if not set).
+MAX_CHART_POINTS = None
+
+# Handlers are attached by setup_logging(), so importing this module has no side effects
+logger = logging.getLogger('report_logger')
+
+def csv_file_path():
+    """Returns CSV_FILE, or the CSV file in the configuration when not set."""
+    return CSV_FILE or settings.csv_file()
+
+def html_file_path():
+    """Returns HTML_FILE, or the report file in the configuration when not set."""
+    if HTML_FILE:
+        return HTML_FILE
+    report_config = load_config()['report']
+    return os.path.join(script_dir, report_config['output_dir'], report_config['output_file'])
+
+def template_file_path():
+    """Returns TEMPLATE_FILE, or the template in the configuration when not set."""
+    return TEMPLATE_FILE or os.path.join(script_dir, load_config()['report']['template'])
+
+def fold_rows(data, positions, rows):
+    """
+    Adds (date, total_page_count, net_increase) rows to the list data, where
+    positions maps every date in data to its index. A row for a date already
+    in data adds its net increase and replaces the total page count.
+    Returns the index of the first item changed or added.
+    """
+    first_changed = len(data)
+    for day, total_page_count, net_increase in rows:
+        i = positions.get(day)
+        if i is None:
+            positions[day] = len(data)
+            data.append({
+                'date': day,
+                'total_page_count': total_page_count,
+                'net_increase': net_increase
+            })
+        else:
+            data[i]['net_increase'] += net_increase
+            data[i]['total_page_count'] = total_page_count  # Keep the latest total_page_count
+            first_changed = min(first_changed, i)
+    return first_changed
+
+def read_csv_data(start_date=None, end_date=None, storage=None):
+    """
+    Reads page count data (from CSV_FILE by default) and returns a list of dictionaries.
+    When start_date or end_date is given, only rows in that range (inclusive)
+    are read, using the date index of the CSV file or the SQLite primary key.
+    """
+    if storage is None:
+        storage = CsvStorage(csv_file_path())
     try:
-        with open(CSV_FILE, 'r') as csvfile:
-            reader = csv.reader(csvfile)
-            header = next(reader)  # Skip the header row
-            for row in reader:
-                date, total_page_count, net_increase = row
-                date = str(date)  # Ensure date is treated as a string
-                net_increase = int(net_increase)
-                if date in data:
-                    data[date]['net_increase'] += net_increase
-                    data[date]['total_page_count'] = int(total_page_count)  # Keep the latest total_page_count
-                else:
-                    data[date] = {
-                        'date': date,
-                        'total_page_count': int(total_page_count),
-                        'net_increase': net_increase
-                    }
+        rows = storage.read_range(start_date, end_date)
     except FileNotFoundError:
-        error_msg = f"Error: CSV file '{CSV_FILE}' not found."
+        error_msg = f"Error: CSV file '{csv_file_path()}' not found."
         logger.error(error_msg)
         print(error_msg)
         return None
-    
-    # Convert the dictionary to a list of dictionaries
-    return list(data.values())
 
-def generate_html_table(data):
-    """Generates an HTML table with a bar chart and data switching from the given data."""
-    if not data:
-        return "<p>No data available.</p>"
+    data = []
+    fold_rows(data, {}, rows)
+    return data
+
+# Rollup periods shown in the report, with the key that groups a date into its period
+ROLLUP_PERIODS = {
+    'daily': lambda day: day.isoformat(),
+    'weekly': lambda day: '%d-W%02d' % day.isocalendar()[:2],
+    'monthly': lambda day: day.strftime('%Y-%m'),
+    'yearly': lambda day: day.strftime('%Y'),
+}
+
+def empty_rollups():
+    """Returns one empty series per period in ROLLUP_PERIODS."""
+    return {period: {'labels': [], 'net_increase': [], 'total_page_count': []}
+            for period in ROLLUP_PERIODS}
+
+def fold_into_series(series, period_key, days, items):
+    """Adds items (with their dates parsed in days) to the end of series."""
+    for day, item in zip(days, items):
+        label = period_key(day)
+        if series['labels'] and series['labels'][-1] == label:
+            series['net_increase'][-1] += item['net_increase']
+            series['total_page_count'][-1] = item['total_page_count']
+        else:
+            series['labels'].append(label)
+            series['net_increase'].append(item['net_increase'])
+            series['total_page_count'].append(item['total_page_count'])
 
+def compute_rollups(data):
+    """
+    Aggregates the daily data into one series per period in ROLLUP_PERIODS.
+    Each series holds parallel `labels`, `net_increase` and `total_page_count`
+    lists: the net increase is summed over the period and the total page count
+    is the last one seen in it.
+    """
+    return update_rollups(empty_rollups(), data, 0)
+
+def update_rollups(rollups, data, start):
+    """
+    Brings rollups computed from data[:start] up to date with data, where the
+    items from data[start] on were changed or added since. Only the periods
+    from the one holding data[start] onwards are aggregated again.
+    """
+    if start >= len(data):
+        return rollups
+    # Dates are unique, so no period reaches further back than a year
+    offset = max(0, start - 366)
+    days = [date.fromisoformat(item['date']) for item in data[offset:]]
+    for period, period_key in ROLLUP_PERIODS.items():
+        series = rollups[period]
+        first_label = period_key(days[start - offset])
+        # Drop the trailing periods the changed days fall into ...
+        while series['labels'] and series['labels'][-1] >= first_label:
+            for values in series.values():
+                values.pop()
+        # ... and aggregate them again, from the first day of the first one
+        first = start
+        while first > offset and period_key(days[first - 1 - offset]) >= first_label:
+            first -= 1
+        fold_into_series(series, period_key, days[first - offset:], data[first:])
+    return rollups
+
+# Version of the checkpoint written by read_report_data; others are ignored
+CHECKPOINT_VERSION = 1
+# Bytes before the checkpoint offset that must be unchanged for the rows after it to be appended ones
+CHECKPOINT_ANCHOR_SIZE = 64
+
+def checkpoint_file_path(csv_file):
+    """Returns the checkpoint file kept next to csv_file."""
+    root, _ = os.path.splitext(csv_file)
+    return f"{root}.report-state.json"
+
+def load_checkpoint(checkpoint_file):
+    """Returns the checkpoint saved in checkpoint_file, or None if there is no usable one."""
     try:
-        with open(TEMPLATE_FILE, 'r') as template_file:
-            template = template_file.read()
+        with open(checkpoint_file, 'r') as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable report checkpoint '{checkpoint_file}': {e}")
+        return None
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    """Replaces checkpoint_file atomically; failing to save only costs a full read next time."""
+    try:
+        # dumps() uses the C encoder, dump() does not
+        write_file_atomically(checkpoint_file, lambda f: f.write(json.dumps(checkpoint, separators=(',', ':'))))
+    except OSError as e:
+        logger.warning(f"Could not save report checkpoint '{checkpoint_file}': {e}")
+
+def anchor_hash(csvfile, offset):
+    """Returns the hash of the CHECKPOINT_ANCHOR_SIZE bytes of csvfile before offset."""
+    start = max(0, offset - CHECKPOINT_ANCHOR_SIZE)
+    csvfile.seek(start)
+    return hashlib.sha256(csvfile.read(offset - start)).hexdigest()
+
+def checkpoint_matches(checkpoint, csvfile, stat):
+    """
+    Returns True if the CSV file (opened in binary mode, stat being its
+    os.stat) is the one checkpoint was taken from, possibly with rows appended.
+    """
+    offset = checkpoint['offset']
+    if stat.st_ino != checkpoint['inode'] or stat.st_size < offset:
+        # Replaced (fill_missing_dates writes a new file) or truncated
+        return False
+    if stat.st_size == checkpoint['size'] and stat.st_mtime_ns != checkpoint['mtime_ns']:
+        # Modified without growing: edited in place
+        return False
+    return anchor_hash(csvfile, offset) == checkpoint['anchor']
+
+def read_new_rows(csvfile, offset):
+    """
+    Returns the rows of the complete lines of csvfile (opened in binary mode)
+    from offset on, and the offset just past them. An incomplete last line,
+    a write still in progress, is left for the next run.
+    """
+    csvfile.seek(offset)
+    text = csvfile.read()
+    end = text.rfind(b'\n') + 1
+    rows = csv.reader(io.StringIO(text[:end].decode()))
+    return [(row[0], int(row[1]), int(row[2])) for row in rows if row], offset + end
+
+@timing.timed('read_report_data')
+def read_report_data(storage=None):
+    """
+    Returns (data, rollups) for the report: data as read_csv_data returns it
+    and rollups as compute_rollups does, or (None, None) without a data file.
+
+    For a CSV file both are saved in a checkpoint next to it along with the
+    number of bytes read. The next run parses only the rows appended since and
+    aggregates again only the periods they fall in. If the file was rewritten
+    instead (by fill_missing_dates or a restore), which shows in its inode,
+    size, modification time or the bytes before that offset, it is read whole.
+    """
+    if storage is None:
+        storage = CsvStorage(csv_file_path())
+    if not isinstance(storage, CsvStorage):
+        data = read_csv_data(storage=storage)
+        return data, (compute_rollups(data) if data is not None else None)
+
+    checkpoint_file = checkpoint_file_path(storage.csv_file)
+    try:
+        csvfile = open(storage.csv_file, 'rb')
+    except FileNotFoundError:
+        return read_csv_data(storage=storage), None
+    with csvfile:
+        stat = os.fstat(csvfile.fileno())
+        checkpoint = load_checkpoint(checkpoint_file)
+        if checkpoint and checkpoint_matches(checkpoint, csvfile, stat):
+            columns = checkpoint['data']
+            data = [{'date': day, 'total_page_count': total_page_count, 'net_increase': net_increase}
+                    for day, total_page_count, net_increase
+                    in zip(columns['date'], columns['total_page_count'], columns['net_increase'])]
+            rollups = checkpoint['rollups']
+            offset = checkpoint['offset']
+        else:
+            if checkpoint:
+                logger.info(f"'{storage.csv_file}' was rewritten, reading it from the start")
+            checkpoint = None
+            data, rollups, offset = [], empty_rollups(), 0
+        rows, end = read_new_rows(csvfile, offset)
+        anchor = anchor_hash(csvfile, end)
+
+    positions = {item['date']: i for i, item in enumerate(data)}
+    start = fold_rows(data, positions, rows)
+    if all(data[i - 1]['date'] < data[i]['date'] for i in range(1, len(data))):
+        update_rollups(rollups, data, start)
+    else:
+        # Rows out of date order: periods can't be cut at the first changed day
+        rollups = compute_rollups(data)
+    logger.debug(f"Read {len(rows)} new row(s) from '{storage.csv_file}' at offset {offset}")
+
+    if checkpoint is None or end != offset or stat.st_size != checkpoint['size'] \
+            or stat.st_mtime_ns != checkpoint['mtime_ns']:
+        save_checkpoint(checkpoint_file, {
+            'version': CHECKPOINT_VERSION,
+            'inode': stat.st_ino,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'offset': end,
+            'anchor': anchor,
+            'data': {key: [item[key] for item in data]
+                     for key in ('date', 'total_page_count', 'net_increase')},
+            'rollups': rollups,
+        })
+    return data, rollups
+
+def downsample(series, max_points):
+    """
+    Merges consecutive points of a series into equal buckets so that it has at
+    most max_points points. A bucket is labelled with its first label, sums the
+    net increase and keeps the last total page count. The number of points per
+    bucket is stored as `bucket_size`.
+    """
+    count = len(series['labels'])
+    bucket_size = max(1, -(-count // max_points))
+    if bucket_size == 1:
+        return dict(series, bucket_size=1)
+    return {
+        'labels': series['labels'][::bucket_size],
+        'net_increase': [sum(series['net_increase'][i:i + bucket_size])
+                         for i in range(0, count, bucket_size)],
+        'total_page_count': [series['total_page_count'][min(i + bucket_size, count) - 1]
+                             for i in range(0, count, bucket_size)],
+        'bucket_size': bucket_size,
+    }
+
+def build_chart_data(data, max_points=None, rollups=None):
+    """
+    Returns the series embedded in the report: one downsampled rollup per view,
+    so the page does not grow with the length of the history. rollups are
+    computed from data unless given (see read_report_data).
+    """
+    max_points = max_points or MAX_CHART_POINTS or load_config()['report'].get('max_chart_points', 400)
+    if rollups is None:
+        rollups = compute_rollups(data)
+    return {period: downsample(series, max_points) for period, series in rollups.items()}
+
+# Placeholders in the template that are filled in by render_template
+TEMPLATE_SLOT_PATTERN = re.compile(r'\{(report_title|table_rows|chart_data|analytics_data|data_url)\}')
+
+# Title of the report, followed by the printer name in fleet reports
+REPORT_TITLE = 'Printer Page Count Report'
+
+def parse_template(template):
+    """
+    Split the template text into a list of (slot, text) segments: literal text
+    has slot None, placeholders have their slot name and empty text.
+    """
+    segments = []
+    position = 0
+    for match in TEMPLATE_SLOT_PATTERN.finditer(template):
+        segments.append((None, template[position:match.start()]))
+        segments.append((match.group(1), ''))
+        position = match.end()
+    segments.append((None, template[position:]))
+    return segments
 
-        # Generate table rows
-        table_rows = ''
-        for item in data:
-            table_rows += f"""
+def load_template():
+    """Reads and parses the template file. Raises FileNotFoundError if it doesn't exist."""
+    with open(template_file_path(), 'r') as template_file:
+        return parse_template(template_file.read())
+
+def iter_table_rows(data):
+    """Yields the HTML table rows of the data one at a time."""
+    for item in data:
+        yield f"""
                 <tr>
                     <td>{item['date']}</td>
                     <td>{item['net_increase']}</td>
@@ -89,16 +346,73 @@ def generate_html_table(data):
                 </tr>
             """
 
-        # Replace placeholders in the template
-        # Replace placeholders with actual data
-        html = template.replace('{table_rows}', table_rows)
-        # Convert data to JSON string for JavaScript
-        import json
-        html = html.replace('{chart_data}', json.dumps(data))
-        return html
+def build_analytics_data(data):
+    """
+    Returns the usage statistics of data (see analytics.usage_stats), or None
+    when NumPy is not installed; the report then leaves them out.
+    """
+    if not data:
+        return None
+    if not analytics.is_available():
+        logger.info("NumPy is not installed, the report has no usage analytics")
+        return None
+    return analytics.usage_stats(data)
+
+def build_report_data(data, rollups=None, usage=None):
+    """
+    Returns the data of the page as one JSON-ready dict, for static builds
+    that serve it as a separate asset: the daily table as parallel lists,
+    and the chart and analytics data as embedded otherwise.
+    """
+    return {
+        'daily': {
+            'labels': [item['date'] for item in data],
+            'net_increase': [item['net_increase'] for item in data],
+            'total_page_count': [item['total_page_count'] for item in data],
+        },
+        'chart_data': build_chart_data(data, rollups=rollups),
+        'analytics_data': usage if usage is not None else build_analytics_data(data),
+    }
+
+@timing.timed('render_template')
+def render_template(segments, data, out, rollups=None, usage=None, title=REPORT_TITLE, data_url=None):
+    """
+    Writes the parsed template to the file object out, filling the slots from
+    data as it goes, so the page is never held in memory as a whole. usage
+    holds the usage statistics when already computed, for instance for a
+    whole fleet at once. With data_url the page loads its data from that
+    asset (see build_report_data) instead of embedding it.
+    """
+    slots = {
+        'report_title': lambda: [html.escape(title)],
+        'table_rows': lambda: iter_table_rows(data),
+        # Pre-aggregated series for JavaScript
+        'chart_data': lambda: json.JSONEncoder().iterencode(build_chart_data(data, rollups=rollups)),
+        'analytics_data': lambda: json.JSONEncoder().iterencode(
+            usage if usage is not None else build_analytics_data(data)),
+        'data_url': lambda: [json.dumps(data_url)],
+    }
+    if data_url is not None:
+        slots.update(table_rows=lambda: [], chart_data=lambda: ['null'], analytics_data=lambda: ['null'])
+    for slot, text in segments:
+        if slot is None:
+            out.write(text)
+        else:
+            for chunk in slots[slot]():
+                out.write(chunk)
+
+def generate_html_table(data):
+    """Generates an HTML table with a bar chart and data switching from the given data."""
+    if not data:
+        return "<p>No data available.</p>"
+
+    try:
+        html = io.StringIO()
+        render_template(load_template(), data, html)
+        return html.getvalue()
 
     except FileNotFoundError:
-        error_msg = f"Error: Template file '{TEMPLATE_FILE}' not found."
+        error_msg = f"Error: Template file '{template_file_path()}' not found."
         logger.error(error_msg)
         print(error_msg)
         return "<p>Error: Template file not found.</p>"
@@ -106,9 +420,137 @@ def generate_html_table(data):
 def write_html_file(html):
     """Writes the HTML content to a file."""
     try:
-        with open(HTML_FILE, 'w') as htmlfile:
+        with open(html_file_path(), 'w') as htmlfile:
             htmlfile.write(html)
-        success_msg = f"HTML report generated successfully at '{HTML_FILE}'"
+        success_msg = f"HTML report generated successfully at '{html_file_path()}'"
+        logger.info(success_msg)
+        print(success_msg)
+    except Exception as e:
+        error_msg = f"Error writing HTML file: {e}"
+        logger.error(error_msg)
+        print(error_msg)
+
+# Chart.js inlined by static builds instead of loading it from the CDN (see readme)
+VENDOR_CHART_JS = os.path.join(script_dir, 'templates', 'vendor', 'chart.umd.min.js')
+CHART_JS_URL = 'https://cdn.jsdelivr.net/npm/chart.js/dist/chart.umd.min.js'
+CHART_JS_TAG_PATTERN = re.compile(r'<script src="https://cdn\.jsdelivr\.net/npm/chart\.js[^"]*"></script>')
+WEB_FONTS_TAG_PATTERN = re.compile(r'[ \t]*<link href="https://fonts\.googleapis\.com/[^"]*" rel="stylesheet">\n?')
+STYLE_PATTERN = re.compile(r'<style>(.*?)</style>', re.S)
+
+def minify_css(css):
+    """Drops the comments and the whitespace that CSS does not need."""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+def read_vendor_chart_js():
+    """
+    Returns the vendored Chart.js of static builds.
+    Raises FileNotFoundError, with how to download it, if it is missing.
+    """
+    try:
+        with open(VENDOR_CHART_JS, 'r') as f:
+            return f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Static builds need Chart.js in '{VENDOR_CHART_JS}'; download it once with "
+            f"`curl --create-dirs -Lo {VENDOR_CHART_JS} {CHART_JS_URL}`") from None
+
+def make_self_contained(segments):
+    """
+    Returns the template segments for a static build: Chart.js inlined from
+    VENDOR_CHART_JS, the web fonts link dropped (the pages fall back to the
+    system fonts) and the stylesheet minified, so the page loads nothing from
+    the internet. Raises FileNotFoundError without the vendored file.
+    """
+    # The script must not close its own tag
+    chart_js = '<script>' + read_vendor_chart_js().replace('</script', '<\\/script') + '</script>'
+
+    def transform(text):
+        text = CHART_JS_TAG_PATTERN.sub(lambda match: chart_js, text)
+        text = WEB_FONTS_TAG_PATTERN.sub('', text)
+        return STYLE_PATTERN.sub(lambda match: f'<style>{minify_css(match.group(1))}</style>', text)
+
+    return [(slot, transform(text) if slot is None else text) for slot, text in segments]
+
+def write_compressed_copies(path):
+    """
+    Writes path.gz, and path.br when the brotli package is installed, so a
+    static web server can send them as they are. A stale copy that can't be
+    refreshed is removed instead of being served.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    def write_gzip(out):
+        # No timestamp, so an unchanged page gives the same file
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as compressed:
+            compressed.write(content)
+
+    write_file_atomically(f"{path}.gz", write_gzip, 'wb')
+    try:
+        import brotli
+    except ImportError:
+        if os.path.exists(f"{path}.br"):
+            os.unlink(f"{path}.br")
+        return
+    write_file_atomically(f"{path}.br", lambda out: out.write(brotli.compress(content)), 'wb')
+
+def write_report_files(html_file, segments, data, rollups=None, usage=None, title=REPORT_TITLE,
+                       static_build=False):
+    """
+    Writes the report of data to html_file. A static build (segments from
+    make_self_contained) puts the data in <report>.data.<hash>.json next to
+    it, a name that changes with its content so it can be cached for good,
+    and writes compressed copies of both (see write_compressed_copies).
+    """
+    directory = os.path.dirname(os.path.abspath(html_file))
+    root, _ = os.path.splitext(os.path.basename(html_file))
+    if not static_build:
+        write_file_atomically(html_file, lambda out: render_template(segments, data, out, rollups, usage, title))
+        # Copies left by an earlier static build would be served instead
+        for name in os.listdir(directory):
+            if name in (f"{root}.html.gz", f"{root}.html.br") or name.startswith(f"{root}.data."):
+                os.unlink(os.path.join(directory, name))
+        return
+    asset = json.dumps(build_report_data(data, rollups, usage), separators=(',', ':'))
+    asset_name = f"{root}.data.{hashlib.sha256(asset.encode()).hexdigest()[:12]}.json"
+    asset_file = os.path.join(directory, asset_name)
+    # The asset goes first, so the page never points to a missing one
+    write_file_atomically(asset_file, lambda out: out.write(asset))
+    write_file_atomically(html_file, lambda out: render_template(
+        segments, data, out, title=title, data_url=asset_name))
+    for path in (asset_file, html_file):
+        write_compressed_copies(path)
+    # Assets of earlier builds, and their copies
+    for name in os.listdir(directory):
+        if name.startswith(f"{root}.data.") and not name.startswith(asset_name):
+            os.unlink(os.path.join(directory, name))
+
+def write_html_report(data, rollups=None, usage=None, static_build=False):
+    """
+    Renders the report for data straight into the HTML file, streaming the
+    table rows and chart data instead of building the page as a string.
+    See write_report_files for static_build.
+    """
+    try:
+        segments = load_template()
+    except FileNotFoundError:
+        error_msg = f"Error: Template file '{template_file_path()}' not found."
+        logger.error(error_msg)
+        print(error_msg)
+        return
+    if static_build:
+        try:
+            segments = make_self_contained(segments)
+        except FileNotFoundError as e:
+            error_msg = f"Error: {e}"
+            logger.error(error_msg)
+            print(error_msg)
+            return
+    try:
+        write_report_files(html_file_path(), segments, data, rollups, usage, static_build=static_build)
+        success_msg = f"HTML report generated successfully at '{html_file_path()}'"
         logger.info(success_msg)
         print(success_msg)
     except Exception as e:
@@ -117,7 +559,41 @@ def write_html_file(html):
         print(error_msg)
 
 if __name__ == "__main__":
-    data = read_csv_data()
+    parser = argparse.ArgumentParser(description="Generate the HTML page count report.")
+    parser.add_argument('--fleet', action='store_true',
+                        help="write one report per printer of the fleet and an index page, see fleet_report.py")
+    parser.add_argument('--workers', type=int, help="processes rendering fleet reports (default: report.workers)")
+    parser.add_argument('--force', action='store_true', help="rewrite fleet reports whose input has not changed")
+    parser.add_argument('--static-build', action='store_true', default=None,
+                        help="self-contained pages with a separate data asset and .gz/.br copies "
+                             "(default: report.static_build)")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the run with cProfile and write the dump to the logging directory")
+    args = parser.parse_args()
+
+    # Logs the time spent in each stage on exit, and writes the profile
+    timing.track_run('generate_html_report', profile=args.profile)
+
+    config = load_config()
+    # Messages are also printed, so only the log file gets them
+    setup_logging(config, console=False)
+    static_build = args.static_build or config['report'].get('static_build', False)
+    if static_build:
+        # Without Chart.js the pages would still need the CDN, so nothing is built
+        try:
+            read_vendor_chart_js()
+        except FileNotFoundError as e:
+            error_msg = f"Error: {e}"
+            logger.error(error_msg)
+            print(error_msg)
+            exit(2)
+    if args.fleet:
+        import fleet_report
+
+        fleet_report.generate_fleet_reports(config, args.workers, args.force, static_build)
+        exit(0)
+    storage = open_storage(settings.storage_backend(config), settings.printer_id(config),
+                           csv_file_path(), settings.sqlite_file(config), settings.partition_dir(config))
+    data, rollups = read_report_data(storage)
     if data:
-        html = generate_html_table(data)
-        write_html_file(html)
\ No newline at end of file
+        write_html_report(data, rollups, static_build=static_build)
\ No newline at end of file
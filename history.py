@@ -0,0 +1,180 @@
+import bisect
+import csv
+import os
+
+# Bytes read per step when scanning a CSV file backwards from its end
+TAIL_BLOCK_SIZE = 4096
+
+
+def _tail_blocks(f, block_size=TAIL_BLOCK_SIZE):
+    """
+    Yield (offset, data) for growing suffixes of an open binary file, reading
+    one block further back from the end on each step.
+    """
+    pos = f.seek(0, os.SEEK_END)
+    data = b''
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+        yield pos, data
+
+
+def read_last_row(csv_file):
+    """
+    Return the last complete row of a CSV file as a list of strings.
+    The file is read backwards from the end in small blocks, so the cost does
+    not depend on how much history it holds. A trailing line without a newline,
+    as left by an interrupted write, is not a complete row and is skipped.
+    Returns None if the file holds no complete row.
+    """
+    with open(csv_file, 'rb') as f:
+        for pos, data in _tail_blocks(f):
+            end = data.rfind(b'\n')
+            while end != -1:
+                start = data.rfind(b'\n', 0, end)
+                if start == -1 and pos > 0:
+                    # The line may begin in an earlier block
+                    break
+                line = data[start + 1:end].strip()
+                if line:
+                    return next(csv.reader([line.decode()]))
+                end = start
+    return None
+
+
+def truncate_partial_row(csv_file):
+    """
+    Remove a trailing line that has no newline, left by an interrupted write,
+    so the next appended row starts on a line of its own.
+    Returns the removed bytes (empty if the file ends with a newline).
+    """
+    with open(csv_file, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return b''
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return b''
+        keep = 0
+        for pos, data in _tail_blocks(f):
+            newline = data.rfind(b'\n')
+            if newline != -1:
+                keep = pos + newline + 1
+                break
+        f.seek(keep)
+        partial = f.read()
+        f.truncate(keep)
+        return partial
+
+
+class DateIndex:
+    """
+    Sorted in-memory index of the dates in a CSV file and the byte offset of
+    the row holding each one, so existence checks and date-range lookups are
+    O(log n) instead of a scan of the whole file.
+    Use load_date_index to get an index that is kept in sync with the file.
+    """
+
+    # Bytes before the indexed end compared to tell an append from a rewrite
+    ANCHOR_SIZE = 64
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.dates = []
+        self.offsets = []
+        self.indexed_size = 0  # End of the last complete row read so far
+        self.anchor = b''
+        self.stat = None
+
+    def contains(self, date):
+        """Return True if at least one row holds date."""
+        i = bisect.bisect_left(self.dates, date)
+        return i < len(self.dates) and self.dates[i] == date
+
+    def offsets_between(self, start_date=None, end_date=None):
+        """
+        Return the offsets of the rows dated between start_date and end_date
+        (both inclusive, either may be None), in date order.
+        """
+        lo = 0 if start_date is None else bisect.bisect_left(self.dates, start_date)
+        hi = len(self.dates) if end_date is None else bisect.bisect_right(self.dates, end_date)
+        return self.offsets[lo:hi]
+
+    def refresh(self):
+        """
+        Bring the index up to date with the file. Rows appended since the last
+        refresh are parsed incrementally; any other change rebuilds the index,
+        including a file replaced by another one (a new inode) or truncated.
+        """
+        stat = os.stat(self.csv_file)
+        if self.stat is not None and (stat.st_ino, stat.st_size, stat.st_mtime_ns) == self.stat:
+            return
+        with open(self.csv_file, 'rb') as f:
+            if not self._is_append(f, stat):
+                self.dates, self.offsets = [], []
+                self.indexed_size = 0
+            self._read_rows(f)
+        self.stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _is_append(self, f, stat):
+        if self.indexed_size == 0 or stat.st_size < self.indexed_size:
+            return False
+        if self.stat is not None and stat.st_ino != self.stat[0]:
+            return False
+        f.seek(self.indexed_size - len(self.anchor))
+        return f.read(len(self.anchor)) == self.anchor
+
+    def _read_rows(self, f):
+        offset = self.indexed_size
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                # Partially written row, see truncate_partial_row
+                break
+            date = line.split(b',', 1)[0].strip().decode()
+            if date:
+                if not self.dates or date >= self.dates[-1]:
+                    self.dates.append(date)
+                    self.offsets.append(offset)
+                else:
+                    i = bisect.bisect_right(self.dates, date)
+                    self.dates.insert(i, date)
+                    self.offsets.insert(i, offset)
+            offset += len(line)
+        self.indexed_size = offset
+        f.seek(max(0, offset - self.ANCHOR_SIZE))
+        self.anchor = f.read(offset - f.tell())
+
+
+# Date indexes built by load_date_index, keyed by absolute CSV path
+_date_indexes = {}
+
+
+def load_date_index(csv_file):
+    """
+    Return the DateIndex of csv_file, building it on first use and refreshing
+    it against the file size/mtime on later calls.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    key = os.path.abspath(csv_file)
+    index = _date_indexes.get(key)
+    if index is None:
+        index = _date_indexes[key] = DateIndex(key)
+    index.refresh()
+    return index
+
+
+def read_rows_between(csv_file, start_date=None, end_date=None):
+    """
+    Return the rows of csv_file dated between start_date and end_date (both
+    inclusive, either may be None) in date order, using the date index.
+    """
+    index = load_date_index(csv_file)
+    rows = []
+    with open(csv_file, 'rb') as f:
+        for offset in index.offsets_between(start_date, end_date):
+            f.seek(offset)
+            rows.append(next(csv.reader([f.readline().decode()])))
+    return rows
@@ -0,0 +1,242 @@
+import asyncio
+import bisect
+import logging
+import threading
+
+from atomic_file import write_file_atomically
+
+logger = logging.getLogger('report_logger')
+
+# Round-trip and write times, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """Base of the metric types: one value (or histogram) per combination of label values."""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+    def snapshot(self):
+        """Return the recorded values as JSON-compatible [label values, value] pairs."""
+        with self.lock:
+            return [[list(key), value] for key, value in self.samples.items()]
+
+    def merge(self, snapshot):
+        """Add the values of a snapshot taken in another process."""
+        with self.lock:
+            for key, value in snapshot:
+                key = tuple(key)
+                self.samples[key] = self._merge_sample(self.samples.get(key), value)
+
+    def _merge_sample(self, sample, value):
+        return value if sample is None else sample + value
+
+    def render(self):
+        """Return the metric in the Prometheus text exposition format."""
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}', f'# TYPE {self.name} {self.type_name}']
+        with self.lock:
+            for key in sorted(self.samples):
+                lines.extend(self._render_sample(key, self.samples[key]))
+        return '\n'.join(lines) + '\n'
+
+    def _render_sample(self, key, value):
+        yield f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = value
+
+    def _merge_sample(self, sample, value):
+        return value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                sample = self.samples[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            sample[0][bisect.bisect_left(self.buckets, value)] += 1
+            sample[1] += value
+
+    def _merge_sample(self, sample, value):
+        counts, total = value
+        if sample is None:
+            return [list(counts), total]
+        return [[a + b for a, b in zip(sample[0], counts)], sample[1] + total]
+
+    def _render_sample(self, key, sample):
+        counts, total = sample
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.label_names, key, [('le', _format_value(bound))])
+            yield f'{self.name}_bucket{labels} {_format_value(cumulative)}'
+        labels = _format_labels(self.label_names, key)
+        yield f'{self.name}_sum{labels} {_format_value(total)}'
+        yield f'{self.name}_count{labels} {_format_value(cumulative)}'
+
+
+class Registry:
+    """The metrics exposed by this process."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return ''.join(metric.render() for metric in self.metrics)
+
+    def reset(self):
+        """Drop every recorded value, keeping the metrics."""
+        for metric in self.metrics:
+            metric.reset()
+
+    def snapshot(self):
+        """Return the values of every metric by name, e.g. to send them to another process."""
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def merge(self, snapshot):
+        """
+        Add a snapshot of another process to these metrics: counters and
+        histograms are added up, gauges take the value of the snapshot.
+        """
+        for metric in self.metrics:
+            metric.merge(snapshot.get(metric.name, []))
+
+
+REGISTRY = Registry()
+
+# Metrics of the collector. `printer` is the IP address of the printer.
+SNMP_REQUESTS = REGISTRY.register(Counter(
+    'printer_snmp_requests_total', 'SNMP requests sent, by outcome (answered or timeout)',
+    ['printer', 'outcome']))
+SNMP_RTT = REGISTRY.register(Histogram(
+    'printer_snmp_rtt_seconds', 'Round-trip time of answered SNMP requests', ['printer']))
+POLLS = REGISTRY.register(Counter(
+    'printer_polls_total',
+    'Page count polls, by outcome (ok, error_indication, error_status, skipped or error)',
+    ['printer', 'outcome']))
+FALLBACKS = REGISTRY.register(Counter(
+    'printer_fallbacks_total', 'Polls that recorded the previous page count instead of a new one',
+    ['printer']))
+PAGE_COUNT = REGISTRY.register(Gauge(
+    'printer_page_count', 'Latest page count read from the printer', ['printer']))
+POLL_DURATION = REGISTRY.register(Histogram(
+    'printer_poll_duration_seconds', 'Duration of a whole poll of one printer, storage included',
+    ['printer']))
+STORAGE_WRITE = REGISTRY.register(Histogram(
+    'printer_storage_write_seconds', 'Time taken to store (or, during a sweep, queue) one page count'))
+STORAGE_COMMIT = REGISTRY.register(Histogram(
+    'printer_storage_commit_seconds', 'Time taken to write and fsync one batch of page counts'))
+STORAGE_BATCH_ROWS = REGISTRY.register(Histogram(
+    'printer_storage_batch_rows', 'Page counts written per batch',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)))
+SWEEP_DURATION = REGISTRY.register(Gauge(
+    'printer_sweep_duration_seconds', 'Duration of the last sweep over the fleet'))
+SWEEP_FAILURES = REGISTRY.register(Gauge(
+    'printer_sweep_failed_printers', 'Printers that could not be queried in the last sweep'))
+SWEEP_TIMESTAMP = REGISTRY.register(Gauge(
+    'printer_sweep_timestamp_seconds', 'Unix time at which the last sweep finished'))
+
+
+def write_textfile(path, registry=REGISTRY):
+    """
+    Write the metrics to path for the node_exporter textfile collector.
+    The file is replaced atomically so the exporter never reads half of it.
+    """
+    write_file_atomically(path, lambda f: f.write(registry.render()))
+
+
+async def _handle_request(reader, writer, registry):
+    try:
+        request_line = await reader.readline()
+        # Skip the headers
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] in ('GET', 'HEAD') and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', registry.render().encode()
+        else:
+            status, body = '404 Not Found', b'Not found\n'
+        head = (f'HTTP/1.0 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n')
+        writer.write(head.encode())
+        if parts and parts[0] != 'HEAD':
+            writer.write(body)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(address='127.0.0.1', port=9877, registry=REGISTRY):
+    """
+    Serve the metrics at http://address:port/metrics on the running event loop.
+    Returns the asyncio server; close it to stop serving.
+    """
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_request(reader, writer, registry), address, port)
+    logger.info(f"Serving metrics on http://{address}:{port}/metrics")
+    return server
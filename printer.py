@@ -1,82 +1,322 @@
-import socket
-import csv
+import argparse
 import asyncio
-import yaml
+import itertools
+import random
+import signal
+import time
 import logging
 from datetime import datetime
-from pysnmp.hlapi.asyncio import getCmd, SnmpEngine, CommunityData, UdpTransportTarget, ContextData
-from pysnmp.smi.rfc1902 import ObjectType, ObjectIdentity
+
+import settings
+from settings import load_config, setup_logging
+from resilience import configure_circuit_breaker, get_device_health
+import metrics
+import timing
+from storage import CsvStorage, PartitionedCsvStorage, group_by_month, open_storage
+from transport import END_OF_MIB, oid_key
+from writer import BatchWriter
 
 import os
 
 # Get the directory containing the script
 script_dir = os.path.dirname(os.path.abspath(__file__))
-# 修改配置文件路径
-config_path = os.path.join(script_dir, 'config.yaml')
-
-# 读取 YAML 配置
-with open(config_path, 'r') as f:
-    config = yaml.safe_load(f)
 
-# Construct absolute path for CSV file
-CSV_FILE = os.path.join(script_dir, config['csv_file_name'])
+# Files and storage backend of the single `printer`. None means the value in
+# config.yaml, read on first use; set them to override it (tests do).
+CSV_FILE = None
+STORAGE_BACKEND = None
+SQLITE_FILE = None
+PARTITION_DIR = None
+# SNMP transport of every request, a PysnmpTransport when None. Tests and
+# benchmarks set a transport.FakeTransport to run without a network.
+TRANSPORT = None
 
-# Configure logging
-# 添加默认 logger 配置
+# Handlers are attached by setup_logging(), so importing this module has no side effects
 logger = logging.getLogger('report_logger')
-logger.setLevel(logging.INFO)
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(handler)
-
-# 然后是现有的配置代码
-if config['logging']['enabled']:
-    import os
-    from logging.handlers import TimedRotatingFileHandler
-    
-    # Create logs directory if it doesn't exist
-    log_dir = os.path.join(script_dir, config['logging']['directory'])
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # Configure the logger
-    logger = logging.getLogger('report_logger')
-    logger.setLevel(getattr(logging, config['logging']['level']))
-    
-    # Create a timed rotating file handler
-    log_file = os.path.join(log_dir, 'report.log')
-    handler = TimedRotatingFileHandler(
-        log_file,
-        when='midnight',
-        interval=1,
-        backupCount=config['logging']['max_days']
-    )
-    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(handler)
-
-
-async def check_network_connectivity(ip_address, community_string='public', port=161, timeout=2):
+
+
+# pysnmp is imported by the functions that use it, on first use, since loading
+# it takes longer than everything else this module needs
+
+# SnmpEngine shared by every request on the running event loop
+_snmp_engine = None
+_snmp_engine_loop = None
+
+def get_snmp_engine():
+    """
+    Return the SnmpEngine shared by all requests on the current event loop.
+    The engine owns the transport dispatcher, so reusing it keeps a single
+    UDP socket and MIB view for a whole sweep instead of one per request.
+    """
+    from pysnmp.entity.engine import SnmpEngine
+
+    global _snmp_engine, _snmp_engine_loop
+    loop = asyncio.get_event_loop()
+    if _snmp_engine is None or _snmp_engine_loop is not loop:
+        _snmp_engine = SnmpEngine()
+        _snmp_engine_loop = loop
+        extend_engine_cache(_snmp_engine, V3_ENGINE_CACHE_LIFETIME)
+    return _snmp_engine
+
+def close_snmp_engine():
+    """
+    Close the transport dispatcher of the shared SnmpEngine, if any.
+    """
+    global _snmp_engine, _snmp_engine_loop
+    if _snmp_engine is not None and _snmp_engine.transportDispatcher is not None:
+        try:
+            _snmp_engine.transportDispatcher.closeDispatcher()
+        except Exception as e:
+            logger.warning(f"Failed to close SNMP transport dispatcher: {e}")
+    _snmp_engine = None
+    _snmp_engine_loop = None
+
+
+# How long the shared engine remembers the engine ID and clock of an SNMPv3
+# printer. pysnmp forgets them after PYSNMP_ENGINE_CACHE_LIFETIME seconds, so
+# with longer poll intervals every poll started with a discovery round trip.
+# A printer replaced by another one at the same address answers again once
+# the entry of the old one has expired.
+V3_ENGINE_CACHE_LIFETIME = 6 * 3600
+PYSNMP_ENGINE_CACHE_LIFETIME = 300
+
+def extend_engine_cache(engine, lifetime):
+    """
+    Make engine keep discovered SNMPv3 engine IDs and clocks for lifetime
+    seconds. pysnmp expires them by counting its timer ticks, so their
+    expiry only runs on one tick in lifetime / PYSNMP_ENGINE_CACHE_LIFETIME.
+    """
+    from pysnmp.proto.mpmod.base import AbstractMessageProcessingModel
+    from pysnmp.proto.mpmod.rfc3412 import SnmpV3MessageProcessingModel
+    from pysnmp.proto.secmod.rfc3414.service import SnmpUSMSecurityModel
+
+    every = int(lifetime // PYSNMP_ENGINE_CACHE_LIFETIME)
+    if every <= 1:
+        return
+
+    def slowed(tick, between=None):
+        ticks = itertools.count(1)
+
+        def receive_timer_tick(snmp_engine, time_now):
+            if next(ticks) % every == 0:
+                tick(snmp_engine, time_now)
+            elif between is not None:
+                between(snmp_engine, time_now)
+        return receive_timer_tick
+
+    message_processing = engine.messageProcessingSubsystems[SnmpV3MessageProcessingModel.messageProcessingModelID]
+    usm = engine.securityModels[SnmpUSMSecurityModel.securityModelID]
+    # The base tick expires unanswered requests and still runs every time
+    message_processing.receiveTimerTick = slowed(
+        message_processing.receiveTimerTick,
+        lambda snmp_engine, time_now: AbstractMessageProcessingModel.receiveTimerTick(
+            message_processing, snmp_engine, time_now))
+    usm.receiveTimerTick = slowed(usm.receiveTimerTick)
+
+
+# SNMPv3 protocols by their name under `snmpv3` in config.yaml
+V3_AUTH_PROTOCOLS = {
+    'md5': 'usmHMACMD5AuthProtocol',
+    'sha': 'usmHMACSHAAuthProtocol',
+    'sha224': 'usmHMAC128SHA224AuthProtocol',
+    'sha256': 'usmHMAC192SHA256AuthProtocol',
+    'sha384': 'usmHMAC256SHA384AuthProtocol',
+    'sha512': 'usmHMAC384SHA512AuthProtocol',
+}
+V3_PRIV_PROTOCOLS = {
+    'des': 'usmDESPrivProtocol',
+    '3des': 'usm3DESEDEPrivProtocol',
+    'aes': 'usmAesCfb128Protocol',
+    'aes192': 'usmAesCfb192Protocol',
+    'aes256': 'usmAesCfb256Protocol',
+}
+
+# UsmUserData by SNMPv3 credentials, and the credentials of each user
+_usm_users = {}
+_usm_credentials = {}
+
+def check_snmpv3(snmpv3, credentials):
+    """
+    Check the `snmpv3` settings of a printer and return the key of its
+    credentials. credentials maps each (user, engine_id) to the key of the
+    first settings seen for it, and is updated.
+    Raises ValueError for a missing user, unknown protocols, an engine_id that
+    is not hex, or a user already seen with other settings and no engine_id.
+    """
+    if not snmpv3.get('user'):
+        raise ValueError("SNMPv3 settings need a `user`")
+    auth_protocol = str(snmpv3.get('auth_protocol', 'sha')).lower()
+    priv_protocol = str(snmpv3.get('priv_protocol', 'aes')).lower()
+    if auth_protocol not in V3_AUTH_PROTOCOLS:
+        raise ValueError(f"Unknown SNMPv3 auth_protocol '{auth_protocol}', expected one of "
+                         f"{', '.join(V3_AUTH_PROTOCOLS)}")
+    if priv_protocol not in V3_PRIV_PROTOCOLS:
+        raise ValueError(f"Unknown SNMPv3 priv_protocol '{priv_protocol}', expected one of "
+                         f"{', '.join(V3_PRIV_PROTOCOLS)}")
+    engine_id = snmpv3.get('engine_id')
+    if engine_id:
+        try:
+            bytes.fromhex(str(engine_id).replace(':', ''))
+        except ValueError:
+            raise ValueError(f"SNMPv3 engine_id '{engine_id}' is not hex") from None
+    key = tuple(sorted((name, str(value)) for name, value in snmpv3.items()))
+    if credentials.setdefault((snmpv3['user'], engine_id), key) != key:
+        raise ValueError(f"SNMPv3 user '{snmpv3['user']}' is configured with different settings; "
+                         f"set the engine_id of the printers that use it")
+    return key
+
+def auth_data(community_string, snmpv3=None):
+    """
+    Return the pysnmp authentication of a printer: CommunityData for SNMPv2c,
+    or the UsmUserData of its `snmpv3` settings (user, auth_protocol,
+    auth_password, priv_protocol, priv_password and, optionally, the printer's
+    engine_id in hex). The same UsmUserData is returned for the same
+    credentials, so the shared engine localizes the keys of a user once per
+    printer and keeps them across polls.
+    The engine holds one set of keys per user name; printers that share a
+    user name with different passwords must set their engine_id.
+    Raises ValueError for settings refused by check_snmpv3; load_printers
+    checks them all at startup.
+    """
+    from pysnmp.hlapi import auth
+
+    if not snmpv3:
+        return auth.CommunityData(community_string)
+    key = tuple(sorted((name, str(value)) for name, value in snmpv3.items()))
+    usm_user = _usm_users.get(key)
+    if usm_user is not None:
+        return usm_user
+
+    check_snmpv3(snmpv3, _usm_credentials)
+    auth_protocol = str(snmpv3.get('auth_protocol', 'sha')).lower()
+    priv_protocol = str(snmpv3.get('priv_protocol', 'aes')).lower()
+    # Without a password the protocol is left out: noAuthNoPriv or authNoPriv
+    protocols = {}
+    if snmpv3.get('auth_password'):
+        protocols['authProtocol'] = getattr(auth, V3_AUTH_PROTOCOLS[auth_protocol])
+        if snmpv3.get('priv_password'):
+            protocols['privProtocol'] = getattr(auth, V3_PRIV_PROTOCOLS[priv_protocol])
+    engine_id = snmpv3.get('engine_id')
+    if engine_id:
+        from pysnmp.proto.rfc1902 import OctetString
+
+        protocols['securityEngineId'] = OctetString(hexValue=str(engine_id).replace(':', ''))
+    usm_user = _usm_users[key] = auth.UsmUserData(
+        snmpv3['user'], snmpv3.get('auth_password'), snmpv3.get('priv_password'), **protocols)
+    return usm_user
+
+def reset_auth_data():
+    """Forget the SNMPv3 credentials seen so far, e.g. after reloading the configuration."""
+    _usm_users.clear()
+    _usm_credentials.clear()
+
+
+# OIDs requested by every poll: sysDescr.0, sysUpTime.0 and prtMarkerLifeCount.1.1
+SYS_DESCR_OID = '1.3.6.1.2.1.1.1.0'
+SYS_UPTIME_OID = '1.3.6.1.2.1.1.3.0'
+MARKER_LIFE_COUNT_OID = '1.3.6.1.2.1.43.10.2.1.4.1.1'
+POLL_OIDS = (SYS_DESCR_OID, SYS_UPTIME_OID, MARKER_LIFE_COUNT_OID)
+
+# Printer-MIB columns walked in table mode, from prtMarkerTable and
+# prtMarkerSuppliesTable. Each row is stored as the series `<name>.<row index>`.
+TABLE_COLUMNS = {
+    '1.3.6.1.2.1.43.10.2.1.4': 'marker_life_count',
+    '1.3.6.1.2.1.43.10.2.1.5': 'marker_power_on_count',
+    '1.3.6.1.2.1.43.11.1.1.8': 'supply_max_capacity',
+    '1.3.6.1.2.1.43.11.1.1.9': 'supply_level',
+}
+
+
+# Retries of UdpTransportTarget by default, kept for the requests that
+# do not retry on their own
+UDP_RETRIES = 5
+
+
+class PysnmpTransport:
+    """
+    SNMP over UDP with pysnmp, on the SnmpEngine shared by the running event
+    loop (see get_snmp_engine). Requests are authenticated with the community
+    string, or with snmpv3 credentials when given (see auth_data).
+    Responses are (error_indication, error_status, error_index, var_binds):
+    error_status is the name of the SNMP error or None, and var_binds are
+    (dotted OID, value) pairs, with transport.END_OF_MIB past the end of a walk.
+    """
+
+    async def get(self, ip_address, port, oids, timeout, retries=0, community_string='public', snmpv3=None):
+        """Send a GET for oids."""
+        from pysnmp.hlapi.asyncio import ContextData, UdpTransportTarget, getCmd
+        from pysnmp.smi.rfc1902 import ObjectIdentity, ObjectType
+
+        error_indication, error_status, error_index, var_binds = await getCmd(
+            get_snmp_engine(),
+            auth_data(community_string, snmpv3),
+            UdpTransportTarget((ip_address, port), timeout=timeout, retries=retries),
+            ContextData(),
+            *(ObjectType(ObjectIdentity(oid)) for oid in oids))
+        return (error_indication, self._error_status(error_status), error_index,
+                [self._var_bind(var_bind) for var_bind in var_binds or ()])
+
+    async def bulk(self, ip_address, port, oids, max_repetitions, timeout, retries=0,
+                   community_string='public', snmpv3=None):
+        """Send a GETBULK for up to max_repetitions successors of each of oids, returned row by row."""
+        from pysnmp.hlapi.asyncio import ContextData, UdpTransportTarget, bulkCmd
+        from pysnmp.smi.rfc1902 import ObjectIdentity, ObjectType
+
+        error_indication, error_status, error_index, var_bind_table = await bulkCmd(
+            get_snmp_engine(),
+            auth_data(community_string, snmpv3),
+            UdpTransportTarget((ip_address, port), timeout=timeout, retries=retries),
+            ContextData(),
+            0, max_repetitions,
+            *(ObjectType(ObjectIdentity(oid)) for oid in oids),
+            lookupMib=False)
+        return (error_indication, self._error_status(error_status), error_index,
+                [[self._var_bind(var_bind) for var_bind in row] for row in var_bind_table or ()])
+
+    def close(self):
+        close_snmp_engine()
+
+    @staticmethod
+    def _error_status(error_status):
+        return error_status.prettyPrint() if error_status else None
+
+    @staticmethod
+    def _var_bind(var_bind):
+        from pysnmp.proto.rfc1905 import EndOfMibView
+
+        oid, value = var_bind[0], var_bind[1]
+        return str(oid), END_OF_MIB if isinstance(value, EndOfMibView) else value
+
+
+_pysnmp_transport = None
+
+def get_transport():
+    """Return TRANSPORT, or the PysnmpTransport used when it is not set."""
+    global _pysnmp_transport
+    if TRANSPORT is not None:
+        return TRANSPORT
+    if _pysnmp_transport is None:
+        _pysnmp_transport = PysnmpTransport()
+    return _pysnmp_transport
+
+
+@timing.timed('check_network_connectivity')
+async def check_network_connectivity(ip_address, community_string='public', port=161, timeout=2, snmpv3=None):
     """
     Check if the target IP address is reachable via SNMP.
-    Uses a test SNMP GET request to verify connectivity.
+    Uses a test SNMP GET request to verify connectivity, with SNMPv3 when
+    snmpv3 holds the credentials of the printer (see auth_data).
     """
     try:
         # Use sysDescr.0 OID for testing - a basic system information query
-        test_oid = ObjectType(ObjectIdentity('1.3.6.1.2.1.1.1.0'))
-        
-        error_indication, error_status, error_index, var_binds = await getCmd(
-            SnmpEngine(),
-            CommunityData(community_string),
-            UdpTransportTarget((ip_address, port), timeout=timeout),
-            ContextData(),
-            test_oid
-        )
+        error_indication, error_status, error_index, var_binds = await get_transport().get(
+            ip_address, port, [SYS_DESCR_OID], timeout, UDP_RETRIES, community_string, snmpv3)
         
         if error_indication:
             logger.error(f"SNMP connectivity test failed: {error_indication}")
             return False
         elif error_status:
-            logger.error(f'SNMP error status: {error_status.prettyPrint()} at {error_index}')
+            logger.error(f'SNMP error status: {error_status} at {error_index}')
             return False
             
         return True
@@ -89,125 +329,285 @@ async def check_network_connectivity(ip_address, community_string='public', port
 
 
 
-def read_previous_page_count():
+def storage_settings(config=None):
     """
-    Reads the last stored page count from the CSV file.
-    Returns (last_count, last_date) tuple. Returns (0, None) if file doesn't exist or is empty.
+    Return (csv_file, backend, sqlite_file, partition_dir): CSV_FILE,
+    STORAGE_BACKEND, SQLITE_FILE and PARTITION_DIR, or their values in the
+    configuration when not set.
     """
-    try:
-        with open(CSV_FILE, 'r') as csvfile:
-            reader = csv.reader(csvfile)
-            rows = list(reader)
-            if rows:
-                last_row = rows[-1]
-                return int(last_row[1]), last_row[0]  # Return (count, date)
-            else:
-                return 0, None
-    except FileNotFoundError:
-        return 0, None
+    return (CSV_FILE or settings.csv_file(config),
+            STORAGE_BACKEND or settings.storage_backend(config),
+            SQLITE_FILE or settings.sqlite_file(config),
+            PARTITION_DIR or settings.partition_dir(config))
+
+def get_storage(storage=None):
+    """
+    Return the page count storage to use.
+    None selects the configured backend for the single `printer` (CSV_FILE for
+    the CSV backend), and a path is taken as a CSV file.
+    """
+    if storage is None:
+        csv_file, backend, sqlite_file, partition_dir = storage_settings()
+        return open_storage(backend, settings.printer_id(), csv_file, sqlite_file, partition_dir)
+    if isinstance(storage, str):
+        return CsvStorage(storage)
+    return storage
 
-def is_data_exists_for_date(date):
+@timing.timed('read_previous_page_count')
+def read_previous_page_count(storage=None):
+    """
+    Reads the last stored page count (from CSV_FILE by default).
+    For CSV only the end of the file is read, see history.read_last_row.
+    Returns (last_count, last_date) tuple. Returns (0, None) if there is no data yet.
+    """
+    return get_storage(storage).latest()
+
+def is_data_exists_for_date(date, storage=None):
     """
     检查指定日期是否已有数据记录
+    For CSV this uses the date index of the file, see history.load_date_index.
     """
-    try:
-        with open(CSV_FILE, 'r') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                if row[0] == date:
-                    return True
-        return False
-    except FileNotFoundError:
-        return False
+    return get_storage(storage).has_date(date)
+
+# Attempts after a timed out poll, and how much longer each one waits
+DEFAULT_RETRIES = 1
+RETRY_BACKOFF = 2
 
-async def get_printer_page_count(ip_address, community_string):
+async def query_printer(ip_address, community_string, port, health, oids, retries=DEFAULT_RETRIES, snmpv3=None):
+    """
+    Send a GET for oids, retrying up to retries times when it times out.
+    The first attempt waits for the adaptive timeout of the printer (see
+    resilience.RttEstimator) and each retry waits RETRY_BACKOFF times longer,
+    up to its configured timeout. Answered attempts update the RTT estimate.
+    Returns (error_indication, error_status, error_index, var_binds) of the last attempt.
+    """
+    transport = get_transport()
+    timeout = health.timeout()
+    for attempt in range(retries + 1):
+        start = time.monotonic()
+        with timing.span('snmp_get', printer=ip_address):
+            result = await transport.get(ip_address, port, oids, timeout, 0, community_string, snmpv3)
+        if not result[0]:
+            rtt = time.monotonic() - start
+            health.rtt.update(rtt)
+            metrics.SNMP_RTT.observe(rtt, printer=ip_address)
+            metrics.SNMP_REQUESTS.inc(printer=ip_address, outcome='answered')
+            return result
+        metrics.SNMP_REQUESTS.inc(printer=ip_address, outcome='timeout')
+        timeout = min(timeout * RETRY_BACKOFF, health.max_timeout)
+    return result
+
+async def get_printer_page_count(ip_address, community_string, port=161, timeout=2, storage=None,
+                                 retries=DEFAULT_RETRIES, snmpv3=None):
     """
     Query the printer for the page count using SNMP.
+    A single GET carries sysDescr/sysUpTime together with the marker life
+    count, so no separate connectivity probe is sent; a timeout on that
+    request (after retries, see query_printer) means the printer is unreachable.
+    timeout is the longest wait per attempt. A printer that failed several
+    polls in a row is skipped until its circuit breaker allows the next probe.
+    Results are written to storage (CSV_FILE by default). snmpv3 holds the
+    SNMPv3 credentials of the printer, if it is not queried with SNMPv2c.
+    Returns the page count read from the printer, or None if the query failed.
     """
     current_date = datetime.now().strftime("%Y-%m-%d")
-    
-
-    if not await check_network_connectivity(ip_address, community_string, port=161, timeout=timeout):
-        logger.error(f"Printer at {ip_address} is not reachable. Please check the network connection.")
-        # Use the previous page count when network is unreachable
-        previous_page_count, previous_date = read_previous_page_count()
-        if previous_page_count > 0:
-            write_page_count(current_date, previous_page_count, 0)
-            logger.info(f'Using previous page count from {previous_date}: {previous_page_count}')
-        return
 
-    oid = ObjectType(ObjectIdentity('1.3.6.1.2.1.43.10.2.1.4.1.1'))
+    def fall_back(outcome):
+        metrics.POLLS.inc(printer=ip_address, outcome=outcome)
+        if use_previous_page_count(current_date, storage):
+            metrics.FALLBACKS.inc(printer=ip_address)
+
+    health = get_device_health(ip_address, port, community_string, timeout)
+    if not health.allow_request():
+        logger.warning(f"Skipping printer at {ip_address} after {health.breaker.failures} failed polls, "
+                       f"next probe in {health.seconds_until_probe():.0f}s")
+        fall_back('skipped')
+        return None
+
     try:
-        error_indication, error_status, error_index, var_binds = await getCmd(SnmpEngine(),
-                   CommunityData(community_string),
-                   UdpTransportTarget((ip_address, 161)),
-                   ContextData(),
-                   oid)
+        error_indication, error_status, error_index, var_binds = await query_printer(
+            ip_address, community_string, port, health, POLL_OIDS, retries, snmpv3)
         if error_indication:
-            logger.error(f'Query failed: {error_indication}')
-            previous_page_count, previous_date = read_previous_page_count()
-            if previous_page_count > 0:
-                write_page_count(current_date, previous_page_count, 0)
-                logger.info(f'Using previous page count from {previous_date}: {previous_page_count}')
-            return
-        elif error_status:
-            logger.error(f'Query failed: {error_status.prettyPrint()} at index {error_index}')
-            previous_page_count, previous_date = read_previous_page_count()
-            if previous_page_count > 0:
-                write_page_count(current_date, previous_page_count, 0)
-                logger.info(f'Using previous page count from {previous_date}: {previous_page_count}')
+            health.breaker.record_failure()
+            logger.error(f"Printer at {ip_address} is not reachable: {error_indication}")
+            # Use the previous page count when network is unreachable
+            fall_back('error_indication')
+            return None
+        health.breaker.record_success()
+        if error_status:
+            logger.error(f'Query failed: {error_status} at index {error_index}')
+            fall_back('error_status')
+            return None
         else:
-            for var_bind in var_binds:
-                page_count = int(var_bind[1])
-                previous_page_count, _ = read_previous_page_count()
-                net_increase = page_count - previous_page_count if previous_page_count >= 0 else 0
-                write_page_count(current_date, page_count, net_increase)
-                logger.info(f'Print page count: {page_count}, Net increase: {net_increase}')
+            sys_descr, sys_uptime, marker = var_binds
+            logger.debug(f'Printer at {ip_address}: {sys_descr[1]}, uptime {sys_uptime[1]}')
+            page_count = int(marker[1])
+            previous_page_count, _ = read_previous_page_count(storage)
+            net_increase = page_count - previous_page_count if previous_page_count >= 0 else 0
+            write_page_count(current_date, page_count, net_increase, storage)
+            metrics.POLLS.inc(printer=ip_address, outcome='ok')
+            metrics.PAGE_COUNT.set(page_count, printer=ip_address)
+            logger.info(f'Print page count: {page_count}, Net increase: {net_increase}')
+            return page_count
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
-        previous_page_count, previous_date = read_previous_page_count()
-        if previous_page_count > 0:
-            write_page_count(current_date, previous_page_count, 0)
-            logger.info(f'Using previous page count from {previous_date}: {previous_page_count}')
+        fall_back('error')
+        return None
+
+# Most GETBULK requests of one table walk, far more than the few markers and
+# supplies of a printer need; only an agent that never ends a column gets there
+MAX_WALK_REQUESTS = 40
+
+async def walk_printer_tables(ip_address, community_string, port=161, timeout=2,
+                              columns=TABLE_COLUMNS, max_repetitions=25, snmpv3=None):
+    """
+    Walk the given Printer-MIB columns with GETBULK.
+    All columns are requested side by side and each request fetches up to
+    max_repetitions rows, so a printer with a few markers and supplies
+    answers in a single round-trip however many columns are collected.
+    A column ends at the first OID that does not follow the previous one,
+    as a buggy agent may return, so such an agent can't keep the walk going.
+    Returns a dict mapping `<column name>.<row index>` to its integer value.
+    Raises RuntimeError if a request fails or the walk takes more than
+    MAX_WALK_REQUESTS requests.
+    """
+    transport = get_transport()
+    next_oids = {column: column for column in columns}
+    values = {}
+    requests = 0
+    while next_oids:
+        if requests == MAX_WALK_REQUESTS:
+            raise RuntimeError(f"Table walk stopped after {requests} requests")
+        requests += 1
+        requested = list(next_oids)
+        with timing.span('snmp_bulk', printer=ip_address):
+            error_indication, error_status, error_index, var_bind_table = await transport.bulk(
+                ip_address, port, [next_oids[column] for column in requested], max_repetitions, timeout,
+                UDP_RETRIES, community_string, snmpv3)
+        if error_indication:
+            raise RuntimeError(f"Table walk failed: {error_indication}")
+        elif error_status:
+            raise RuntimeError(f"Table walk failed: {error_status} at index {error_index}")
+
+        finished = set()
+        for row in var_bind_table:
+            for column, (oid, value) in zip(requested, row):
+                if column in finished:
+                    continue
+                if not oid.startswith(column + '.') or value is END_OF_MIB:
+                    finished.add(column)
+                    continue
+                if oid_key(oid) <= oid_key(next_oids[column]):
+                    logger.warning(f"Printer at {ip_address} returned {oid} after {next_oids[column]}, "
+                                   f"column {columns[column]} ends there")
+                    finished.add(column)
+                    continue
+                row_index = oid[len(column) + 1:]
+                values[f"{columns[column]}.{row_index}"] = int(value)
+                next_oids[column] = oid
+        if not var_bind_table:
+            break
+        for column in finished:
+            del next_oids[column]
+    return values
+
+async def collect_printer_tables(ip_address, community_string, port=161, timeout=2, storage=None, snmpv3=None):
+    """
+    Walk the marker and supply tables of the printer and store each value as
+    its own series next to the page count (see walk_printer_tables).
+    Returns the collected values, or None if the walk failed.
+    """
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    try:
+        values = await walk_printer_tables(ip_address, community_string, port, timeout, snmpv3=snmpv3)
+    except Exception as e:
+        logger.error(f"Failed to collect Printer-MIB tables from {ip_address}: {e}")
+        return None
+    get_storage(storage).write_metrics(current_date, values)
+    logger.info(f"Collected {len(values)} Printer-MIB values from {ip_address}")
+    return values
+
+def use_previous_page_count(date, storage=None):
+    """
+    Record the previous page count for date with a net increase of 0.
+    Used when the printer could not be queried.
+    Returns True if a previous page count was recorded.
+    """
+    previous_page_count, previous_date = read_previous_page_count(storage)
+    if previous_page_count > 0:
+        write_page_count(date, previous_page_count, 0, storage)
+        logger.info(f'Using previous page count from {previous_date}: {previous_page_count}')
+        return True
+    return False
 
 
 
 
 
-def write_page_count(date, total_page_count, net_increase):
+@timing.timed('write_page_count')
+def write_page_count(date, total_page_count, net_increase, storage=None):
     """
-    Write date, total page count, and net increase to CSV file.
+    Write date, total page count, and net increase to storage (CSV_FILE by default).
     """
     try:
-        if not os.path.exists(CSV_FILE):
-            with open(CSV_FILE, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow([date, total_page_count, net_increase])
-        else:
-            with open(CSV_FILE, 'a', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow([date, total_page_count, net_increase])
+        start = time.perf_counter()
+        get_storage(storage).write(date, total_page_count, net_increase)
+        metrics.STORAGE_WRITE.observe(time.perf_counter() - start)
         logger.info(f"Successfully wrote data for {date}")
     except Exception as e:
-        logger.error(f"Failed to write to CSV file: {e}")
+        logger.error(f"Failed to write page count: {e}")
         raise
 
 
 
 
 
-def fill_missing_dates(csv_file):
+@timing.timed('fill_missing_dates')
+def fill_missing_dates(storage, until=None, full=False):
     """
     Check and fill missing dates in data.
+    By default only the span after the last stored date is checked: one row
+    with the last page count and a net increase of 0 is appended for each
+    day missing before `until` (today by default), so the existing history
+    is never read or rewritten. Call it before recording a new sample.
+    With full=True the whole history is checked instead, see repair_missing_dates.
+    """
+    storage = get_storage(storage)
+    if full:
+        repair_missing_dates(storage)
+        return
+    try:
+        last_page_count, last_date = storage.latest()
+        if last_date is None:
+            return
+        until = until or datetime.now().strftime("%Y-%m-%d")
+        current_date = datetime.strptime(last_date, "%Y-%m-%d") + timedelta(days=1)
+        end_date = datetime.strptime(until, "%Y-%m-%d")
+        while current_date < end_date:
+            date_str = current_date.strftime("%Y-%m-%d")
+            # For missing dates, use previous day's page count
+            logger.warning(f"Found missing date: {date_str}, auto-filled")
+            storage.write(date_str, last_page_count, 0)
+            current_date = current_date + timedelta(days=1)
+    except ValueError as e:
+        logger.error(f"Invalid date format in page count data: {e}")
+    except Exception as e:
+        logger.error(f"Error while filling missing dates: {e}")
+
+def repair_missing_dates(storage):
+    """
+    Check the whole history and fill every missing date.
+    A CSV file is rewritten in date order through a temporary file that
+    atomically replaces it, and only when a date is missing; with monthly
+    files only the months with a missing date are rewritten that way, and
+    with SQLite only the rows of the missing dates are inserted.
     """
+    storage = get_storage(storage)
     try:
         # 读取现有数据
-        with open(csv_file, 'r') as f:
-            reader = csv.reader(f)
-            rows = list(reader)
-            
+        rows = storage.read_range()
         if not rows:
-            logger.warning("CSV file is empty")
+            logger.warning("No page count data to fill")
             return
             
         # 获取数据的起始和结束日期
@@ -215,55 +615,51 @@ def fill_missing_dates(csv_file):
             start_date = datetime.strptime(rows[0][0], "%Y-%m-%d")
             end_date = datetime.strptime(rows[-1][0], "%Y-%m-%d")
         except (ValueError, IndexError) as e:
-            logger.error(f"Invalid date format in CSV: {e}")
+            logger.error(f"Invalid date format in page count data: {e}")
             return
         
         # 创建完整的日期列表
-        dates_dict = {}
+        # Days polled more than once (--daemon, fallbacks) have several rows,
+        # which are all kept so the day keeps its whole net increase
+        rows_by_date = {}
         for row in rows:
-            try:
-                if len(row) >= 3:  # Ensure row has all required fields
-                    dates_dict[row[0]] = row
-            except Exception as e:
-                logger.error(f"Invalid row format: {row}, Error: {e}")
-                continue
+            rows_by_date.setdefault(row[0], []).append(row)
         
         # 检查每一天
         current_date = start_date
         new_rows = []
-        prev_page_count = "0"
+        missing_rows = []
+        prev_page_count = 0
         
         while current_date <= end_date:
             date_str = current_date.strftime("%Y-%m-%d")
-            if date_str in dates_dict:
-                new_rows.append(dates_dict[date_str])
-                if dates_dict[date_str][1] != "-1":
-                    prev_page_count = dates_dict[date_str][1]
+            if date_str in rows_by_date:
+                for row in rows_by_date[date_str]:
+                    new_rows.append(row)
+                    if row[1] != -1:
+                        prev_page_count = row[1]
             else:
                 # For missing dates, use previous day's page count
                 logger.warning(f"Found missing date: {date_str}, auto-filled")
-                new_rows.append([date_str, prev_page_count, "0"])
+                new_rows.append((date_str, prev_page_count, 0))
+                missing_rows.append(new_rows[-1])
             
             current_date = current_date + timedelta(days=1)
-            
-        # 备份原文件
-        backup_file = f"{csv_file}.backup"
-        try:
-            import shutil
-            shutil.copy2(csv_file, backup_file)
-        except Exception as e:
-            logger.error(f"Failed to create backup: {e}")
-        
-        # 写回文件
-        try:
-            with open(csv_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerows(new_rows)
-        except Exception as e:
-            logger.error(f"Failed to write CSV: {e}")
-            # 恢复备份
-            if os.path.exists(backup_file):
-                shutil.copy2(backup_file, csv_file)
+
+        if not missing_rows:
+            return
+        if isinstance(storage, PartitionedCsvStorage):
+            # Only the months with a missing date are rewritten
+            gap_months = {row[0][:7] for row in missing_rows}
+            for month, month_rows in group_by_month(new_rows).items():
+                if month in gap_months:
+                    storage.replace_month(month, month_rows)
+        elif isinstance(storage, CsvStorage):
+            storage.replace_all(new_rows)
+        else:
+            for row in missing_rows:
+                storage.write(*row)
+        logger.info(f"Filled {len(missing_rows)} missing date(s)")
             
     except Exception as e:
         logger.error(f"Error while filling missing dates: {e}")
@@ -271,24 +667,259 @@ def fill_missing_dates(csv_file):
 # 在文件顶部添加 timedelta 导入
 from datetime import datetime, timedelta
 
+
+def load_printers(config):
+    """
+    Build the list of printers to poll from the configuration.
+    Entries under `printers`, followed by those of the inventory written by
+    discovery.py (`fleet.inventory_file`) for other addresses, inherit port,
+    community_string and timeout from `printer`, and each one gets its own
+    CSV file. Without `printers` the single `printer` entry is polled first
+    and keeps writing to CSV_FILE, so a sweep adding an inventory does not
+    move its history.
+    Each printer gets a `storage` for the configured backend.
+    Raises ValueError if the `snmpv3` settings of a printer are refused by
+    check_snmpv3, so a misconfigured printer stops the collector at startup
+    instead of failing every poll.
+    """
+    csv_file, backend, sqlite_file, partition_dir = storage_settings(config)
+    defaults = config.get('printer') or {}
+    entries = list(config.get('printers') or [])
+    printers = []
+    if not entries:
+        printer = dict(defaults)
+        printer.setdefault('name', printer['ip_address'])
+        printer['csv_file'] = csv_file
+        printer['storage'] = open_storage(backend, printer['name'], csv_file, sqlite_file, partition_dir)
+        printers.append(printer)
+    inventory_file = settings.inventory_file(config)
+    if inventory_file:
+        from discovery import load_inventory
+
+        listed = {entry['ip_address'] for entry in entries + printers}
+        entries += [entry for entry in load_inventory(inventory_file) if entry['ip_address'] not in listed]
+
+    csv_stem, csv_ext = os.path.splitext(config['csv_file_name'])
+    for entry in entries:
+        printer = {**defaults, **entry}
+        printer.setdefault('name', printer['ip_address'])
+        csv_file_name = printer.get('csv_file_name') or f"{csv_stem}_{printer['name']}{csv_ext}"
+        printer['csv_file'] = os.path.join(script_dir, csv_file_name)
+        printer['storage'] = open_storage(backend, printer['name'], printer['csv_file'], sqlite_file,
+                                          partition_dir)
+        printers.append(printer)
+
+    credentials = {}
+    for printer in printers:
+        if printer.get('snmpv3'):
+            try:
+                check_snmpv3(printer['snmpv3'], credentials)
+            except ValueError as e:
+                raise ValueError(f"Printer {printer['name']}: {e}") from None
+    return printers
+
+async def poll_printer(printer, semaphore):
+    """
+    Fill missing dates and query the page count of one printer, then walk
+    its marker and supply tables if `collect_tables` is set.
+    The semaphore bounds how many printers are queried at the same time.
+    Returns the page count, or None if the printer could not be queried.
+    """
+    ip_address = printer['ip_address']
+    port = printer.get('port', 161)
+    community = printer.get('community_string', 'public')
+    timeout = printer.get('timeout', 2)
+    start = time.perf_counter()
+
+    # 检查并填充缺失的日期
+    fill_missing_dates(printer['storage'])
+
+    async with semaphore:
+        page_count = await get_printer_page_count(ip_address, community, port=port, timeout=timeout,
+                                                  storage=printer['storage'],
+                                                  retries=printer.get('retries', DEFAULT_RETRIES),
+                                                  snmpv3=printer.get('snmpv3'))
+        if page_count is not None and printer.get('collect_tables'):
+            # The printer just answered, so its adaptive timeout is known
+            await collect_printer_tables(ip_address, community, port=port,
+                                         timeout=get_device_health(ip_address, port, community, timeout).timeout(),
+                                         storage=printer['storage'], snmpv3=printer.get('snmpv3'))
+    metrics.POLL_DURATION.observe(time.perf_counter() - start, printer=ip_address)
+    return page_count
+
+async def poll_fleet(printers, max_in_flight=50):
+    """
+    Poll every printer concurrently on the running event loop.
+    All requests share one SnmpEngine, and at most max_in_flight printers are
+    queried at once, so a sweep takes about as long as the slowest device.
+    Page counts are stored in batches by a BatchWriter, off the event loop.
+    Returns a dict mapping printer name to page count (None on failure).
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+    start = time.perf_counter()
+    writer = BatchWriter()
+    writer.start()
+    try:
+        results = await asyncio.gather(*(
+            poll_printer(dict(printer, storage=writer.wrap(printer['storage'])), semaphore)
+            for printer in printers), return_exceptions=True)
+    finally:
+        await writer.close()
+    page_counts = {}
+    for printer, result in zip(printers, results):
+        if isinstance(result, Exception):
+            logger.error(f"Polling printer {printer['name']} failed: {result}")
+            result = None
+        page_counts[printer['name']] = result
+    metrics.SWEEP_DURATION.set(time.perf_counter() - start)
+    metrics.SWEEP_FAILURES.set(sum(1 for page_count in page_counts.values() if page_count is None))
+    metrics.SWEEP_TIMESTAMP.set(time.time())
+    return page_counts
+
+async def wait_for_stop(stop, delay):
+    """
+    Sleep for delay seconds, waking up early when stop is set.
+    Returns True if stop was set.
+    """
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=max(0, delay))
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+# Largest jitter, as a fraction of the poll interval, so that two polls of a
+# printer are always at least half an interval apart
+MAX_JITTER_FRACTION = 0.5
+
+def clamp_jitter(poll_interval, jitter):
+    """Return jitter, at most MAX_JITTER_FRACTION of poll_interval."""
+    return max(0, min(jitter, poll_interval * MAX_JITTER_FRACTION))
+
+async def poll_printer_forever(printer, semaphore, stop, poll_interval, jitter):
+    """
+    Poll one printer every poll_interval seconds until stop is set.
+    The first poll is delayed by up to jitter seconds and each interval is
+    shifted by up to +/- jitter seconds, so the fleet is not polled in lockstep.
+    jitter is capped by clamp_jitter, so polls are never sent back to back.
+    """
+    jitter = clamp_jitter(poll_interval, jitter)
+    delay = random.uniform(0, jitter)
+    while not await wait_for_stop(stop, delay):
+        try:
+            await poll_printer(printer, semaphore)
+        except Exception as e:
+            logger.error(f"Polling printer {printer['name']} failed: {e}")
+        delay = poll_interval + random.uniform(-jitter, jitter)
+
+async def run_daemon(printers, max_in_flight=50, poll_interval=3600, jitter=60, stop=None):
+    """
+    Keep polling the fleet on one event loop and one SnmpEngine until SIGTERM
+    or SIGINT, or until the asyncio.Event stop is set. Printers may override
+    poll_interval with their own `poll_interval`. Polls in progress when the
+    daemon is stopped are completed.
+    Raises ValueError if a poll interval is not positive.
+    """
+    intervals = {printer['name']: printer.get('poll_interval', poll_interval) for printer in printers}
+    for name, interval in intervals.items():
+        if not interval or interval <= 0:
+            raise ValueError(f"The poll interval of printer {name} must be positive, got {interval}")
+    shortest = min(intervals.values(), default=poll_interval)
+    if jitter > clamp_jitter(shortest, jitter):
+        logger.warning(f"daemon.jitter of {jitter}s is more than half the poll interval of {shortest}s, "
+                       f"polls are shifted by at most half their interval instead")
+
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:
+            # Signal handlers are not available on Windows event loops
+            pass
+
+    semaphore = asyncio.Semaphore(max_in_flight)
+    writer = BatchWriter()
+    writer.start()
+    logger.info(f"Collector started for {len(printers)} printer(s)")
+    try:
+        await asyncio.gather(*(
+            poll_printer_forever(dict(printer, storage=writer.wrap(printer['storage'])), semaphore, stop,
+                                 intervals[printer['name']], jitter)
+            for printer in printers))
+    finally:
+        await writer.close()
+    logger.info("Collector stopped")
+
 # 在主函数中添加调用
 if __name__ == "__main__":
-    printer_config = config['printer']
-    
-    # Use configuration values
-    printer_ip = printer_config['ip_address']
-    port = printer_config['port']
-    community = printer_config['community_string']
-    timeout = printer_config['timeout']
-    
+    parser = argparse.ArgumentParser(description="Collect printer page counts via SNMP.")
+    parser.add_argument('--repair-history', action='store_true',
+                        help="check the whole history of every printer for missing dates and exit")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running and poll every printer on the interval set under `daemon`")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the run with cProfile and write the dump to the logging directory")
+    args = parser.parse_args()
+
+    # Logs the time spent in each stage on exit, and writes the profile
+    timing.track_run('printer', profile=args.profile)
+
+    config = load_config()
+    setup_logging(config)
+    configure_circuit_breaker(config.get('circuit_breaker'))
+    try:
+        printers = load_printers(config)
+    except ValueError as e:
+        print(f"Error: {e}")
+        logger.error(f"Error: {e}")
+        exit(2)
+    max_in_flight = config.get('fleet', {}).get('max_in_flight', 50)
+    metrics_config = config.get('metrics') or {}
+
+    if args.repair_history:
+        for printer in printers:
+            fill_missing_dates(printer['storage'], full=True)
+        exit(0)
+
+    if args.daemon:
+        daemon_config = config.get('daemon') or {}
+        V3_ENGINE_CACHE_LIFETIME = daemon_config.get('engine_cache_lifetime', V3_ENGINE_CACHE_LIFETIME)
+
+        async def run():
+            metrics_server = None
+            if metrics_config.get('http_port'):
+                metrics_server = await metrics.start_metrics_server(
+                    metrics_config.get('http_address', '127.0.0.1'), metrics_config['http_port'])
+            try:
+                await run_daemon(printers, max_in_flight,
+                                 daemon_config.get('poll_interval', 3600),
+                                 daemon_config.get('jitter', 60))
+            finally:
+                close_snmp_engine()
+                if metrics_server is not None:
+                    metrics_server.close()
+
+        try:
+            asyncio.run(run())
+        except ValueError as e:
+            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
+            exit(2)
+        exit(0)
+
     async def main():
-        if not await check_network_connectivity(printer_ip, community, port, timeout):
-            logger.error(f"Failed to connect to printer at {printer_ip}:{port}")
+        try:
+            page_counts = await poll_fleet(printers, max_in_flight)
+        finally:
+            close_snmp_engine()
+        if metrics_config.get('textfile'):
+            try:
+                metrics.write_textfile(metrics_config['textfile'])
+            except OSError as e:
+                logger.error(f"Failed to write metrics to {metrics_config['textfile']}: {e}")
+        failed = [name for name, page_count in page_counts.items() if page_count is None]
+        if failed:
+            logger.error(f"Failed to query {len(failed)} of {len(printers)} printer(s): {', '.join(failed)}")
             exit(1)
-            
-        await get_printer_page_count(printer_ip, community)
-        
-        # 检查并填充缺失的日期
-        fill_missing_dates(CSV_FILE)
-    
+
     asyncio.run(main())
@@ -0,0 +1,140 @@
+import time
+
+# Shortest timeout used for a printer, however fast it has answered so far
+# (the 1 second minimum retransmission timeout of RFC 6298)
+MIN_TIMEOUT = 1.0
+
+# Circuit breaker defaults, see configure_circuit_breaker
+FAILURE_THRESHOLD = 3
+COOLDOWN = 300
+MAX_COOLDOWN = 3600
+
+
+class RttEstimator:
+    """
+    Smoothed round-trip time of one printer, estimated like the TCP
+    retransmission timer (RFC 6298). The timeout is the smoothed RTT plus four
+    times its variation, kept between min_timeout and max_timeout; it is
+    max_timeout until the printer has answered once.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self, max_timeout, min_timeout=MIN_TIMEOUT):
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.srtt = None
+        self.rttvar = None
+
+    def update(self, rtt):
+        """Add the round-trip time of an answered request, in seconds."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+    def timeout(self):
+        """Return the timeout of the next request in seconds."""
+        if self.srtt is None:
+            return self.max_timeout
+        return max(self.min_timeout, min(self.max_timeout, self.srtt + 4 * self.rttvar))
+
+
+class CircuitBreaker:
+    """
+    Tracks failed polls of one printer. After failure_threshold failures in a
+    row the breaker opens and the printer is only probed again once cooldown
+    seconds have passed; every failed probe doubles the wait, up to
+    max_cooldown. A successful poll closes the breaker.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.current_cooldown = cooldown
+        self.open_until = None
+
+    def allow_request(self, now=None):
+        """Return True if the printer should be queried now."""
+        now = time.monotonic() if now is None else now
+        return self.open_until is None or now >= self.open_until
+
+    def record_success(self):
+        self.failures = 0
+        self.current_cooldown = self.cooldown
+        self.open_until = None
+
+    def record_failure(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.failures += 1
+        if self.open_until is not None:
+            # The probe after a cooldown failed as well
+            self.current_cooldown = min(self.current_cooldown * 2, self.max_cooldown)
+        if self.failures >= self.failure_threshold:
+            self.open_until = now + self.current_cooldown
+
+
+class DeviceHealth:
+    """Round-trip time and circuit breaker of one printer."""
+
+    def __init__(self, max_timeout):
+        self.rtt = RttEstimator(max_timeout)
+        self.breaker = CircuitBreaker(FAILURE_THRESHOLD, COOLDOWN, MAX_COOLDOWN)
+
+    @property
+    def max_timeout(self):
+        return self.rtt.max_timeout
+
+    def timeout(self):
+        return self.rtt.timeout()
+
+    def allow_request(self):
+        return self.breaker.allow_request()
+
+    def seconds_until_probe(self):
+        """Return how long the printer is still skipped, 0 if it is not."""
+        if self.breaker.open_until is None:
+            return 0
+        return max(0, self.breaker.open_until - time.monotonic())
+
+
+# DeviceHealth of every printer polled by this process, keyed by
+# (ip_address, port, community_string): agents that proxy several devices
+# tell them apart by community
+_device_health = {}
+
+
+def get_device_health(ip_address, port, community_string, max_timeout):
+    """
+    Return the DeviceHealth of the printer at ip_address:port, created on first
+    use. max_timeout is its configured timeout, the longest it is waited for.
+    """
+    key = (ip_address, port, community_string)
+    health = _device_health.get(key)
+    if health is None:
+        health = _device_health[key] = DeviceHealth(max_timeout)
+    else:
+        health.rtt.max_timeout = max_timeout
+    return health
+
+
+def reset_device_health():
+    """Forget the round-trip times and failures of every printer."""
+    _device_health.clear()
+
+
+def configure_circuit_breaker(breaker_config):
+    """
+    Set the circuit breaker of printers created from now on from the
+    `circuit_breaker` section of the configuration (None keeps the defaults).
+    """
+    global FAILURE_THRESHOLD, COOLDOWN, MAX_COOLDOWN
+    breaker_config = breaker_config or {}
+    FAILURE_THRESHOLD = breaker_config.get('failure_threshold', FAILURE_THRESHOLD)
+    COOLDOWN = breaker_config.get('cooldown', COOLDOWN)
+    MAX_COOLDOWN = breaker_config.get('max_cooldown', MAX_COOLDOWN)
@@ -0,0 +1,117 @@
+import logging
+import os
+
+import timing
+
+# Get the directory containing the scripts
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(script_dir, 'config.yaml')
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+logger = logging.getLogger('report_logger')
+
+# Configuration read by load_config, keyed by path
+_configs = {}
+_logging_configured = False
+
+
+def load_config(path=None):
+    """
+    Read the YAML configuration (config.yaml next to the scripts by default).
+    The file is parsed once and the same dict is returned on later calls, so
+    modules can call this on first use instead of at import time.
+    """
+    path = os.path.abspath(path or CONFIG_FILE)
+    if path not in _configs:
+        with timing.span('load_config'):
+            import yaml
+
+            with open(path, 'r') as f:
+                _configs[path] = yaml.safe_load(f)
+    return _configs[path]
+
+
+def setup_logging(config=None, console=True):
+    """
+    Attach the log handlers to report_logger: a console handler if console is
+    set, and the daily rotating file under `logging.directory` if logging is
+    enabled in the configuration. Only the first call has an effect, so every
+    entry point can call it without duplicating handlers.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return logger
+    _logging_configured = True
+    config = config or load_config()
+
+    logger.setLevel(logging.INFO)
+    if console:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+
+    logging_config = config.get('logging') or {}
+    if logging_config.get('enabled'):
+        from logging.handlers import TimedRotatingFileHandler
+
+        # Create logs directory if it doesn't exist
+        log_dir = os.path.join(script_dir, logging_config['directory'])
+        os.makedirs(log_dir, exist_ok=True)
+        logger.setLevel(getattr(logging, logging_config['level']))
+
+        # Create a timed rotating file handler
+        handler = TimedRotatingFileHandler(
+            os.path.join(log_dir, 'report.log'),
+            when='midnight',
+            interval=1,
+            backupCount=logging_config['max_days']
+        )
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    return logger
+
+
+def csv_file(config=None):
+    """Return the absolute path of the page count CSV file of the single `printer`."""
+    config = config or load_config()
+    return os.path.join(script_dir, config['csv_file_name'])
+
+
+def storage_backend(config=None):
+    """
+    Return the page count storage backend: 'csv' (one file per printer),
+    'partitioned' (one file per printer and month) or 'sqlite'.
+    """
+    config = config or load_config()
+    return (config.get('storage') or {}).get('backend', 'csv')
+
+
+def sqlite_file(config=None):
+    """Return the absolute path of the SQLite database shared by the fleet."""
+    config = config or load_config()
+    storage_config = config.get('storage') or {}
+    return os.path.join(script_dir, storage_config.get('sqlite_file', 'printer_page_counts.db'))
+
+
+def partition_dir(config=None):
+    """Return the absolute directory of the monthly CSV files of the 'partitioned' backend."""
+    config = config or load_config()
+    storage_config = config.get('storage') or {}
+    return os.path.join(script_dir, storage_config.get('partition_dir', 'page_counts'))
+
+
+def printer_id(config=None):
+    """Return the storage key of the single `printer`: its name, or its IP address."""
+    config = config or load_config()
+    return config['printer'].get('name', config['printer']['ip_address'])
+
+
+def inventory_file(config=None):
+    """
+    Return the absolute path of the printer inventory written by discovery.py
+    (`fleet.inventory_file`), or None if none is configured.
+    """
+    config = config or load_config()
+    file_name = (config.get('fleet') or {}).get('inventory_file')
+    return os.path.join(script_dir, file_name) if file_name else None
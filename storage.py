@@ -0,0 +1,583 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+
+from atomic_file import write_file_atomically
+from history import load_date_index, read_last_row, read_rows_between, truncate_partial_row
+
+logger = logging.getLogger('report_logger')
+
+
+def group_by_month(rows):
+    """Return {YYYY-MM: rows} of (date, ...) rows, keeping their order within each month."""
+    rows_by_month = {}
+    for row in rows:
+        rows_by_month.setdefault(row[0][:7], []).append(row)
+    return rows_by_month
+
+
+class CsvStorage:
+    """
+    Page count history of one printer in a CSV file of
+    (date, total_page_count, net_increase) rows, appended to on every poll.
+    Suited to small installs; lookups go through the helpers in history.
+    """
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        # Other Printer-MIB series, one (date, metric, value) row per sample
+        root, ext = os.path.splitext(csv_file)
+        self.metrics_file = f"{root}.metrics{ext or '.csv'}"
+
+    def __repr__(self):
+        return f"CsvStorage({self.csv_file!r})"
+
+    def fingerprint(self):
+        """Return a value that changes whenever the history does, None if there is no file."""
+        try:
+            stat = os.stat(self.csv_file)
+        except FileNotFoundError:
+            return None
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+    def latest(self):
+        """Return (total_page_count, date) of the last row, or (0, None) if there is none."""
+        try:
+            last_row = read_last_row(self.csv_file)
+        except FileNotFoundError:
+            return 0, None
+        if last_row:
+            return int(last_row[1]), last_row[0]
+        return 0, None
+
+    def has_date(self, date):
+        """Return True if a row exists for date."""
+        try:
+            return load_date_index(self.csv_file).contains(date)
+        except FileNotFoundError:
+            return False
+
+    def write(self, date, total_page_count, net_increase):
+        """Append a row. Several rows may share a date; readers add up their net increase."""
+        if os.path.exists(self.csv_file):
+            partial = truncate_partial_row(self.csv_file)
+            if partial:
+                logger.warning(f"Dropped incomplete last line from {self.csv_file}: {partial!r}")
+        with open(self.csv_file, 'a', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow([date, total_page_count, net_increase])
+
+    def write_many(self, rows):
+        """
+        Append (date, total_page_count, net_increase) rows with one open and
+        one fsync, so they are on disk when this returns.
+        """
+        if os.path.exists(self.csv_file):
+            partial = truncate_partial_row(self.csv_file)
+            if partial:
+                logger.warning(f"Dropped incomplete last line from {self.csv_file}: {partial!r}")
+        with open(self.csv_file, 'a', newline='') as csvfile:
+            csv.writer(csvfile).writerows(rows)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+
+    def read_range(self, start_date=None, end_date=None):
+        """
+        Return (date, total_page_count, net_increase) rows dated between
+        start_date and end_date (both inclusive, either may be None).
+        Incomplete rows are skipped: a last line without a newline, left by
+        an interrupted write, and rows with fewer than three fields.
+        Raises FileNotFoundError if the CSV file does not exist.
+        """
+        if start_date or end_date:
+            rows = read_rows_between(self.csv_file, start_date, end_date)
+        else:
+            with open(self.csv_file, 'r', newline='') as csvfile:
+                text = csvfile.read()
+            rows = csv.reader(io.StringIO(text[:text.rfind('\n') + 1]))
+        return [(row[0], int(row[1]), int(row[2])) for row in rows if len(row) >= 3]
+
+    def write_metrics(self, date, metrics):
+        """Append one row per metric, see printer.walk_printer_tables."""
+        with open(self.metrics_file, 'a', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerows([date, metric, value] for metric, value in sorted(metrics.items()))
+
+    def read_metrics(self, start_date=None, end_date=None):
+        """
+        Return (date, metric, value) rows dated between start_date and end_date
+        (both inclusive, either may be None). Missing metrics file gives no rows.
+        """
+        try:
+            with open(self.metrics_file, 'r') as csvfile:
+                rows = [(row[0], row[1], int(row[2])) for row in csv.reader(csvfile) if row]
+        except FileNotFoundError:
+            return []
+        return [row for row in rows
+                if (not start_date or row[0] >= start_date) and (not end_date or row[0] <= end_date)]
+
+    def replace_all(self, rows):
+        """
+        Replace the whole file with rows. They are written to a temporary file
+        in the same directory which then atomically replaces the CSV file, so a
+        crash leaves either the old or the new history, never a mix.
+        """
+        write_file_atomically(self.csv_file, lambda csvfile: csv.writer(csvfile).writerows(rows),
+                              newline='', fsync=True)
+
+    def close(self):
+        pass
+
+
+class PartitionedCsvStorage:
+    """
+    Page count history of one printer split into one CSV file per month,
+    <partition_dir>/<printer_id>/<YYYY-MM>.csv, in the same format as
+    CsvStorage. A poll appends to the file of the current month only, a
+    date-range read opens only the months in the range, and filling a gap
+    rewrites only the months it falls in. manifest.json lists the months
+    that have a file and is replaced atomically when one is added or removed.
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, partition_dir, printer_id):
+        self.partition_dir = partition_dir
+        self.printer_id = str(printer_id)
+        self.directory = os.path.join(partition_dir, self.printer_id.replace(os.sep, '_'))
+        self.manifest_file = os.path.join(self.directory, 'manifest.json')
+        # Marker and supply series are not partitioned, see CsvStorage
+        self.metrics_file = os.path.join(self.directory, 'metrics.csv')
+        self._manifest = None
+        self._manifest_stat = None
+
+    def __repr__(self):
+        return f"PartitionedCsvStorage({self.partition_dir!r}, {self.printer_id!r})"
+
+    def fingerprint(self):
+        """Return a value that changes whenever the history does, None if there is none."""
+        months = self._existing_months()
+        if not months:
+            return None
+        return [[month] + (CsvStorage(self.shard_file(month)).fingerprint() or []) for month in months]
+
+    def shard_file(self, month):
+        """Return the CSV file holding the rows of month (YYYY-MM)."""
+        return os.path.join(self.directory, f'{month}.csv')
+
+    def months(self):
+        """
+        Return the months that have a file, oldest first.
+        Raises FileNotFoundError if no page count was ever written.
+        """
+        stat = os.stat(self.manifest_file)
+        if (stat.st_size, stat.st_mtime_ns) != self._manifest_stat:
+            with open(self.manifest_file, 'r') as f:
+                self._manifest = sorted(json.load(f)['months'])
+            self._manifest_stat = (stat.st_size, stat.st_mtime_ns)
+        return list(self._manifest)
+
+    def _save_months(self, months):
+        """Replace the manifest with months, through a temporary file."""
+        manifest = {'version': self.MANIFEST_VERSION, 'printer_id': self.printer_id, 'months': sorted(months)}
+        write_file_atomically(self.manifest_file, lambda f: json.dump(manifest, f), fsync=True)
+
+    def _existing_months(self):
+        try:
+            return self.months()
+        except FileNotFoundError:
+            return []
+
+    def _add_months(self, months):
+        """
+        Make sure the manifest lists months. Called once their files are
+        written, so every month listed has a file.
+        """
+        existing = self._existing_months()
+        if set(months) - set(existing):
+            self._save_months(set(existing) | set(months))
+
+    def latest(self):
+        """Return (total_page_count, date) of the last row of the latest month, or (0, None)."""
+        for month in reversed(self._existing_months()):
+            try:
+                last_row = read_last_row(self.shard_file(month))
+            except FileNotFoundError:
+                continue
+            if last_row:
+                return int(last_row[1]), last_row[0]
+        return 0, None
+
+    def has_date(self, date):
+        """Return True if a row exists for date."""
+        if date[:7] not in self._existing_months():
+            return False
+        return CsvStorage(self.shard_file(date[:7])).has_date(date)
+
+    def write(self, date, total_page_count, net_increase):
+        """Append a row to the file of its month."""
+        os.makedirs(self.directory, exist_ok=True)
+        CsvStorage(self.shard_file(date[:7])).write(date, total_page_count, net_increase)
+        self._add_months([date[:7]])
+
+    def write_many(self, rows):
+        """Append rows with one open and fsync per month they fall in."""
+        rows_by_month = group_by_month(rows)
+        os.makedirs(self.directory, exist_ok=True)
+        for month, month_rows in rows_by_month.items():
+            CsvStorage(self.shard_file(month)).write_many(month_rows)
+        self._add_months(rows_by_month)
+
+    def read_range(self, start_date=None, end_date=None):
+        """
+        Return (date, total_page_count, net_increase) rows dated between
+        start_date and end_date (both inclusive, either may be None). Months
+        outside the range are not opened. Raises FileNotFoundError if no page
+        count was ever written.
+        """
+        rows = []
+        for month in self.months():
+            if (start_date and month < start_date[:7]) or (end_date and month > end_date[:7]):
+                continue
+            shard = CsvStorage(self.shard_file(month))
+            # Only the first and last month need the date index
+            whole_month = ((not start_date or month > start_date[:7]) and
+                           (not end_date or month < end_date[:7]))
+            try:
+                if whole_month:
+                    rows.extend(shard.read_range())
+                else:
+                    rows.extend(shard.read_range(start_date, end_date))
+            except FileNotFoundError:
+                logger.warning(f"{self.shard_file(month)} is listed in {self.manifest_file} but missing")
+        return rows
+
+    def write_metrics(self, date, metrics):
+        """Append one row per metric to metrics.csv, see CsvStorage.write_metrics."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.metrics_file, 'a', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerows([date, metric, value] for metric, value in sorted(metrics.items()))
+
+    def read_metrics(self, start_date=None, end_date=None):
+        """Return the (date, metric, value) rows of metrics.csv, see CsvStorage.read_metrics."""
+        try:
+            with open(self.metrics_file, 'r') as csvfile:
+                rows = [(row[0], row[1], int(row[2])) for row in csv.reader(csvfile) if row]
+        except FileNotFoundError:
+            return []
+        return [row for row in rows
+                if (not start_date or row[0] >= start_date) and (not end_date or row[0] <= end_date)]
+
+    def replace_month(self, month, rows):
+        """
+        Replace the file of month with rows (all dated in that month), atomically
+        like CsvStorage.replace_all; no rows removes the file.
+        """
+        if rows:
+            os.makedirs(self.directory, exist_ok=True)
+            CsvStorage(self.shard_file(month)).replace_all(rows)
+            self._add_months([month])
+            return
+        months = self._existing_months()
+        if month in months:
+            self._save_months([m for m in months if m != month])
+        if os.path.exists(self.shard_file(month)):
+            os.unlink(self.shard_file(month))
+
+    def replace_all(self, rows):
+        """
+        Replace the whole history with rows. Only the months whose rows change
+        are rewritten, and months left without rows are removed.
+        """
+        rows_by_month = group_by_month(rows)
+        for month in self._existing_months():
+            if month not in rows_by_month:
+                self.replace_month(month, [])
+        for month, month_rows in rows_by_month.items():
+            try:
+                unchanged = CsvStorage(self.shard_file(month)).read_range() == month_rows
+            except FileNotFoundError:
+                unchanged = False
+            if not unchanged:
+                self.replace_month(month, month_rows)
+
+    def close(self):
+        pass
+
+
+# sqlite3 connections shared by every SqliteStorage on the same database file,
+# keyed by (absolute path, role)
+_sqlite_connections = {}
+
+
+def _connect_sqlite(db_file, role='default'):
+    """
+    Return the connection to db_file for role. write_batches uses its own
+    'writer' connection from the writer thread, so its transactions never
+    mix with statements sent on the default connection.
+    """
+    key = (os.path.abspath(db_file), role)
+    connection = _sqlite_connections.get(key)
+    if connection is None:
+        connection = sqlite3.connect(key[0], check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS page_counts (
+                printer_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                total_page_count INTEGER NOT NULL,
+                net_increase INTEGER NOT NULL,
+                PRIMARY KEY (printer_id, date)
+            ) WITHOUT ROWID
+        ''')
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS metrics (
+                printer_id TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                date TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (printer_id, metric, date)
+            ) WITHOUT ROWID
+        ''')
+        connection.commit()
+        _sqlite_connections[key] = connection
+    return connection
+
+
+def reset_connections():
+    """
+    Forget the SQLite connections opened so far, without closing them. A
+    process forked from one that used them calls this so it opens its own.
+    """
+    _sqlite_connections.clear()
+
+
+class SqliteStorage:
+    """
+    Page count history of one printer in a SQLite database shared by the
+    whole fleet, keyed on (printer_id, date) and opened in WAL mode so the
+    report can read while the collector writes.
+    """
+
+    def __init__(self, db_file, printer_id):
+        self.db_file = db_file
+        self.printer_id = str(printer_id)
+        self.connection = _connect_sqlite(db_file)
+
+    def __repr__(self):
+        return f"SqliteStorage({self.db_file!r}, {self.printer_id!r})"
+
+    def __reduce__(self):
+        # A connection can't be sent to another process: the copy opens its own
+        return SqliteStorage, (self.db_file, self.printer_id)
+
+    def fingerprint(self):
+        """Return a value that changes whenever the history does, None if there is none."""
+        row = self.connection.execute(
+            'SELECT COUNT(*), MAX(date), SUM(total_page_count), SUM(net_increase) '
+            'FROM page_counts WHERE printer_id = ?', (self.printer_id,)).fetchone()
+        return list(row) if row[0] else None
+
+    def latest(self):
+        """Return (total_page_count, date) of the latest date, or (0, None) if there is none."""
+        row = self.connection.execute(
+            'SELECT total_page_count, date FROM page_counts WHERE printer_id = ? '
+            'ORDER BY date DESC LIMIT 1', (self.printer_id,)).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def has_date(self, date):
+        """Return True if a row exists for date."""
+        row = self.connection.execute(
+            'SELECT 1 FROM page_counts WHERE printer_id = ? AND date = ?',
+            (self.printer_id, date)).fetchone()
+        return row is not None
+
+    # A second write for the same date keeps the latest total and adds up the
+    # net increase, the same way read_csv_data folds duplicate CSV rows
+    UPSERT = ('INSERT INTO page_counts (printer_id, date, total_page_count, net_increase) '
+              'VALUES (?, ?, ?, ?) '
+              'ON CONFLICT (printer_id, date) DO UPDATE SET '
+              'total_page_count = excluded.total_page_count, '
+              'net_increase = net_increase + excluded.net_increase')
+
+    def write(self, date, total_page_count, net_increase):
+        """Insert or update the row for date, see UPSERT."""
+        with self.connection:
+            self.connection.execute(
+                self.UPSERT, (self.printer_id, date, int(total_page_count), int(net_increase)))
+
+    def write_many(self, rows):
+        """Insert or update (date, total_page_count, net_increase) rows in one transaction."""
+        with self.connection:
+            self.connection.executemany(self.UPSERT, self._upsert_params(rows))
+
+    def _upsert_params(self, rows):
+        return [(self.printer_id, date, int(total), int(net)) for date, total, net in rows]
+
+    METRICS_UPSERT = 'INSERT OR REPLACE INTO metrics (printer_id, metric, date, value) VALUES (?, ?, ?, ?)'
+
+    def write_metrics(self, date, metrics):
+        """Store the latest value of each metric for date, see printer.walk_printer_tables."""
+        with self.connection:
+            self.connection.executemany(self.METRICS_UPSERT, self._metrics_params(date, metrics))
+
+    def _metrics_params(self, date, metrics):
+        return [(self.printer_id, metric, date, int(value)) for metric, value in metrics.items()]
+
+    def read_metrics(self, start_date=None, end_date=None):
+        """
+        Return (date, metric, value) rows dated between start_date and end_date
+        (both inclusive, either may be None).
+        """
+        return self._select_range(
+            'SELECT date, metric, value FROM metrics WHERE printer_id = ?',
+            start_date, end_date, 'date, metric')
+
+    def read_range(self, start_date=None, end_date=None):
+        """
+        Return (date, total_page_count, net_increase) rows dated between
+        start_date and end_date (both inclusive, either may be None).
+        """
+        return self._select_range(
+            'SELECT date, total_page_count, net_increase FROM page_counts WHERE printer_id = ?',
+            start_date, end_date, 'date')
+
+    def _select_range(self, query, start_date, end_date, order_by):
+        params = [self.printer_id]
+        if start_date:
+            query += ' AND date >= ?'
+            params.append(start_date)
+        if end_date:
+            query += ' AND date <= ?'
+            params.append(end_date)
+        return self.connection.execute(f'{query} ORDER BY {order_by}', params).fetchall()
+
+    def close(self):
+        pass
+
+
+def write_batches(batches, metrics=()):
+    """
+    Store the rows of several storages at once, given as (storage, rows) pairs,
+    and the Printer-MIB values given as (storage, date, values) triples.
+    Each CSV file is opened and fsynced once, and the rows and values of all
+    printers sharing a SQLite database go into one transaction on its writer
+    connection.
+    Returns (storage, exception) pairs for the writes that failed.
+    """
+    failures = []
+    sqlite_batches = {}
+    for storage, rows in batches:
+        if isinstance(storage, SqliteStorage):
+            sqlite_batches.setdefault(os.path.abspath(storage.db_file), ([], []))[0].append((storage, rows))
+            continue
+        try:
+            storage.write_many(rows)
+        except Exception as e:
+            failures.append((storage, e))
+    for storage, date, values in metrics:
+        if isinstance(storage, SqliteStorage):
+            sqlite_batches.setdefault(os.path.abspath(storage.db_file), ([], []))[1].append(
+                (storage, date, values))
+            continue
+        try:
+            storage.write_metrics(date, values)
+        except Exception as e:
+            failures.append((storage, e))
+
+    for db_file, (db_batches, db_metrics) in sqlite_batches.items():
+        try:
+            connection = _connect_sqlite(db_file, 'writer')
+            with connection:
+                connection.executemany(SqliteStorage.UPSERT, [
+                    params for storage, rows in db_batches for params in storage._upsert_params(rows)])
+                connection.executemany(SqliteStorage.METRICS_UPSERT, [
+                    params for storage, date, values in db_metrics
+                    for params in storage._metrics_params(date, values)])
+        except Exception as e:
+            failures.extend((storage, e) for storage, *_ in db_batches + db_metrics)
+    return failures
+
+
+def open_storage(backend, printer_id, csv_file=None, sqlite_file=None, partition_dir=None):
+    """
+    Return the storage of one printer for the configured backend
+    ('csv', 'partitioned' or 'sqlite').
+    """
+    if backend == 'csv':
+        return CsvStorage(csv_file)
+    elif backend == 'partitioned':
+        return PartitionedCsvStorage(partition_dir, printer_id)
+    elif backend == 'sqlite':
+        return SqliteStorage(sqlite_file, printer_id)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def migrate_csv_to_sqlite(csv_file, db_file, printer_id):
+    """
+    Import the history of one printer from a CSV file into SQLite.
+    Rows sharing a date are folded like read_csv_data does, and existing rows
+    for the same dates are replaced, so the migration can be re-run safely.
+    Returns the number of dates imported.
+    """
+    folded = {}
+    for date, total_page_count, net_increase in CsvStorage(csv_file).read_range():
+        if date in folded:
+            folded[date] = (total_page_count, folded[date][1] + net_increase)
+        else:
+            folded[date] = (total_page_count, net_increase)
+
+    connection = _connect_sqlite(db_file)
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO page_counts (printer_id, date, total_page_count, net_increase) '
+            'VALUES (?, ?, ?, ?)',
+            [(str(printer_id), date, total, net) for date, (total, net) in folded.items()])
+    logger.info(f"Imported {len(folded)} dates for printer {printer_id} from {csv_file} into {db_file}")
+    return len(folded)
+
+
+def migrate_csv_to_partitions(csv_file, partition_dir, printer_id):
+    """
+    Split the history of one printer from a CSV file into the monthly files
+    of PartitionedCsvStorage. Rows keep their order, and the months found in
+    the CSV file are replaced, so the migration can be re-run safely. The
+    metrics file of the CSV file, if any, is copied along.
+    Returns the number of months written.
+    """
+    source = CsvStorage(csv_file)
+    target = PartitionedCsvStorage(partition_dir, printer_id)
+    rows_by_month = group_by_month(source.read_range())
+    os.makedirs(target.directory, exist_ok=True)
+    for month, rows in rows_by_month.items():
+        CsvStorage(target.shard_file(month)).replace_all(rows)
+    # The manifest is written last, once every month it lists has its file
+    target._add_months(rows_by_month)
+    if os.path.exists(source.metrics_file):
+        shutil.copyfile(source.metrics_file, target.metrics_file)
+    logger.info(f"Split {csv_file} into {len(rows_by_month)} monthly file(s) in {target.directory}")
+    return len(rows_by_month)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import page count history from a CSV file into SQLite or monthly CSV files.")
+    parser.add_argument('csv_file', help="CSV file to import")
+    parser.add_argument('target', help="SQLite database, or partition directory with --backend partitioned")
+    parser.add_argument('printer_id', help="Printer the CSV history belongs to (its name in config.yaml)")
+    parser.add_argument('--backend', choices=['sqlite', 'partitioned'], default='sqlite',
+                        help="storage backend to import into (default: sqlite)")
+    args = parser.parse_args()
+    if args.backend == 'partitioned':
+        count = migrate_csv_to_partitions(args.csv_file, args.target, args.printer_id)
+        print(f"Wrote {count} monthly files into {args.target}")
+    else:
+        count = migrate_csv_to_sqlite(args.csv_file, args.target, args.printer_id)
+        print(f"Imported {count} dates into {args.target}")
@@ -0,0 +1,137 @@
+import atexit
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('report_logger')
+
+# Duration of every stage so far: {stage: [count, total seconds, longest seconds]}
+_stages = {}
+_lock = threading.Lock()
+
+
+def record(stage, duration):
+    """Add one span of stage that took duration seconds."""
+    with _lock:
+        totals = _stages.get(stage)
+        if totals is None:
+            _stages[stage] = [1, duration, duration]
+        else:
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+
+
+@contextmanager
+def span(stage, **fields):
+    """
+    Time the block as one span of stage. Each span is logged at DEBUG level
+    as `span stage=<stage> duration_ms=<ms>` followed by fields, which are
+    also set on the log record for structured handlers, and added to the
+    summary of the run.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        record(stage, duration)
+        if logger.isEnabledFor(logging.DEBUG):
+            fields = dict(stage=stage, duration_ms=round(duration * 1000, 3), **fields)
+            logger.debug('span ' + ' '.join(f'{name}={value}' for name, value in fields.items()),
+                         extra=fields)
+
+
+def timed(stage):
+    """Decorator timing every call of a function or coroutine function as a span of stage."""
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with span(stage):
+                    return await function(*args, **kwargs)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with span(stage):
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary():
+    """Return {stage: {'count', 'total_ms', 'mean_ms', 'max_ms'}} of the spans so far, longest total first."""
+    with _lock:
+        stages = sorted(_stages.items(), key=lambda item: item[1][1], reverse=True)
+    return {stage: {'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'mean_ms': round(total * 1000 / count, 3),
+                    'max_ms': round(longest * 1000, 3)}
+            for stage, (count, total, longest) in stages}
+
+
+def log_summary(run):
+    """Log the summary of the spans of run at INFO level, one line per stage."""
+    for stage, totals in summary().items():
+        fields = dict(run=run, stage=stage, **totals)
+        logger.info('timing ' + ' '.join(f'{name}={value}' for name, value in fields.items()), extra=fields)
+
+
+def reset():
+    """Forget the spans recorded so far."""
+    with _lock:
+        _stages.clear()
+
+
+def profile_file(name, config=None):
+    """Return the path of a new cProfile dump of script name, in the `logging.directory` of the configuration."""
+    from settings import load_config, script_dir
+
+    config = config or load_config()
+    log_dir = os.path.join(script_dir, (config.get('logging') or {}).get('directory', 'logs'))
+    return os.path.join(log_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+
+
+def start_profiling():
+    """Start profiling this thread with cProfile and return the profiler."""
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profiling(profiler, name, config=None):
+    """
+    Stop profiler and write its statistics to profile_file(name), which can
+    be read with `python -m pstats` or snakeviz. Returns the path written.
+    """
+    profiler.disable()
+    path = profile_file(name, config)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profiler.dump_stats(path)
+    logger.info(f"Profile of {name} written to {path}")
+    return path
+
+
+def track_run(name, profile=False):
+    """
+    Log the summary of the spans when the script exits, however it exits.
+    With profile set the rest of the run is profiled with cProfile and the
+    dump is written next to the logs, see stop_profiling.
+    """
+    profiler = start_profiling() if profile else None
+
+    def finish():
+        if profiler is not None:
+            try:
+                stop_profiling(profiler, name)
+            except OSError as e:
+                logger.error(f"Failed to write the profile of {name}: {e}")
+        log_summary(name)
+
+    atexit.register(finish)
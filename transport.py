@@ -0,0 +1,142 @@
+import asyncio
+import random
+
+# Error indication of a request that got no answer, as pysnmp words it
+TIMEOUT = 'No SNMP response received before timeout'
+
+
+class _Exception:
+    """SNMPv2 exception value (noSuchObject, endOfMibView) in a response var bind."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+NO_SUCH_OBJECT = _Exception('noSuchObject')
+END_OF_MIB = _Exception('endOfMibView')
+
+
+def oid_key(oid):
+    """Return the sort key of a dotted OID, so that 1.3.6.1.10 comes after 1.3.6.1.9."""
+    return tuple(int(part) for part in str(oid).split('.') if part)
+
+
+class FakeAgent:
+    """
+    Scripted SNMP agent of one printer in a FakeTransport.
+
+    values maps dotted OIDs to their value; a callable value is called on
+    every request for it, e.g. itertools.count(5000).__next__ for a page
+    count that grows with each poll. Requests are answered after latency
+    seconds, and can be made to fail:
+      - online=False: every request times out
+      - timeouts: that many of the next attempts time out
+      - loss: each attempt is dropped with this probability
+      - error_status: answered with this error status, e.g. 'genErr'
+      - error: this exception is raised by the request, like a socket error
+      - community_string: requests with another community time out, as
+        real agents ignore them (None accepts any)
+    """
+
+    def __init__(self, values=None, latency=0.0, loss=0.0, community_string=None):
+        self.values = dict(values or {})
+        self.latency = latency
+        self.loss = loss
+        self.community_string = community_string
+        self.online = True
+        self.timeouts = 0
+        self.error_status = None
+        self.error = None
+
+    def value(self, oid):
+        value = self.values.get(oid, NO_SUCH_OBJECT)
+        return value() if callable(value) else value
+
+    def next_values(self, oid, count):
+        """Return up to count (oid, value) pairs following oid, padded with END_OF_MIB."""
+        oids = sorted(self.values, key=oid_key)
+        after = [candidate for candidate in oids if oid_key(candidate) > oid_key(oid)][:count]
+        pairs = [(candidate, self.value(candidate)) for candidate in after]
+        last = after[-1] if after else oid
+        return pairs + [(last, END_OF_MIB)] * (count - len(pairs))
+
+
+class FakeTransport:
+    """
+    In-memory SNMP transport: printers are FakeAgents registered by address
+    with add_printer, and requests to any other address time out. Nothing is
+    sent over the network and no pysnmp code runs, so a sweep of thousands
+    of printers takes milliseconds. Timed out attempts return at once unless
+    wait_on_timeout is set, in which case they take their timeout as on a
+    real network. Packet loss is drawn from a Random seeded with seed, so
+    runs are repeatable. Every request is logged in `requests` as
+    (kind, ip_address, port, oids, timeout), and `peak_in_flight` is the most
+    requests that were awaiting their answer at once. SNMPv3 credentials are
+    accepted as given.
+
+    It has the interface of printer.PysnmpTransport; see printer.TRANSPORT.
+    """
+
+    def __init__(self, seed=0, wait_on_timeout=False):
+        self.agents = {}
+        self.requests = []
+        self.random = random.Random(seed)
+        self.wait_on_timeout = wait_on_timeout
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def add_printer(self, ip_address, values=None, port=161, latency=0.0, loss=0.0, community_string=None):
+        """Register the agent of the printer at ip_address:port and return it."""
+        agent = self.agents[(ip_address, port)] = FakeAgent(values, latency, loss, community_string)
+        return agent
+
+    def requests_to(self, ip_address, port=161):
+        """Return the requests sent to the printer at ip_address:port."""
+        return [request for request in self.requests if request[1:3] == (ip_address, port)]
+
+    async def _answer(self, kind, ip_address, port, oids, community_string, timeout, retries, answer):
+        self.requests.append((kind, ip_address, port, tuple(oids), timeout))
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self._attempts(ip_address, port, oids, community_string, timeout, retries, answer)
+        finally:
+            self.in_flight -= 1
+
+    async def _attempts(self, ip_address, port, oids, community_string, timeout, retries, answer):
+        agent = self.agents.get((ip_address, port))
+        for _ in range(retries + 1):
+            if agent is not None and agent.error is not None:
+                raise agent.error
+            answered = (agent is not None and agent.online
+                        and agent.community_string in (None, community_string)
+                        and self.random.random() >= agent.loss)
+            if answered and agent.timeouts > 0:
+                agent.timeouts -= 1
+                answered = False
+            if answered:
+                if agent.latency:
+                    await asyncio.sleep(agent.latency)
+                if agent.error_status:
+                    return None, agent.error_status, 1, [(oid, NO_SUCH_OBJECT) for oid in oids]
+                return None, None, 0, answer(agent)
+            if self.wait_on_timeout:
+                await asyncio.sleep(timeout)
+        return TIMEOUT, None, 0, []
+
+    async def get(self, ip_address, port, oids, timeout, retries=0, community_string='public', snmpv3=None):
+        return await self._answer('get', ip_address, port, oids, community_string, timeout, retries,
+                                  lambda agent: [(oid, agent.value(oid)) for oid in oids])
+
+    async def bulk(self, ip_address, port, oids, max_repetitions, timeout, retries=0,
+                   community_string='public', snmpv3=None):
+        def answer(agent):
+            columns = [agent.next_values(oid, max_repetitions) for oid in oids]
+            return [list(row) for row in zip(*columns)]
+        return await self._answer('bulk', ip_address, port, oids, community_string, timeout, retries, answer)
+
+    def close(self):
+        pass
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from storage import write_batches
+
+logger = logging.getLogger('report_logger')
+
+
+class QueuedStorage:
+    """
+    Storage of one printer whose page count writes go through a BatchWriter.
+    write() and write_metrics() only queue the row or values; latest() and
+    has_date() also look at the rows still queued, so a poll sees the result
+    of the previous one before it reaches the disk. Other methods are those
+    of the wrapped storage.
+    """
+
+    def __init__(self, storage, writer):
+        self.storage = storage
+        self.writer = writer
+        self.pending = []
+
+    def write(self, date, total_page_count, net_increase):
+        row = (date, int(total_page_count), int(net_increase))
+        self.pending.append(row)
+        self.writer.enqueue(self, row)
+
+    def write_metrics(self, date, values):
+        self.writer.enqueue_metrics(self, date, dict(values))
+
+    def latest(self):
+        if self.pending:
+            date, total_page_count, _ = self.pending[-1]
+            return total_page_count, date
+        return self.storage.latest()
+
+    def has_date(self, date):
+        return any(row[0] == date for row in self.pending) or self.storage.has_date(date)
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+
+class BatchWriter:
+    """
+    Stores the page counts and Printer-MIB values of a sweep from a single
+    task. Rows are put on an asyncio queue; the task takes everything queued so far (up to max_batch
+    rows) and writes it with storage.write_batches on its own thread, so the
+    event loop keeps serving SNMP responses while the disk is busy, and a
+    batch costs one open and fsync per file however many printers it holds.
+
+        writer = BatchWriter()
+        writer.start()
+        storage = writer.wrap(storage)
+        ...
+        await writer.close()
+    """
+
+    def __init__(self, max_batch=1000):
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        # One thread, so SQLite's writer connection is only used from it
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='page-count-writer')
+        self.task = None
+
+    def start(self):
+        """Start the writer task on the running event loop."""
+        self.task = asyncio.ensure_future(self._run())
+
+    def wrap(self, storage):
+        """Return a QueuedStorage writing to storage through this writer."""
+        return QueuedStorage(storage, self)
+
+    def enqueue(self, queued_storage, row):
+        self.queue.put_nowait((queued_storage, row, None))
+
+    def enqueue_metrics(self, queued_storage, date, values):
+        self.queue.put_nowait((queued_storage, None, (date, values)))
+
+    async def flush(self):
+        """Wait until every queued row has been written."""
+        await self.queue.join()
+
+    async def close(self):
+        """Write the rows still queued, then stop the writer task and its thread."""
+        try:
+            await self.flush()
+        finally:
+            if self.task is not None:
+                self.task.cancel()
+                try:
+                    await self.task
+                except asyncio.CancelledError:
+                    pass
+            self.executor.shutdown(wait=True)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # Rows per storage, in the order they were queued
+            rows_by_storage = {}
+            metric_writes = []
+            for queued_storage, row, metric_values in batch:
+                if row is not None:
+                    rows_by_storage.setdefault(queued_storage, []).append(row)
+                else:
+                    metric_writes.append((queued_storage.storage, *metric_values))
+            try:
+                start = time.perf_counter()
+                failures = await loop.run_in_executor(
+                    self.executor, write_batches,
+                    [(queued_storage.storage, rows) for queued_storage, rows in rows_by_storage.items()],
+                    metric_writes)
+                metrics.STORAGE_COMMIT.observe(time.perf_counter() - start)
+                metrics.STORAGE_BATCH_ROWS.observe(len(batch))
+                for storage, error in failures:
+                    logger.error(f"Failed to write page counts to {storage}: {error}")
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} page count(s): {e}")
+            finally:
+                for queued_storage, rows in rows_by_storage.items():
+                    del queued_storage.pending[:len(rows)]
+                for _ in batch:
+                    self.queue.task_done()